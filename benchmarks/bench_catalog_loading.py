@@ -0,0 +1,48 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""Benchmark of the reading and parsing of the food files compiled in the food catalog, across numbers of
+worker processes.
+
+Each configuration reads and parses every food file, and its foods are checked to be identical,
+and in the same order, as the foods of the files read and parsed one by one.
+
+Usage: python benchmarks/bench_catalog_loading.py [--foods 20000] [--jobs 1 2 4] [--io-threads 8]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+from nutrimetrics.catalog import read_food_file, read_food_files
+from synthetic import write_food_files
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of parallel food files reading.')
+    parser.add_argument('--foods', type=int, default=20000, help='Food files to read')
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1, 2, 4], help='Numbers of worker processes')
+    parser.add_argument('--io-threads', type=int, default=8, help='Threads reading food files')
+    parser.add_argument('--commented', type=float, default=0.05, help='Share of food files with comments')
+    args = parser.parse_args()
+    print(f'{os.cpu_count()} CPUs')
+    with tempfile.TemporaryDirectory() as foods_dir:
+        write_food_files(foods_dir, args.foods, args.commented)
+        food_files = sorted(Path(foods_dir).glob('*.json'))
+        start = time.perf_counter()
+        expected = [read_food_file(food_file) for food_file in food_files]
+        baseline = time.perf_counter() - start
+        print(f'{args.foods:>7} foods serial: {baseline:7.3f}s')
+        for jobs in args.jobs:
+            start = time.perf_counter()
+            foods = read_food_files(food_files, jobs, args.io_threads)
+            elapsed = time.perf_counter() - start
+            assert all(food[:3] == other[:3] and np.array_equal(food[3], other[3])
+                       for food, other in zip(foods, expected, strict=True)), f'{jobs} jobs read different foods'
+            print(f'{args.foods:>7} foods {jobs:>2} jobs: {elapsed:7.3f}s ({baseline / elapsed:4.2f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""Benchmark of the FoodData Central food data transform on synthetic branded food payloads.
+
+Usage: python benchmarks/bench_import.py [--foods 20000] [--rows 120]
+"""
+
+import argparse
+import importlib.resources as rsc
+import time
+import nutrimetrics.config as config
+from nutrimetrics.food_data_central import FoodDataCentral
+from nutrimetrics.meals import Food
+from nutrimetrics.units import convert_amount
+from synthetic import make_payloads
+
+
+def linear_scan_transform(fdc, fdc_id, food_name, fdc_data):
+    """Reference transform scanning every nutrients_ids entry for each nutrient row."""
+    food = Food(food_name, fdc_data['description'], amount=100)
+    for food_nutrient in fdc_data["foodNutrients"]:
+        if "amount" in food_nutrient:
+            ntr_id = food_nutrient["nutrient"]["id"]
+            data_name = None
+            for nutrient_name, nutrient_ids in fdc.nutrients_ids.items():
+                if ntr_id in nutrient_ids:
+                    data_name = nutrient_name
+                    break
+            if data_name:
+                food.nutrients[data_name] = convert_amount(food_nutrient["amount"],
+                                                           food_nutrient["nutrient"]["unitName"])
+    return food
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the FoodData Central food data transform.')
+    parser.add_argument('--foods', type=int, default=20000, help='Number of synthetic foods')
+    parser.add_argument('--rows', type=int, default=120, help='Number of nutrient rows per food')
+    args = parser.parse_args()
+    cfg = config.read_json(rsc.files('nutrimetrics.resources').joinpath('config.json'))
+    nutrients_ids = cfg['food_data_central']['nutrients_ids']
+    payloads = make_payloads(nutrients_ids, args.foods, args.rows)
+    fdc = FoodDataCentral('', '', False, nutrients_ids, False)
+    for name, transform in [('linear scan', lambda *a: linear_scan_transform(fdc, *a)),
+                            ('reverse index', fdc.transform)]:
+        start = time.perf_counter()
+        for fdc_data in payloads:
+            transform(fdc_data['fdcId'], fdc_data['description'], fdc_data)
+        elapsed = time.perf_counter() - start
+        print(f'{name:>13}: {elapsed:.3f}s for {args.foods} foods x {args.rows} rows '
+              f'({args.foods / elapsed:,.0f} foods/s)')
+    print(f'{len(fdc.unmapped_nutrients)} unmapped nutrient IDs, '
+          f'{sum(fdc.unmapped_nutrients.values())} unmapped rows')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""Benchmark of the comment-aware JSON loader, on the bundled resources and on a synthetic catalog of food files.
+
+Food files are written as by the importer, without comments, and a share of them get a header
+comment, as the bundled foods adjusted by hand. The loader is compared to jsmin, the minifier it
+replaces, when it is installed.
+
+Usage: python benchmarks/bench_json_loader.py [--foods 100000] [--commented 0.05] [--repeat 3]
+"""
+
+import argparse
+import importlib.resources as rsc
+import json
+import tempfile
+import time
+from pathlib import Path
+import nutrimetrics.config as config
+from synthetic import write_food_files
+
+
+def get_loaders():
+    """Return loaders to compare, key: loader name, value: function decoding JSON text."""
+    loaders = {'loads': config.loads}
+    try:
+        from jsmin import jsmin
+        loaders['jsmin'] = lambda text: json.loads(jsmin(text))
+    except ImportError:
+        print('jsmin is not installed, only the loader is measured')
+    return loaders
+
+
+def iter_json_resources(directory):
+    """Yield JSON files of resources directory and of its subdirectories."""
+    for resource in sorted(directory.iterdir(), key=lambda resource: resource.name):
+        if resource.is_dir():
+            yield from iter_json_resources(resource)
+        elif resource.name.endswith('.json'):
+            yield resource
+
+
+def measure(name, texts, loaders, repeat):
+    """Print best decoding time of texts by each loader, and check that all loaders decode the same data."""
+    results = dict()
+    for loader_name, loader in loaders.items():
+        elapsed = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            data = [loader(text) for text in texts]
+            elapsed.append(time.perf_counter() - start)
+        results[loader_name] = min(elapsed), data
+    baseline = results['loads'][0]
+    for loader_name, (best, data) in results.items():
+        assert data == results['loads'][1], f'{loader_name} decoded different data'
+        print(f'{name}: {loader_name:>5} {best * 1e3:9.1f}ms ({best / baseline:5.1f}x), '
+              f'{best / len(texts) * 1e6:7.1f}us/file')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the comment-aware JSON loader.')
+    parser.add_argument('--foods', type=int, default=100000, help='Food files of the synthetic catalog')
+    parser.add_argument('--commented', type=float, default=0.05, help='Share of food files with comments')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each loader, the best is kept')
+    args = parser.parse_args()
+    loaders = get_loaders()
+    texts = [resource.read_text() for resource in iter_json_resources(rsc.files('nutrimetrics.resources'))]
+    measure(f'{len(texts)} bundled resources', texts, loaders, args.repeat)
+    with tempfile.TemporaryDirectory() as foods_dir:
+        write_food_files(foods_dir, args.foods, args.commented)
+        food_files = sorted(Path(foods_dir).glob('*.json'))
+        texts = [food_file.read_text() for food_file in food_files]
+        measure(f'{len(texts)} synthetic foods', texts, loaders, args.repeat)
+        # including file reads, as when compiling the catalog
+        start = time.perf_counter()
+        for food_file in food_files:
+            config.read_json(food_file)
+        elapsed = time.perf_counter() - start
+        print(f'{len(texts)} synthetic foods: read_json {elapsed:.2f}s, {elapsed / len(texts) * 1e6:.1f}us/file')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""Benchmark of the food name index on synthetic catalogs, queried with misspelled food names.
+
+Synthetic food variants only differ by their number, so most misspelled names are ambiguous and
+are not resolved: the count of wrongly resolved names matters more than the count of resolved ones.
+
+Usage: python benchmarks/bench_name_index.py [--foods 30000 300000] [--queries 200]
+"""
+
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+from nutrimetrics.name_index import NameIndex
+from synthetic import make_catalog
+
+
+def misspell(name, rng):
+    """Return name with a character deleted, swapped or substituted, in random case."""
+    i = rng.randrange(len(name) - 1)
+    edits = [name[:i] + name[i + 1:], name[:i] + name[i + 1] + name[i] + name[i + 2:], name[:i] + 'x' + name[i + 1:]]
+    return rng.choice(edits).lower()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the food name index.')
+    parser.add_argument('--foods', type=int, nargs='+', default=[30000, 300000], help='Catalog sizes')
+    parser.add_argument('--queries', type=int, default=200, help='Number of queries')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_foods in args.foods:
+            catalog = make_catalog(Path(tmp_dir, f'catalog_{n_foods}.bin'), n_foods)
+            start = time.perf_counter()
+            index = NameIndex.build(catalog.names, catalog.descriptions)
+            build = time.perf_counter() - start
+            index_file = Path(tmp_dir, f'names_{n_foods}.npz')
+            index.save(index_file, np.array([n_foods]))
+            start = time.perf_counter()
+            index = NameIndex.load(index_file, catalog.names, np.array([n_foods]))
+            load = time.perf_counter() - start
+            rng = random.Random(0)
+            names = rng.sample(catalog.names, min(args.queries, n_foods))
+            queries = [misspell(name, rng) for name in names]
+            start = time.perf_counter()
+            for query in queries:
+                index.search(query)
+            search = (time.perf_counter() - start) / len(queries)
+            start = time.perf_counter()
+            resolved = [index.resolve(query) for query in queries]
+            resolve = (time.perf_counter() - start) / len(queries)
+            correct = sum(1 for name, row in zip(names, resolved) if row is not None and catalog.names[row] == name)
+            wrong = sum(1 for name, row in zip(names, resolved) if row is not None and catalog.names[row] != name)
+            print(f'{n_foods:>7} foods: build {build:.2f}s, load {load:.2f}s, search {search * 1000:.2f} ms, '
+                  f'resolve {resolve * 1000:.2f} ms, {correct}/{len(queries)} resolved correctly, {wrong} wrongly')
+            catalog.close()
+
+
+if __name__ == '__main__':
+    main()
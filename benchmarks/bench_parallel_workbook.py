@@ -0,0 +1,53 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""Benchmark of workbook generation with worksheets recorded by worker processes, across catalog sizes.
+
+The catalog is compiled and memory-mapped, as when running the analyze command, so that worker
+processes open the catalog instead of receiving its foods.
+
+Usage: python benchmarks/bench_parallel_workbook.py [--foods 1000 10000 50000] [--jobs 1 2 4] [--repeat 3]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+from nutrimetrics.meals import FoodStore, MealPlan
+from nutrimetrics.workbook import WorkbookGenerator
+from synthetic import make_catalog, make_meal_plan, load_resource_dri_tables, read_resource
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of parallel workbook generation.')
+    parser.add_argument('--foods', type=int, nargs='+', default=[1000, 10000, 50000], help='Catalog sizes')
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1, 2, 4], help='Numbers of worksheet jobs')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each configuration, the best is kept')
+    parser.add_argument('--constant-memory', action='store_true', help='Write workbooks in constant memory mode')
+    args = parser.parse_args()
+    settings = read_resource('config.json')['workbook_settings']
+    settings['constant_memory'] = args.constant_memory
+    dri_tables = load_resource_dri_tables()
+    print(f'{os.cpu_count()} CPUs')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_foods in args.foods:
+            foods = FoodStore(make_catalog(Path(tmp_dir, f'catalog_{n_foods}.bin'), n_foods))
+            meal_plan = MealPlan(make_meal_plan(foods, 50), foods, dri_tables)
+            baseline = None
+            for jobs in args.jobs:
+                generator = WorkbookGenerator(dict(settings, worksheet_jobs=jobs))
+                out_file = Path(tmp_dir, f'workbook_{n_foods}_{jobs}.xlsx')
+                elapsed = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    generator.write(out_file, meal_plan, foods)
+                    elapsed.append(time.perf_counter() - start)
+                best = min(elapsed)
+                baseline = baseline if baseline else best
+                print(f'{n_foods:>7} foods {jobs:>2} jobs: {best:7.3f}s ({baseline / best:4.2f}x), '
+                      f'{os.path.getsize(out_file) / 1e6:6.2f}MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""Benchmark of the cold start of the commands, guarding their per-command imports.
+
+Each command runs in a new interpreter, in a temporary home directory initialized with the bundled
+resources, and the benchmark fails if a command imports a module it does not need, e.g. if
+analyzing a meal plan imports requests.
+
+Usage: python benchmarks/bench_startup.py [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# key: command function, value: (arguments, modules the command must not import)
+commands = {
+    'initialize': ([], ['numpy', 'requests', 'xlsxwriter', 'asyncio']),
+    'analyze_meal_plan': (['{samples}/eric_berg.json', '-o', '{out_dir}'], ['requests', 'asyncio']),
+    'import_food_data_central': (['{samples}/foods.json', '--offline'], ['xlsxwriter', 'asyncio']),
+}
+
+# runs command, then prints the imported modules it must not import, as JSON on the last line
+runner = '''
+import json
+import sys
+from nutrimetrics import cli
+sys.argv = {argv!r}
+cli.{command}()
+print(json.dumps([name for name in {forbidden!r} if name in sys.modules]))
+'''
+
+
+def run_command(command, argv, forbidden, env):
+    """Return elapsed seconds of command run in a new interpreter, and imported forbidden modules."""
+    code = runner.format(argv=[command] + argv, command=command, forbidden=forbidden)
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+    elapsed = time.perf_counter() - start
+    return elapsed, json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the cold start of the commands.')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs of each command, the best is kept')
+    args = parser.parse_args()
+    failed = False
+    with tempfile.TemporaryDirectory() as home_dir:
+        env = dict(os.environ, HOME=home_dir)
+        samples = os.path.join(home_dir, '.nutrimetrics', 'samples')
+        run_command('initialize', [], [], env)  # creates configuration and compiles catalog on first commands
+        for command, (argv, forbidden) in commands.items():
+            argv = [arg.format(samples=samples, out_dir=home_dir) for arg in argv]
+            runs = [run_command(command, argv, forbidden, env) for _ in range(args.repeat)]
+            best = min(elapsed for elapsed, _ in runs)
+            imported = runs[-1][1]
+            print(f'{command:>24}: {best * 1000:7.1f} ms' + (f', imports {", ".join(imported)}' if imported else ''))
+            failed |= bool(imported)
+    if failed:
+        sys.exit('FAILED: commands import modules they do not need')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""Benchmark of food substitution queries on synthetic catalogs.
+
+Usage: python benchmarks/bench_substitution.py [--foods 30000 300000] [--queries 256] [--groups minerals]
+"""
+
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+from nutrimetrics.nutrients import nutrient_groups
+from nutrimetrics.substitution import SubstitutionIndex
+from synthetic import make_catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of food substitution queries.')
+    parser.add_argument('--foods', type=int, nargs='+', default=[30000, 300000], help='Catalog sizes')
+    parser.add_argument('--queries', type=int, default=256, help='Number of queries')
+    parser.add_argument('-k', type=int, default=10, help='Number of substitutes per query')
+    parser.add_argument('--groups', type=str, nargs='+', choices=list(nutrient_groups), help='Nutrient groups')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_foods in args.foods:
+            catalog = make_catalog(Path(tmp_dir, f'catalog_{n_foods}.bin'), n_foods)
+            names = random.Random(0).sample(catalog.names, min(args.queries, n_foods))
+            for basis in ['energy', 'mass']:
+                start = time.perf_counter()
+                index = SubstitutionIndex(catalog, basis, args.groups)
+                build = time.perf_counter() - start
+                start = time.perf_counter()
+                for name in names[:32]:
+                    index.query(name, args.k)
+                single = (time.perf_counter() - start) / len(names[:32])
+                start = time.perf_counter()
+                index.query_many(names, args.k)
+                batched = (time.perf_counter() - start) / len(names)
+                line = (f'{n_foods:>7} foods {basis:>6} basis {index.features.shape[1]:>3} nutrients: '
+                        f'build {build:.2f}s, single query {single * 1000:.2f} ms, '
+                        f'batched query {batched * 1000:.3f} ms/query')
+                if index.centroids is not None:
+                    # recall of clustered queries, compared to brute-force queries
+                    exact = SubstitutionIndex(catalog, basis, args.groups, n_lists=0)
+                    start = time.perf_counter()
+                    expected = exact.query_many(names, args.k)
+                    exact_time = (time.perf_counter() - start) / len(names)
+                    found = index.query_many(names, args.k)
+                    hits = sum(len({n for n, _ in e} & {n for n, _ in f}) for e, f in zip(expected, found))
+                    recall = hits / max(1, sum(len(e) for e in expected))
+                    line += f', recall@{args.k} {recall:.3f} (brute force {exact_time * 1000:.3f} ms/query)'
+                print(line)
+            catalog.close()
+
+
+if __name__ == '__main__':
+    main()
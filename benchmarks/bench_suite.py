@@ -0,0 +1,252 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""Benchmark suite of the catalog load, meal plan evaluation, import and report writing, with JSON baselines.
+
+Each case runs on synthetic data in a temporary home directory: food catalogs of each size, meal plans
+of each number of entries picked among the catalog foods, batches of meal plans, and canned FoodData
+Central payloads. The best time of the runs of each case is kept, and the peak of the memory allocated
+by the case, as traced by tracemalloc in a separate run, so that tracing does not slow down the timed
+runs. Only the memory of the parent process is traced, not the one of the batch worker processes.
+
+Results are saved as a JSON baseline, and compared to a previous baseline: a case slower, or
+allocating more memory, than the baseline by more than the threshold is a regression, and the
+comparison then exits with an error. Baselines are only comparable on the same host.
+
+Cases:
+- load_foods/compile/{foods}: load_foods() compiling the catalog of the food files
+- load_foods/open/{foods}: load_foods() opening the up-to-date compiled catalog
+- meal_plan/{foods}/{entries}: MealPlan construction, the foods being built from the catalog
+- batch/{foods}/{plans}: analyze_batch() writing CSV tables, across worker processes
+- import/{payloads}: FoodDataCentral.write_food_file() of canned payloads
+- workbook/{foods}/{all|referenced}: WorkbookGenerator.generate() of a 50 entries meal plan, the
+  Foods worksheet listing all foods (up to 10,000 foods) or the referenced foods only
+
+Usage: python benchmarks/bench_suite.py [--sizes 1000 10000 100000] [--entries 10 50 100 500] [--plans 100]
+                                        [--payloads 1000] [--repeat 3] [--cases PATTERN ...] [--no-memory]
+                                        [--save baseline.json] [--compare baseline.json] [--threshold 0.25]
+"""
+
+import argparse
+import contextlib
+import fnmatch
+import importlib.resources as rsc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+import numpy as np
+import xlsxwriter
+import nutrimetrics.config as config
+from nutrimetrics.__about__ import __version__
+from nutrimetrics.batch import analyze_batch
+from nutrimetrics.food_data_central import FoodDataCentral
+from nutrimetrics.meals import FoodStore, MealPlan, load_foods
+from nutrimetrics.workbook import WorkbookGenerator
+from synthetic import load_resource_dri_tables, make_meal_plan, make_payloads, read_resource, write_food_files
+
+all_foods_limit = 10000  # larger Foods worksheets take minutes to write
+min_seconds = 0.5  # total time of the runs of fast cases
+max_runs = 1000
+
+
+class Case:
+    """Benchmark case: setup() returns the state of a run, untimed, and run(state) is timed."""
+    def __init__(self, name, run, setup=None):
+        self.name = name
+        self.run = run
+        self.setup = setup if setup else lambda: None
+
+
+def measure(case, repeat, trace_memory):
+    """Return best and median seconds of case runs, and peak bytes allocated by an additional traced run.
+
+    Fast cases are run more than repeat times, until their runs add up to min_seconds, so that their
+    best time is not left to the noise of a few runs.
+    """
+    times = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        while len(times) < repeat or (sum(times) < min_seconds and len(times) < max_runs):
+            state = case.setup()
+            start = time.perf_counter()
+            case.run(state)
+            times.append(time.perf_counter() - start)
+        result = {'seconds': min(times), 'median_seconds': sorted(times)[len(times) // 2], 'runs': len(times)}
+        if trace_memory:
+            state = case.setup()
+            tracemalloc.start()
+            case.run(state)
+            result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return result
+
+
+def use_catalog(home_dir, n_foods):
+    """Point the configuration to the food files and compiled catalog of n_foods foods."""
+    config.foods_dir = Path(home_dir, f'foods_{n_foods}')
+    config.catalog_file = Path(home_dir, f'catalog_{n_foods}.bin')
+
+
+def remove_catalog():
+    config.catalog_file.unlink(missing_ok=True)
+
+
+def write_meal_plans(plans_dir, foods, n_plans, n_entries):
+    plans_dir.mkdir()
+    for i in range(n_plans):
+        Path(plans_dir, f'plan_{i}.json').write_text(json.dumps(make_meal_plan(foods, n_entries, seed=i)))
+    return sorted(plans_dir.glob('*.json'))
+
+
+def make_catalog_cases(home_dir, n_foods, args, settings, dri_tables):
+    """Yield cases of the catalog of n_foods foods, written once as food files."""
+    use_catalog(home_dir, n_foods)
+    config.foods_dir.mkdir()
+    write_food_files(config.foods_dir, n_foods, commented=0.05)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        foods = load_foods()  # compiles the catalog used by the next cases
+    yield Case(f'load_foods/compile/{n_foods}', lambda _: load_foods(), setup=remove_catalog)
+    yield Case(f'load_foods/open/{n_foods}', lambda _: load_foods())
+    for n_entries in args.entries:
+        data = make_meal_plan(foods, n_entries)
+        # a new store per run, so that each run builds its foods from the catalog
+        yield Case(f'meal_plan/{n_foods}/{n_entries}', lambda store, data=data: MealPlan(data, store, dri_tables),
+                   setup=lambda: FoodStore(foods.catalog))
+    json_files = write_meal_plans(Path(home_dir, f'plans_{n_foods}'), foods, args.plans, 50)
+    out_dir = Path(home_dir, f'batch_{n_foods}')
+    out_dir.mkdir()
+
+    def new_batch():
+        for out_file in out_dir.iterdir():
+            out_file.unlink()  # tables are appended to existing files
+    yield Case(f'batch/{n_foods}/{args.plans}',
+               lambda _: analyze_batch(json_files, settings, out_dir, args.jobs, report_format='csv'),
+               setup=new_batch)
+    meal_plan = MealPlan(make_meal_plan(foods, 50), foods, dri_tables)
+    out_file = Path(home_dir, f'report_{n_foods}.xlsx')
+    for foods_worksheet in ['all', 'referenced']:
+        if foods_worksheet == 'all' and n_foods > all_foods_limit:
+            continue
+        generator = WorkbookGenerator(dict(settings, foods_worksheet=foods_worksheet))
+        yield Case(f'workbook/{n_foods}/{foods_worksheet}',
+                   lambda _, generator=generator: generator.generate(out_file, meal_plan, foods))
+
+
+def make_import_case(home_dir, n_payloads):
+    cfg = read_resource('config.json')
+    nutrients_ids = cfg['food_data_central']['nutrients_ids']
+    payloads = make_payloads(nutrients_ids, n_payloads, 120)
+    fdc = FoodDataCentral('', '', False, nutrients_ids, True)
+    imported_dir = Path(home_dir, 'imported')
+    imported_dir.mkdir()
+
+    def import_payloads(_):
+        config.foods_dir = imported_dir
+        for fdc_data in payloads:
+            food_name = fdc_data['description']
+            fdc.write_food_file(fdc_data['fdcId'], food_name, fdc.get_food_file(food_name, fdc_data['fdcId']), fdc_data)
+    return Case(f'import/{n_payloads}', import_payloads)
+
+
+def get_meta(args):
+    """Return description of the host and software the benchmarks ran on."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': time.time(),
+        'commit': commit,
+        'nutrimetrics': __version__,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'xlsxwriter': xlsxwriter.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repeat': args.repeat,
+        'min_seconds': min_seconds,
+    }
+
+
+def format_bytes(n_bytes):
+    return f'{n_bytes / 2 ** 20:9.1f} MB' if n_bytes is not None else ' ' * 12
+
+
+def compare(results, baseline, threshold):
+    """Print ratio of each case to baseline, and return names of regressed cases."""
+    regressions = []
+    print(f'Compared to baseline of commit {baseline["meta"].get("commit")} '
+          f'({time.strftime("%Y-%m-%d %H:%M", time.localtime(baseline["meta"]["timestamp"]))}), '
+          f'threshold {threshold:.0%}:')
+    for name, result in results.items():
+        base = baseline['cases'].get(name)
+        if not base:
+            print(f'  {name:<32} new case')
+            continue
+        ratios = [('time', result['seconds'] / base['seconds'])]
+        if result.get('peak_bytes') and base.get('peak_bytes'):
+            ratios.append(('memory', result['peak_bytes'] / base['peak_bytes']))
+        regressed = [kind for kind, ratio in ratios if ratio > 1 + threshold]
+        print(f'  {name:<32} ' + ', '.join(f'{kind} {ratio:5.2f}x' for kind, ratio in ratios)
+              + (f'  REGRESSION ({", ".join(regressed)})' if regressed else ''))
+        if regressed:
+            regressions.append(name)
+    for name in baseline['cases']:
+        if name not in results:
+            print(f'  {name:<32} not run')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark suite with JSON baselines.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Foods of the catalogs')
+    parser.add_argument('--entries', type=int, nargs='+', default=[10, 50, 100, 500],
+                        help='Entries of the meal plans')
+    parser.add_argument('--plans', type=int, default=100, help='Meal plans of the batches')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Worker processes of the batches, one per CPU by default')
+    parser.add_argument('--payloads', type=int, default=1000, help='FoodData Central payloads to import')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each case, the best is kept')
+    parser.add_argument('--cases', nargs='+', default=['*'], help='Glob patterns of the cases to run')
+    parser.add_argument('--no-memory', action='store_true', help='Do not trace the memory allocated by the cases')
+    parser.add_argument('--save', help='JSON file to save the results to, as a baseline')
+    parser.add_argument('--compare', help='JSON baseline to compare the results to')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Slowdown or memory increase of a regression')
+    args = parser.parse_args()
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    settings = read_resource('config.json')['workbook_settings']
+    dri_tables = load_resource_dri_tables()
+    results = dict()
+    with tempfile.TemporaryDirectory() as home_dir:
+        config.config_dir = Path(home_dir)
+        config.dri_dir = Path(rsc.files('nutrimetrics.resources').joinpath('dri'))
+        config.database_file = Path(home_dir, 'foods.db')  # never created: foods are stored as JSON files
+        config.cache_dir = Path(home_dir, 'cache')
+
+        def iter_cases():
+            for n_foods in args.sizes:
+                yield from make_catalog_cases(home_dir, n_foods, args, settings, dri_tables)
+            yield make_import_case(home_dir, args.payloads)
+        for case in iter_cases():
+            if not any(fnmatch.fnmatch(case.name, pattern) for pattern in args.cases):
+                continue
+            result = measure(case, args.repeat, not args.no_memory)
+            results[case.name] = result
+            print(f'{case.name:<32} {result["seconds"] * 1000:10.1f} ms {format_bytes(result.get("peak_bytes"))}')
+    if args.save:
+        Path(args.save).write_text(json.dumps({'meta': get_meta(args), 'cases': results}, indent=2))
+        print(f'Results saved in {Path(args.save).absolute()}')
+    if baseline:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            sys.exit(f'FAILED: {len(regressions)} cases regressed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""Benchmark of workbook generation with and without the format registry, on large Foods sheets.
+
+Usage: python benchmarks/bench_workbook.py [--foods 1000 5000] [--memory]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from nutrimetrics.meals import MealPlan
+from nutrimetrics.workbook import WorkbookGenerator
+from synthetic import make_foods, make_meal_plan, load_resource_dri_tables, read_resource
+
+
+class UncachedWorkbookGenerator(WorkbookGenerator):
+    """Reference generator adding a new format for every cell, as before the format registry."""
+    def get_format(self, *args, **kwargs):
+        fmt = super().get_format(*args, **kwargs)
+        self.formats.clear()
+        return fmt
+
+    def write_values(self, worksheet, row_i, foods, comment=False, force_bold=False, force_bg_color=None):
+        comments_options = {
+            'font_name': self.settings['font_name'],
+            'font_size': self.settings['font_size'],
+            'width': 250,
+        }
+        column_i = 0
+        for food in foods:
+            row_i += 1
+            column_i = 0
+            fmt = self.get_format(
+                font_color=self.settings['colors']['food'][0],
+                bg_color=(force_bg_color if force_bg_color else None),
+                bold=force_bold,
+                align='left')
+            worksheet.write(row_i, column_i, food.name, fmt)
+            if comment:
+                worksheet.write_comment(row_i, column_i, food.description, comments_options)
+            column_i += 1
+            fmt = self.get_format(
+                font_color=self.settings['colors']['amount'][0],
+                bg_color=(force_bg_color if force_bg_color else None),
+                bold=False,
+                align='right')
+            worksheet.write(row_i, column_i, food.amount, fmt)
+            for nutrient in self.displayed_nutrients:
+                column_i += 1
+                font_color, bg_color = self.get_colors(nutrient.data_name)
+                fmt = self.get_format(
+                    font_color=font_color,
+                    bg_color=(force_bg_color if force_bg_color else None),
+                    bold=False,
+                    align='right')
+                value = self.convert(nutrient, food.nutrients[nutrient.data_name])
+                worksheet.write(row_i, column_i, value, fmt)
+        return row_i, column_i
+
+
+def run(generator_class, settings, meal_plan, foods, out_file, memory):
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    generator = generator_class(settings)
+    generator.generate(out_file, meal_plan, foods)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if memory else None
+    if memory:
+        tracemalloc.stop()
+    return elapsed, os.path.getsize(out_file), len(generator.workbook.formats), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of workbook generation.')
+    parser.add_argument('--foods', type=int, nargs='+', default=[1000, 5000], help='Catalog sizes')
+    parser.add_argument('--memory', action='store_true', help='Trace peak Python memory (slower)')
+    args = parser.parse_args()
+    settings = read_resource('config.json')['workbook_settings']
+    dri_tables = load_resource_dri_tables()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_foods in args.foods:
+            foods = make_foods(n_foods)
+            meal_plan = MealPlan(make_meal_plan(foods, 50), foods, dri_tables)
+            for name, generator_class in [('uncached', UncachedWorkbookGenerator), ('registry', WorkbookGenerator)]:
+                out_file = Path(tmp_dir, f'{name}_{n_foods}.xlsx')
+                elapsed, size, n_formats, peak = run(generator_class, settings, meal_plan, foods, out_file,
+                                                     args.memory)
+                line = f'{n_foods:>7} foods {name:>9}: {elapsed:7.3f}s, {size / 1e6:6.2f}MB, {n_formats:>9,} formats'
+                line += f', peak {peak / 1e6:8.1f}MB' if peak is not None else ''
+                print(line)
+
+
+if __name__ == '__main__':
+    main()
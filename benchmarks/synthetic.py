@@ -0,0 +1,134 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""Synthetic foods and meal plans used by benchmarks, derived from the bundled resources."""
+
+import importlib.resources as rsc
+import random
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+import nutrimetrics.config as config
+from nutrimetrics.catalog import FoodCatalog, write_catalog
+from nutrimetrics.meals import Food
+
+
+def read_resource(*names):
+    return config.read_json(rsc.files('nutrimetrics.resources').joinpath(*names))
+
+
+def load_resource_foods():
+    """Return bundled foods, sorted by name."""
+    foods = dict()
+    for food_file in rsc.files('nutrimetrics.resources').joinpath('foods').iterdir():
+        if food_file.name.endswith('.json'):
+            food = Food.from_json(food_file)
+            foods[food.name] = food
+    return OrderedDict(sorted(foods.items()))
+
+
+def load_resource_dri_tables():
+    dri_tables = dict()
+    for dri_file in rsc.files('nutrimetrics.resources').joinpath('dri').iterdir():
+        if dri_file.name.endswith('.json'):
+            dri_tables[dri_file.name[:-len('.json')]] = config.read_json(dri_file)['dietary_reference_intakes']
+    return dri_tables
+
+
+def make_foods(n_foods, seed=0):
+    """Return n_foods foods sorted by name: the bundled foods then randomly scaled variations of them."""
+    rng = random.Random(seed)
+    base_foods = list(load_resource_foods().values())
+    foods = {food.name: food for food in base_foods[:n_foods]}
+    i = 0
+    while len(foods) < n_foods:
+        base = base_foods[i % len(base_foods)]
+        values = base.values * [rng.uniform(0.5, 1.5) for _ in range(len(base.values))]
+        food = Food(f'{base.name} Variant {i}', f'{base.description}, variant {i}', base.amount, values=values)
+        foods[food.name] = food
+        i += 1
+    return OrderedDict(sorted(foods.items()))
+
+
+header_comment = '''// Originally downloaded from FoodData Central:
+// https://fdc.nal.usda.gov/fdc-app.html#/food-details/173414/nutrients
+// Adjust molybdenum amount according to source above
+'''
+
+
+def write_food_files(foods_dir, n_foods, commented=0, seed=0):
+    """Write n_foods food files named as make_foods(), as written by the importer, without comments,
+    but one in every 1 / commented files having a header comment, as the bundled foods adjusted by hand."""
+    step = round(1 / commented) if commented else 0
+    for i, food in enumerate(make_foods(n_foods, seed).values()):
+        text = food.to_json(indent=2)
+        if step and i % step == 0:
+            text = header_comment + text
+        Path(foods_dir, f'food_{i}.json').write_text(text)
+
+
+def make_catalog(catalog_file, n_foods, seed=0):
+    """Write and open a compiled catalog of n_foods foods named as make_foods(), for catalogs too large
+    to be built food by food."""
+    rng = np.random.default_rng(seed)
+    base_foods = list(load_resource_foods().values())
+    n_base = min(n_foods, len(base_foods))
+    profiles = np.array([food.values for food in base_foods])
+    picks = np.concatenate([np.arange(n_base), np.arange(n_foods - n_base) % len(base_foods)])
+    scales = rng.uniform(0.5, 1.5, size=(n_foods, profiles.shape[1]))
+    scales[:n_base] = 1
+    matrix = profiles[picks] * scales
+    foods = []
+    for i, pick in enumerate(picks):
+        base = base_foods[pick]
+        if i < n_base:
+            name, description = base.name, base.description
+        else:
+            name, description = f'{base.name} Variant {i - n_base}', f'{base.description}, variant {i - n_base}'
+        foods.append((name, description, base.amount, matrix[i], f'food_{i}.json'))
+    write_catalog(catalog_file, foods, sources=[])
+    return FoodCatalog(catalog_file)
+
+
+def make_meal_plan(foods, n_entries, n_meals=None, seed=0):
+    """Return meal plan JSON data of n_entries foods picked among given foods, spread over meals."""
+    rng = random.Random(seed)
+    n_meals = n_meals if n_meals else max(1, min(6, n_entries // 5))
+    names = list(foods)
+    meals = [{'name': f'Meal {i + 1}', 'foods': []} for i in range(n_meals)]
+    for i in range(n_entries):
+        meals[i % n_meals]['foods'].append({'food': rng.choice(names), 'amount': rng.randint(5, 300)})
+    return {
+        'name': f'Synthetic {n_entries}',
+        'unit': 'g',
+        'target': {
+            'body_mass': 75000,
+            'body_fat_percent': 15,
+            'activity_factor': 1.4,
+            'minimum_protein_factor': 1.8,
+            'minimum_fat_factor': 0.8,
+        },
+        'dietary_reference_intakes': 'rda-male',
+        'meals': meals,
+    }
+
+
+def make_payloads(nutrients_ids, n_foods, n_rows, seed=0):
+    """Return synthetic FoodData Central food data, mixing mapped and unmapped nutrient IDs."""
+    rng = random.Random(seed)
+    mapped_ids = [ntr_id for ntr_ids in nutrients_ids.values() for ntr_id in ntr_ids]
+    unmapped_ids = list(range(2100, 2100 + n_rows))
+    payloads = []
+    for fdc_id in range(n_foods):
+        ntr_ids = rng.sample(mapped_ids, min(len(mapped_ids), n_rows // 2))
+        ntr_ids += rng.sample(unmapped_ids, n_rows - len(ntr_ids))
+        payloads.append({
+            'fdcId': fdc_id,
+            'description': f'Branded food {fdc_id}',
+            'foodNutrients': [
+                {'nutrient': {'id': ntr_id, 'name': f'Nutrient {ntr_id}', 'unitName': 'mg'},
+                 'amount': rng.random() * 100}
+                for ntr_id in ntr_ids
+            ],
+        })
+    return payloads
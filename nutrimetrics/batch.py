@@ -0,0 +1,159 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""Batch analysis of meal plans across worker processes."""
+
+import glob
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import nutrimetrics.config as config
+import nutrimetrics.metrics as metrics
+from nutrimetrics.catalog import FoodCatalog, load_catalog
+from nutrimetrics.meals import FoodStore, MealPlan, load_dri_tables
+from nutrimetrics.programs import Program, is_program
+from nutrimetrics.reports import get_report_tables, get_program_tables, report_writers
+from nutrimetrics.reports import get_catalog_workbook, ship_catalog_workbook
+
+
+# worker process state, set once per worker by init_worker()
+worker_foods = None
+worker_dri_tables = None
+worker_writer = None
+
+report_file_name = 'batch_report.json'
+
+
+def find_meal_plans(pattern):
+    """Return sorted meal plan files of a directory or matching a glob pattern.
+
+    Batch reports are skipped, so that the output directory of a previous batch can be analyzed again.
+    """
+    path = Path(pattern)
+    if path.is_dir():
+        files = path.glob('*.json')
+    else:
+        files = (Path(file) for file in glob.glob(pattern, recursive=True) if file.endswith('.json'))
+    return sorted(file for file in files if file.name != report_file_name)
+
+
+def get_plan_ids(json_files):
+    """Return identifiers of meal plan files, key: file, value: plan_id naming its report and table rows.
+
+    The plan_id of a file is its path relative to the common directory of all files, without extension
+    and with directories separated by '-', so that meal plans of the same name in different directories,
+    e.g. found by a recursive glob pattern, get their own report. Raise ValueError if plan_ids still collide.
+    """
+    root = Path(os.path.commonpath([Path(json_file).absolute().parent for json_file in json_files]))
+    plan_ids = dict()
+    files_of_id = dict()  # key: plan_id, value: files
+    for json_file in json_files:
+        relative = Path(json_file).absolute().relative_to(root)
+        plan_id = '-'.join(relative.with_suffix('').parts)
+        plan_ids[json_file] = plan_id
+        files_of_id.setdefault(plan_id, []).append(str(json_file))
+    duplicates = [f"'{plan_id}' ({', '.join(files)})" for plan_id, files in files_of_id.items() if len(files) > 1]
+    if duplicates:
+        raise ValueError(f"meal plans with the same plan_id would overwrite each other's report: "
+                         f"{', '.join(duplicates)}")
+    return plan_ids
+
+
+def init_worker(catalog_file, dri_tables, settings, report_format, enable_metrics=False):
+    """Open read-only shared data in worker process."""
+    global worker_foods, worker_dri_tables, worker_writer
+    metrics.collect(reset=True)  # forked workers start with the metrics of the parent process
+    metrics.enable(enable_metrics)
+    # the catalog is memory-mapped: its pages are shared by all workers
+    worker_foods = FoodStore(FoodCatalog(catalog_file))
+    worker_dri_tables = dri_tables
+    worker_writer = report_writers[report_format](dict(settings, worksheet_jobs=1))  # meal plans run in parallel
+
+
+def analyze_plan(json_file, plan_id, out_dir):
+    """Analyze a meal plan or multi-day program in worker process and return its report entry.
+
+    When the report writer appends all meal plans to the same files, the analysis tables are
+    returned in the entry, to be written by the parent process only.
+    """
+    start = time.perf_counter()
+    entry = {'meal_plan': str(json_file), 'plan_id': plan_id, 'report': None, 'status': 'ok', 'error': None}
+    try:
+        json_data = config.read_json(json_file)
+        if not json_data:
+            raise ValueError(f"JSON file '{json_file}' badly formatted")
+        if is_program(json_data):
+            program = Program(json_data, worker_foods, worker_dri_tables)
+            if worker_writer.shared_output:
+                entry['tables'] = get_program_tables(plan_id, program)
+            else:
+                entry['report'] = str(worker_writer.write_program(out_dir, plan_id, program))
+        else:
+            meal_plan = MealPlan(json_data, worker_foods, worker_dri_tables)
+            if worker_writer.shared_output:
+                entry['tables'] = get_report_tables(plan_id, meal_plan)
+            else:
+                entry['report'] = str(worker_writer.write(out_dir, plan_id, meal_plan, worker_foods))
+    except Exception as e:
+        entry['status'] = 'error'
+        entry['error'] = f'{type(e).__name__}: {e}'
+        entry['traceback'] = traceback.format_exc()
+    entry['seconds'] = time.perf_counter() - start
+    if metrics.enabled:
+        entry['metrics'] = metrics.collect(reset=True)  # merged by the parent process
+    return entry
+
+
+def analyze_batch(json_files, settings, out_dir, jobs=None, report_format='xlsx'):
+    """Analyze meal plans in parallel and return the per meal plan report.
+
+    Raise ValueError if meal plans would overwrite each other's report.
+    """
+    start = time.perf_counter()
+    plan_ids = get_plan_ids(json_files)
+    jobs = jobs if jobs else os.cpu_count()
+    writer = report_writers[report_format](settings)
+    # load shared data once: workers only open the up-to-date catalog file
+    catalog = load_catalog()
+    if report_format == 'xlsx' and settings.get('foods_worksheet', 'all') == 'referenced':
+        # workbook of all foods is generated once, before workers link it to their reports
+        ship_catalog_workbook(get_catalog_workbook(FoodStore(catalog), settings), out_dir)
+    catalog.close()
+    dri_tables = load_dri_tables()
+    report = []
+    initargs = (config.catalog_file, dri_tables, settings, report_format, metrics.enabled)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=initargs) as executor:
+        futures = [executor.submit(analyze_plan, json_file, plan_ids[json_file], out_dir) for json_file in json_files]
+        for future in as_completed(futures):
+            entry = future.result()
+            if 'metrics' in entry:
+                metrics.merge(entry.pop('metrics'))
+                metrics.count('meal_plans_analyzed' if entry['status'] == 'ok' else 'meal_plans_failed')
+            if 'tables' in entry:
+                # single writer of shared output files
+                entry['report'] = str(writer.write_tables(out_dir, entry['plan_id'], entry.pop('tables')))
+            if entry['status'] != 'ok':
+                print(f"ERROR: meal plan '{entry['meal_plan']}' failed: {entry['error']}")
+            report.append(entry)
+    report.sort(key=lambda e: e['meal_plan'])
+    elapsed = time.perf_counter() - start
+    n_failed = sum(1 for entry in report if entry['status'] != 'ok')
+    summary = {
+        'meal_plans': len(report),
+        'succeeded': len(report) - n_failed,
+        'failed': n_failed,
+        'jobs': jobs,
+        'seconds': elapsed,
+        'meal_plans_per_second': len(report) / elapsed if elapsed > 0 else 0,
+    }
+    report_file = Path(out_dir, report_file_name)
+    with open(report_file, 'w') as file:
+        file.write(json.dumps({'summary': summary, 'meal_plans': report}, indent=2))
+    print(f"Batch analyzed {summary['meal_plans']} meal plans in {elapsed:.2f}s "
+          f"({summary['meal_plans_per_second']:.1f} plans/s, {jobs} jobs): "
+          f"{summary['succeeded']} succeeded, {summary['failed']} failed")
+    print(f'Batch report created in {report_file.absolute()}')
+    return summary, report
@@ -0,0 +1,242 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""Compiled food catalog.
+
+The catalog is a single binary file compiled from the food files of the foods directory.
+It stores a dense matrix of foods x nutrients amounts along with a name index, so foods can
+be loaded without parsing every food file. The catalog is memory-mapped when opened and it
+is rebuilt whenever a food file is added, removed or modified, or, when foods are stored in
+the food database, whenever the database is written.
+
+File layout (little-endian):
+    header: magic, version, number of foods, number of nutrients, index offset, index size
+    matrix: number of foods x number of nutrients float64 amounts, row-major
+    amounts: number of foods float64 reference amounts
+    index: UTF-8 JSON with nutrients, names, descriptions and source files
+"""
+
+import json
+import mmap
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+import os
+import struct
+from pathlib import Path
+import nutrimetrics.config as config
+import nutrimetrics.metrics as metrics
+from nutrimetrics.database import open_database
+from nutrimetrics.nutrients import nutrients_list
+
+
+catalog_magic = b'NMCATLG\0'
+catalog_version = 1
+header_struct = struct.Struct('<8sIIIQQ')
+parallel_size = 2000  # minimum number of food files to parse for them to be read and parsed concurrently
+
+
+class FoodCatalog:
+    """Memory-mapped compiled food catalog."""
+    def __init__(self, catalog_file):
+        self.catalog_file = catalog_file
+        with open(catalog_file, 'rb') as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_foods, n_nutrients, index_offset, index_size = \
+            header_struct.unpack_from(self.buffer, 0)
+        if magic != catalog_magic or version != catalog_version:
+            raise ValueError(f"'{catalog_file}' is not a compatible food catalog")
+        self.n_foods = n_foods
+        self.n_nutrients = n_nutrients
+        index = json.loads(self.buffer[index_offset:index_offset + index_size].decode())
+        self.nutrients = index['nutrients']  # nutrient's data_name of each matrix column
+        self.names = index['names']  # sorted by name
+        self.descriptions = index['descriptions']
+        self.sources = index['sources']  # [file name, mtime_ns, size, row] of each food file
+        self.index = {name: row for row, name in enumerate(self.names)}
+        # zero-copy read-only views on the mapped matrix and amounts
+        self.matrix = np.frombuffer(self.buffer, dtype='<f8', count=n_foods * n_nutrients,
+                                    offset=header_struct.size).reshape(n_foods, n_nutrients)
+        self.amounts = np.frombuffer(self.buffer, dtype='<f8', count=n_foods,
+                                     offset=header_struct.size + 8 * n_foods * n_nutrients)
+
+    def __len__(self):
+        return self.n_foods
+
+    def __reduce__(self):
+        # pickled as its file, mapped again by the unpickling process
+        return FoodCatalog, (self.catalog_file,)
+
+    def is_up_to_date(self, sources):
+        return self.nutrients == [nutrient.data_name for nutrient in nutrients_list] \
+            and [source[:3] for source in self.sources] == sources
+
+    def close(self):
+        self.matrix = None
+        self.amounts = None
+        self.buffer.close()
+
+
+def scan_sources(foods_dir):
+    """Return sorted [file name, mtime_ns, size] list of food files without reading them."""
+    sources = []
+    with os.scandir(foods_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith('.json') and entry.is_file():
+                stat = entry.stat()
+                sources.append([entry.name, stat.st_mtime_ns, stat.st_size])
+    return sorted(sources)
+
+
+def read_food_file(food_file):
+    """Read food file and return (name, description, amount, nutrient amounts) or None."""
+    return get_food(config.read_json(food_file))
+
+
+def get_food(data):
+    """Return (name, description, amount, nutrient amounts) of food file data, or None."""
+    if not data:
+        return None
+    nutrients = data['nutrients']
+    row = np.array([nutrients.get(nutrient.data_name, 0) for nutrient in nutrients_list], dtype=float)
+    return data['name'], data['description'], float(data['amount']), row
+
+
+def read_text(food_file):
+    with open(food_file, 'r') as file:
+        return file.read()
+
+
+def parse_food_texts(food_files, texts):
+    """Return (name, description, amount, nutrient amounts) or None of each text of food files."""
+    return [get_food(config.parse_json(text, food_file)) for food_file, text in zip(food_files, texts)]
+
+
+def iter_texts(io_pool, chunks):
+    """Yield texts of each chunk of files, the files of the next chunk being read while a chunk is parsed."""
+    pending = deque()  # text futures of read chunks
+    for chunk in chunks:
+        pending.append([io_pool.submit(read_text, food_file) for food_file in chunk])
+        if len(pending) > 1:
+            yield [future.result() for future in pending.popleft()]
+    while pending:
+        yield [future.result() for future in pending.popleft()]
+
+
+def read_food_files(food_files, jobs=None, io_threads=8, chunk_size=500):
+    """Return (name, description, amount, nutrient amounts) or None of each food file, in order.
+
+    Many files are read concurrently by io_threads threads, hiding the latency of slow or network
+    file systems, and their texts are parsed by chunks in jobs worker processes. Parsed chunks are
+    collected in submission order, so the result does not depend on which worker finishes first.
+    """
+    jobs = jobs if jobs else os.cpu_count()
+    if len(food_files) < parallel_size:
+        return [read_food_file(food_file) for food_file in food_files]
+    chunks = [food_files[i:i + chunk_size] for i in range(0, len(food_files), chunk_size)]
+    foods = []
+    with ThreadPoolExecutor(max_workers=io_threads) as io_pool:
+        if jobs == 1:
+            for chunk, texts in zip(chunks, iter_texts(io_pool, chunks)):
+                foods.extend(parse_food_texts(chunk, texts))
+            return foods
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            pending = deque()  # parsing futures, in submission order
+            for chunk, texts in zip(chunks, iter_texts(io_pool, chunks)):
+                pending.append(executor.submit(parse_food_texts, chunk, texts))
+                if len(pending) > 2 * jobs:  # bound texts waiting to be parsed
+                    foods.extend(pending.popleft().result())
+            while pending:
+                foods.extend(pending.popleft().result())
+    return foods
+
+
+def write_catalog(catalog_file, foods, sources):
+    """Write catalog file from (name, description, amount, nutrient amounts, source) foods.
+
+    The catalog is written to a temporary file then atomically moved in place,
+    so catalogs opened by other processes are never modified.
+    """
+    foods = sorted(foods, key=lambda food: food[0])
+    rows = {food[4]: row for row, food in enumerate(foods)}  # key: source file name, value: row
+    index = json.dumps({
+        'nutrients': [nutrient.data_name for nutrient in nutrients_list],
+        'names': [food[0] for food in foods],
+        'descriptions': [food[1] for food in foods],
+        'sources': [source[:3] + [rows.get(source[0], -1)] for source in sources],
+    }).encode()
+    matrix = np.array([food[3] for food in foods], dtype='<f8').reshape(len(foods), len(nutrients_list))
+    amounts = np.array([food[2] for food in foods], dtype='<f8')
+    index_offset = header_struct.size + matrix.nbytes + amounts.nbytes
+    tmp_file = Path(catalog_file.parent, f'.{catalog_file.name}.{os.getpid()}.tmp')
+    with open(tmp_file, 'wb') as file:
+        file.write(header_struct.pack(catalog_magic, catalog_version, len(foods), len(nutrients_list),
+                                      index_offset, len(index)))
+        matrix.tofile(file)
+        amounts.tofile(file)
+        file.write(index)
+    os.replace(tmp_file, catalog_file)
+
+
+@metrics.timed_function('catalog_compile')
+def compile_catalog(foods_dir, catalog_file, sources, previous=None, jobs=None):
+    """Compile catalog from food files, reusing rows of unchanged files from previous catalog."""
+    reusable = dict()
+    if previous and previous.nutrients == [nutrient.data_name for nutrient in nutrients_list]:
+        for file_name, mtime_ns, size, row in previous.sources:
+            if row >= 0:
+                reusable[(file_name, mtime_ns, size)] = row
+    parsed_names = [source[0] for source in sources if tuple(source) not in reusable]
+    if metrics.enabled:
+        metrics.count('foods_parsed', len(parsed_names))
+    parsed = dict(zip(parsed_names, read_food_files([Path(foods_dir, name) for name in parsed_names], jobs)))
+    foods = dict()  # key: food name, a food defined in multiple files is overridden by the last one
+    for file_name, mtime_ns, size in sources:
+        row = reusable.get((file_name, mtime_ns, size))
+        if row is not None:
+            food = (previous.names[row], previous.descriptions[row], float(previous.amounts[row]),
+                    previous.matrix[row].copy())
+        else:
+            food = parsed[file_name]
+        if food:
+            if food[0] in foods:
+                print(f"WARNING: food '{food[0]}' of '{file_name}' overrides the food of the same name "
+                      f"of '{foods[food[0]][4]}'")
+            foods[food[0]] = food + (file_name,)
+    write_catalog(catalog_file, foods.values(), sources)
+    print(f'Food catalog compiled in {catalog_file.absolute()} ({len(foods)} foods, '
+          f'{len(parsed_names)} files parsed)')
+
+
+@metrics.timed_function('catalog_load')
+def load_catalog(foods_dir=None, catalog_file=None, jobs=None):
+    """Open compiled catalog of foods directory, rebuilding it if any food file changed.
+
+    When foods are stored in the food database, the catalog is compiled from the database
+    instead, and rebuilt whenever the database is written. Changed food files are parsed by
+    jobs worker processes, by default one per CPU.
+    """
+    database = open_database(read_only=True) if not foods_dir else None
+    foods_dir = foods_dir if foods_dir else config.foods_dir
+    catalog_file = catalog_file if catalog_file else config.catalog_file
+    sources = database.get_sources() if database else scan_sources(foods_dir)
+    catalog = None
+    if catalog_file.exists():
+        try:
+            catalog = FoodCatalog(catalog_file)
+        except (ValueError, KeyError, struct.error):
+            print(f"WARNING: food catalog '{catalog_file.absolute()}' is invalid and will be rebuilt")
+        if catalog and catalog.is_up_to_date(sources):
+            if database:
+                database.close()
+            return catalog
+    if database:
+        foods = database.get_foods()
+        write_catalog(catalog_file, foods, sources)
+        database.close()
+        print(f'Food catalog compiled in {catalog_file.absolute()} ({len(foods)} foods from the food database)')
+    else:
+        compile_catalog(foods_dir, catalog_file, sources, previous=catalog, jobs=jobs)
+    if catalog:
+        catalog.close()
+    return FoodCatalog(catalog_file)
@@ -3,31 +3,73 @@
 # SPDX-License-Identifier: MIT
 """Command Line Interface to run commands"""
 
+import time
+started, startup_cpu = time.perf_counter(), time.process_time()  # before any other import, for --profile
+
 import argparse
+import json
+import re
 from pathlib import Path
 import nutrimetrics.config as config
+import nutrimetrics.metrics as metrics
 from nutrimetrics.__about__ import __version__ as nutrimetrics_version
-from nutrimetrics.food_data_central import FoodDataCentral
-from nutrimetrics.meals import load_foods, MealPlan
-from nutrimetrics.workbook import WorkbookGenerator
-from jsmin import __version__ as jsmin_version
-from requests import __version__ as requests_version
-from xlsxwriter import __version__ as xlsxwriter_version
+from nutrimetrics.profiling import CommandProfile
+
+# modules are imported by the commands using them, so that each command only pays for its own imports:
+# e.g. analyzing a meal plan does not import requests, and importing foods does not import xlsxwriter
+
+
+def add_profile_argument(parser):
+    parser.add_argument(
+        '--profile',
+        type=str,
+        nargs='?',
+        const='',
+        metavar='FILE',
+        help='Print the time spent in each phase of the command, and save cProfile statistics to FILE if given')
+
+
+def add_metrics_argument(parser):
+    parser.add_argument(
+        '--metrics',
+        type=str,
+        metavar='FILE',
+        help='Write counters and timers of the run to FILE: Prometheus text format if FILE ends with .prom, '
+             'otherwise appended as a JSON line')
 
 
 def initialize():
     """Command that initializes user's configuration."""
+    from importlib.metadata import version
+    profile = CommandProfile('nutrimetrics-init', started, startup_cpu)
+    parser = argparse.ArgumentParser(
+        description='NutriMetrics - Initialize configuration.',
+        epilog=f"NutriMetrics configuration files live in '{config.config_dir}' directory."
+    )
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    profile.end_phase('imports')
+    if args.profile is not None:
+        profile.enable(args.profile)
     cfg = config.read_config()
     if not cfg:
         exit()
+    profile.end_phase('config init')
+    # versions of installed distributions, without importing them
     info = f'NutriMetrics version {nutrimetrics_version} initialized '
-    info += f'(jsmin: {jsmin_version}, requests: {requests_version}, xlsxwriter: {xlsxwriter_version})\n'
+    info += f"(numpy: {version('numpy')}, requests: {version('requests')}, xlsxwriter: {version('xlsxwriter')})\n"
     info += config.get_config_file_tree()
     print(info)
+    profile.end_phase('config tree')
+    profile.report()
 
 
 def analyze_meal_plan():
     """Command that analyzes a meal plan."""
+    from nutrimetrics.meals import load_foods, MealPlan
+    from nutrimetrics.programs import Program, is_program
+    from nutrimetrics.reports import report_writers
+    profile = CommandProfile('nutrimetrics-analyze', started, startup_cpu)
     parser = argparse.ArgumentParser(
         description='NutriMetrics - Analyze nutrients in a meal plan.',
         epilog=f"NutriMetrics configuration files live in '{config.config_dir}' directory."
@@ -35,27 +77,416 @@ def analyze_meal_plan():
     parser.add_argument(
         'meal_plan.json',
         type=str,
-        help='Path to meal plan JSON file to be processed'
+        nargs='?',
+        help='Path to meal plan or multi-day program JSON file to be processed'
     )
+    parser.add_argument(
+        '-b', '--batch',
+        type=str,
+        metavar='DIR|GLOB',
+        help='Analyze all meal plan JSON files of a directory or matching a glob pattern')
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        help='Number of worker processes used in batch mode (default: number of CPUs)')
+    parser.add_argument(
+        '-o', '--output-dir',
+        type=str,
+        default='.',
+        help='Directory where reports are created (default: working directory)')
+    parser.add_argument(
+        '-f', '--format',
+        type=str,
+        choices=list(report_writers),
+        default='xlsx',
+        help='Report format: Excel workbook per meal plan, or tables to which meal plans are appended (default: xlsx)')
+    parser.add_argument(
+        '-w', '--watch',
+        action="store_true",
+        help='Keep running and update the report whenever the meal plan file is saved')
+    add_profile_argument(parser)
+    add_metrics_argument(parser)
     args = parser.parse_args()
+    profile.end_phase('imports')
+    if args.profile is not None:
+        profile.enable(args.profile)
+    metrics.enable(bool(args.metrics))
+    if args.batch:
+        analyze_meal_plans_batch(args, profile)
+        return
+    if not vars(args)['meal_plan.json']:
+        parser.error('a meal plan JSON file or the --batch option is required')
+    if args.watch and report_writers[args.format].shared_output:
+        parser.error(f'--watch cannot be used with the {args.format} format, which appends to shared tables')
     json_file = Path(vars(args)['meal_plan.json'])
     if not json_file.exists():
         print(f"Data file '{json_file}' does not exist")
         exit()
+    out_dir = Path(args.output_dir)
+    if not out_dir.is_dir():
+        print(f"Output directory '{out_dir}' does not exist")
+        exit()
     json_data = config.read_json(json_file)
     if not json_data:
         exit()
+    if args.watch and is_program(json_data):
+        parser.error('--watch cannot be used with a multi-day program')
     cfg = config.read_config()
     if not cfg:
         exit()
+    writer = get_report_writer(args.format, cfg['workbook_settings'])
+    profile.end_phase('config init')
     foods = load_foods()
+    profile.end_phase('catalog load')
+    if is_program(json_data):
+        start = time.perf_counter()
+        program = Program(json_data, foods)
+        profile.end_phase('plan build')
+        writer.write_program(out_dir, json_file.stem, program)
+        profile.end_phase('report write')
+        print(f'{len(program.days)} days analyzed in {time.perf_counter() - start:.2f}s')
+        profile.report()
+        if args.metrics:
+            metrics.write_metrics(args.metrics, 'analyze')
+        return
     meal_plan = MealPlan(json_data, foods)
-    generator = WorkbookGenerator(cfg['workbook_settings'])
-    generator.generate(Path(json_file.name.replace('.json', '.xlsx')), meal_plan, foods)
+    profile.end_phase('plan build')
+    writer.write(out_dir, json_file.stem, meal_plan, foods)
+    profile.end_phase('report write')
+    profile.report()
+    if args.metrics:
+        metrics.write_metrics(args.metrics, 'analyze')
+    if args.watch:
+        watch_meal_plan(json_file, meal_plan, writer, out_dir, foods)
+
+
+def watch_meal_plan(json_file, meal_plan, writer, out_dir, foods, interval=0.05):
+    """Update meal plan and its report whenever its file is saved, until interrupted."""
+    print(f"Watching '{json_file}' for changes, press Ctrl+C to stop")
+    stat = json_file.stat()
+    last_saved = (stat.st_mtime_ns, stat.st_size)
+    try:
+        while True:
+            time.sleep(interval)
+            try:
+                stat = json_file.stat()
+            except FileNotFoundError:
+                continue  # some editors save by replacing the file
+            if (stat.st_mtime_ns, stat.st_size) == last_saved:
+                continue
+            last_saved = (stat.st_mtime_ns, stat.st_size)
+            start = time.perf_counter()
+            json_data = config.read_json(json_file)
+            if not json_data:
+                continue
+            # the meal plan is left unchanged by an invalid file, and the last report kept until the next save
+            try:
+                n_meals = meal_plan.update(json_data)
+            except Exception as e:
+                print(f"ERROR: meal plan '{json_file}' is invalid: {type(e).__name__}: {e}")
+                continue
+            try:
+                writer.write(out_dir, json_file.stem, meal_plan, foods)
+            except Exception as e:
+                print(f"ERROR: report of meal plan '{json_file}' not updated: {type(e).__name__}: {e}")
+                continue
+            print(f'{n_meals} of {len(meal_plan.meals)} meals recomputed, '
+                  f'report updated in {(time.perf_counter() - start) * 1000:.0f} ms')
+    except KeyboardInterrupt:
+        pass
+
+
+def get_report_writer(report_format, settings):
+    """Return report writer of format, exit if its optional dependencies are missing."""
+    from nutrimetrics.reports import report_writers
+    try:
+        return report_writers[report_format](settings)
+    except ImportError as e:
+        print(f'ERROR: {e}')
+        exit()
+
+
+def analyze_meal_plans_batch(args, profile):
+    """Analyze all meal plans matching the --batch option."""
+    from nutrimetrics.batch import analyze_batch, find_meal_plans
+    json_files = find_meal_plans(args.batch)
+    if not json_files:
+        print(f"No meal plan JSON file found in '{args.batch}'")
+        exit()
+    out_dir = Path(args.output_dir)
+    if not out_dir.is_dir():
+        print(f"Output directory '{out_dir}' does not exist")
+        exit()
+    cfg = config.read_config()
+    if not cfg:
+        exit()
+    get_report_writer(args.format, cfg['workbook_settings'])  # check optional dependencies before starting workers
+    profile.end_phase('config init')
+    try:
+        summary, _ = analyze_batch(json_files, cfg['workbook_settings'], out_dir, args.jobs, args.format)
+    except ValueError as e:
+        print(f'ERROR: {e}')
+        exit(1)
+    profile.end_phase('batch analysis')
+    profile.report()
+    if args.metrics:
+        metrics.write_metrics(args.metrics, 'analyze_batch')
+    if summary['failed']:
+        exit(1)
+
+
+def optimize_meal_plan():
+    """Command that solves for the food amounts of a meal plan."""
+    from nutrimetrics.meals import load_foods
+    from nutrimetrics.optimizer import MealPlanOptimizer
+    parser = argparse.ArgumentParser(
+        description='NutriMetrics - Optimize food amounts to meet Dietary Reference Intakes.',
+        epilog=f"NutriMetrics configuration files live in '{config.config_dir}' directory."
+    )
+    parser.add_argument(
+        'optimization.json',
+        type=str,
+        help='Path to JSON file defining the target and the candidate foods with their min/max amounts'
+    )
+    parser.add_argument(
+        '-o', '--output',
+        type=str,
+        help='Path to optimized meal plan JSON file (default: <optimization>_meal_plan.json in working directory)')
+    args = parser.parse_args()
+    json_file = Path(vars(args)['optimization.json'])
+    if not json_file.exists():
+        print(f"Data file '{json_file}' does not exist")
+        exit()
+    json_data = config.read_json(json_file)
+    if not json_data:
+        exit()
+    cfg = config.read_config()
+    if not cfg:
+        exit()
+    try:
+        optimizer = MealPlanOptimizer(json_data, load_foods())
+    except ImportError as e:
+        print(f'ERROR: {e}')
+        exit()
+    if not optimizer.foods:
+        print('ERROR: no known candidate food')
+        exit()
+    amounts = optimizer.solve()
+    if amounts is None:
+        exit(1)
+    meal_plan = optimizer.get_meal_plan(amounts)
+    out_file = Path(args.output) if args.output else Path(f'{json_file.stem}_meal_plan.json')
+    with open(out_file, 'w') as file:
+        file.write(json.dumps(meal_plan, indent=2))
+    n_selected = sum(len(meal['foods']) for meal in meal_plan['meals'])
+    print(f'Optimized {len(optimizer.foods)} candidate foods in {optimizer.seconds * 1000:.0f} ms, '
+          f'{n_selected} foods selected')
+    deficits = {data_name: ratio for data_name, ratio in optimizer.get_dri_ratio(amounts).items() if ratio < 0.99}
+    for data_name, ratio in deficits.items():
+        print(f'  {data_name}: {ratio:.0%} of DRI')
+    print(f'Meal plan created in {out_file.absolute()}')
+
+
+def substitute_food():
+    """Command that searches foods with a nutrient profile similar to a food."""
+    from nutrimetrics.meals import load_foods
+    from nutrimetrics.nutrients import nutrient_groups
+    from nutrimetrics.substitution import SubstitutionIndex, bases
+    parser = argparse.ArgumentParser(
+        description='NutriMetrics - Search substitutes of a food with a similar nutrient profile.',
+        epilog=f"NutriMetrics configuration files live in '{config.config_dir}' directory."
+    )
+    parser.add_argument(
+        'food',
+        type=str,
+        help='Name of the food to be substituted')
+    parser.add_argument(
+        '-k', '--top',
+        type=int,
+        default=10,
+        help='Number of substitutes (default: 10)')
+    parser.add_argument(
+        '-b', '--basis',
+        type=str,
+        choices=list(bases),
+        default='energy',
+        help='Compare nutrient profiles per 100 kcal (energy) or per 100 g (mass) (default: energy)')
+    parser.add_argument(
+        '-g', '--groups',
+        type=str,
+        nargs='+',
+        choices=list(nutrient_groups),
+        help='Compare only the nutrients of these groups (default: all nutrients)')
+    args = parser.parse_args()
+    cfg = config.read_config()
+    if not cfg:
+        exit()
+    foods = load_foods()
+    if args.food not in foods:
+        print(f"ERROR: food '{args.food}' is unknown")
+        exit()
+    index = SubstitutionIndex(foods.catalog, args.basis, args.groups)
+    substitutes = index.query(args.food, args.top)
+    if not substitutes:
+        print(f"Food '{args.food}' has no energy or nutrients to compare {bases[args.basis]}")
+        return
+    print(f"Substitutes of '{args.food}', nutrients compared {bases[args.basis]}:")
+    for name, similarity in substitutes:
+        print(f'{similarity:8.3f}  {name}')
+
+
+def search_foods():
+    """Command that searches foods by name or description in the catalog of known foods."""
+    from nutrimetrics.database import open_database
+    from nutrimetrics.meals import load_foods
+    from nutrimetrics.name_index import load_name_index
+    parser = argparse.ArgumentParser(
+        description='NutriMetrics - Search known foods by name or description.',
+        epilog=f"NutriMetrics configuration files live in '{config.config_dir}' directory."
+    )
+    parser.add_argument(
+        'query',
+        type=str,
+        help='Words, possibly misspelled, of the food name or description')
+    parser.add_argument(
+        '-n', '--limit',
+        type=int,
+        default=10,
+        help='Maximum number of foods listed (default: 10)')
+    args = parser.parse_args()
+    cfg = config.read_config()
+    if not cfg:
+        exit()
+    foods = load_foods()
+    catalog = foods.catalog
+    results = load_name_index(catalog).search(args.query, args.limit)
+    if not results:
+        print(f"No food matching '{args.query}'")
+        return
+    database = open_database(read_only=True)
+    if database:
+        fdc_ids = database.get_fdc_ids()  # key: food name
+        database.close()
+    else:
+        fdc_ids = dict()
+        for file_name, _, _, row in catalog.sources:
+            fdc_id = re.search(r'_(\d+)\.json$', file_name)
+            if fdc_id and row >= 0:
+                fdc_ids[catalog.names[row]] = fdc_id.group(1)
+    for row, score in results:
+        fdc_id = fdc_ids.get(catalog.names[row])
+        fdc_id = f'FDC ID {fdc_id}' if fdc_id else ''
+        print(f'{score:6.2f}  {catalog.names[row]}  {fdc_id}\n        {catalog.descriptions[row]}')
+
+
+def manage_database():
+    """Command that migrates foods and DRI to the food database and queries it."""
+    from nutrimetrics.database import FoodDatabase, open_database
+    from nutrimetrics.nutrients import nutrients_list, nutrients_index
+    from nutrimetrics.substitution import bases
+    parser = argparse.ArgumentParser(
+        description='NutriMetrics - Store foods and Dietary Reference Intakes in a SQLite database.',
+        epilog=f"NutriMetrics configuration files live in '{config.config_dir}' directory."
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser(
+        'migrate',
+        help='Upsert foods and DRI of the JSON files in the food database, which is then used instead of them')
+    top_parser = subparsers.add_parser(
+        'top',
+        help='List the foods richest in a nutrient')
+    top_parser.add_argument(
+        'nutrient',
+        type=str,
+        help="Nutrient's data_name, e.g. magnesium")
+    top_parser.add_argument(
+        '-n', '--limit',
+        type=int,
+        default=50,
+        help='Maximum number of foods listed (default: 50)')
+    top_parser.add_argument(
+        '-b', '--basis',
+        type=str,
+        choices=list(bases),
+        default='energy',
+        help='Rank nutrient amounts per 100 kcal (energy) or per 100 g (mass) (default: energy)')
+    args = parser.parse_args()
+    cfg = config.read_config()
+    if not cfg:
+        exit()
+    if args.command == 'migrate':
+        start = time.perf_counter()
+        database = FoodDatabase(config.database_file)
+        n_foods, n_dri = database.migrate(config.foods_dir, config.dri_dir)
+        database.close()
+        print(f'{n_foods} foods and {n_dri} DRI tables migrated to {config.database_file.absolute()} '
+              f'in {time.perf_counter() - start:.1f}s')
+        print('Foods and DRI are now read from the food database, delete it to read the JSON files again')
+        return
+    database = open_database(read_only=True)
+    if not database:
+        print(f"ERROR: food database '{config.database_file.absolute()}' does not exist, run 'nutrimetrics-db migrate'")
+        exit()
+    try:
+        foods = database.top_foods(args.nutrient, args.limit, args.basis)
+    except ValueError as e:
+        print(f'ERROR: {e}')
+        exit()
+    finally:
+        database.close()
+    unit = nutrients_list[nutrients_index[args.nutrient]].display_unit
+    print(f"Foods richest in {args.nutrient} {bases[args.basis]}:")
+    for name, amount in foods:
+        print(f'{amount * unit.internal_factor:10.2f} {unit.symbol:4}  {name}')
+
+
+def serve():
+    """Command that runs the analysis server."""
+    import asyncio
+    from nutrimetrics.server import AnalysisServer
+    parser = argparse.ArgumentParser(
+        description='NutriMetrics - Serve meal plan analyses over HTTP.',
+        epilog=f"NutriMetrics configuration files live in '{config.config_dir}' directory."
+    )
+    parser.add_argument(
+        '--host',
+        type=str,
+        default='127.0.0.1',
+        help='Host address to listen on (default: 127.0.0.1)')
+    parser.add_argument(
+        '-p', '--port',
+        type=int,
+        default=8080,
+        help='TCP port to listen on (default: 8080)')
+    parser.add_argument(
+        '-s', '--socket',
+        type=str,
+        metavar='PATH',
+        help='Listen on a Unix socket instead of a TCP port')
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        help='Number of worker processes analyzing meal plans (default: number of CPUs)')
+    parser.add_argument(
+        '--reload-interval',
+        type=float,
+        default=2.0,
+        help='Seconds between checks of foods and DRI files changes (default: 2)')
+    args = parser.parse_args()
+    cfg = config.read_config()
+    if not cfg:
+        exit()
+    server = AnalysisServer(cfg['workbook_settings'], args.jobs, args.reload_interval)
+    socket_path = Path(args.socket) if args.socket else None
+    asyncio.run(server.serve(args.host, args.port, socket_path))
 
 
 def import_food_data_central():
     """Command that imports nutrient profile data from FoodData Central."""
+    from nutrimetrics.database import open_database
+    from nutrimetrics.food_data_central import FoodDataCentral
+    from nutrimetrics.response_cache import ResponseCache
+    profile = CommandProfile('nutrimetrics-import', started, startup_cpu)
     parser = argparse.ArgumentParser(
         description='NutriMetrics - Import food data from FoodData Central.',
         epilog=f"NutriMetrics configuration files live in '{config.config_dir}' directory."
@@ -63,28 +494,72 @@ def import_food_data_central():
     parser.add_argument(
         'food_list.json',
         type=str,
-        help='Path to food list JSON file to be processed'
+        nargs='?',
+        help='Path to food list JSON file to be processed (optional with --from-dump)'
     )
     parser.add_argument(
         '-r', '--replace',
         action="store_true",
         help='Replace food file if it already exists')
+    parser.add_argument(
+        '-d', '--from-dump',
+        type=str,
+        metavar='PATH',
+        help='Import from a FoodData Central CSV dump directory or JSON dump file instead of the API')
+    parser.add_argument(
+        '--offline',
+        action="store_true",
+        help='Import from the response cache only, whatever the age of cached responses')
+    add_profile_argument(parser)
+    add_metrics_argument(parser)
     args = parser.parse_args()
-    json_file = Path(vars(args)['food_list.json'])
-    if not json_file.exists():
-        print(f"Data file '{json_file}' does not exist")
-        exit()
-    json_data = config.read_json(json_file)
-    if not json_data:
-        exit()
+    profile.end_phase('imports')
+    if args.profile is not None:
+        profile.enable(args.profile)
+    metrics.enable(bool(args.metrics))
+    json_data = None
+    if vars(args)['food_list.json']:
+        json_file = Path(vars(args)['food_list.json'])
+        if not json_file.exists():
+            print(f"Data file '{json_file}' does not exist")
+            exit()
+        json_data = config.read_json(json_file)
+        if not json_data:
+            exit()
+    elif not args.from_dump:
+        parser.error('a food list JSON file is required when not importing from a dump')
     cfg = config.read_config()
     if not cfg:
         exit()
+    cache = ResponseCache(
+        Path(config.cache_dir, 'food_data_central'),
+        cfg['food_data_central'].get('cache_ttl', 604800),
+        cfg['food_data_central'].get('cache_max_bytes', 268435456),
+    )
     fdc = FoodDataCentral(
         cfg['food_data_central']['api_url'],
         cfg['food_data_central']['api_key'],
         cfg['food_data_central']['verbose_import'],
         cfg['food_data_central']['nutrients_ids'],
-        args.replace
+        args.replace,
+        batch_size=cfg['food_data_central'].get('batch_size', 20),
+        max_workers=cfg['food_data_central'].get('max_workers', 4),
+        max_retries=cfg['food_data_central'].get('max_retries', 5),
+        timeout=cfg['food_data_central'].get('timeout', 30),
+        cache=cache,
+        offline=args.offline,
+        database=open_database(),
     )
-    fdc.import_food_list(json_data)
+    profile.end_phase('config init')
+    if args.from_dump:
+        dump_path = Path(args.from_dump)
+        if not dump_path.exists():
+            print(f"Dump '{dump_path}' does not exist")
+            exit()
+        fdc.import_dump(dump_path, json_data)
+    else:
+        fdc.import_food_list(json_data)
+    profile.end_phase('food import')
+    profile.report()
+    if args.metrics:
+        metrics.write_metrics(args.metrics, 'import')
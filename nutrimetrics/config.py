@@ -5,8 +5,8 @@
 
 from pathlib import Path
 import os
-from jsmin import jsmin
 import json
+import re
 from json.decoder import JSONDecodeError
 import importlib.resources as rsc
 import shutil
@@ -17,6 +17,9 @@ config_file = Path(config_dir, 'config.json')
 foods_dir = Path(config_dir, 'foods')
 dri_dir = Path(config_dir, 'dri')
 samples_dir = Path(config_dir, 'samples')
+catalog_file = Path(config_dir, 'catalog.bin')
+database_file = Path(config_dir, 'foods.db')
+cache_dir = Path(config_dir, 'cache')
 
 
 def initialize():
@@ -38,18 +41,49 @@ def initialize():
         shutil.copytree(rsc.files('nutrimetrics.resources').joinpath('samples'), samples_dir)
 
 
+# JSON strings, where comment delimiters are text, then line and block comments
+comment_pattern = re.compile(r'"[^"\\\n]*(?:\\.[^"\\\n]*)*"|//[^\n]*|/\*.*?\*/', re.DOTALL)
+blank_pattern = re.compile(r'[^\n]')
+
+
+def blank_comment(match):
+    text = match.group()
+    return text if text[0] == '"' else blank_pattern.sub(' ', text)
+
+
+def strip_comments(text):
+    """Return text with // and /* */ comments outside of strings replaced by spaces.
+
+    Line breaks are kept and comments are replaced by as many spaces, so that the positions of
+    decoding errors in the stripped text are the positions in the original text.
+    """
+    return comment_pattern.sub(blank_comment, text)
+
+
+def loads(text):
+    """Decode JSON text that may have comments, only stripped when a comment delimiter is found."""
+    if '//' in text or '/*' in text:
+        text = strip_comments(text)
+    return json.loads(text)
+
+
 def read_json(json_file):
     """Read JSON file that may have comments"""
     with open(json_file, 'r') as file:
-        try:
-            data = json.loads(jsmin(file.read()))
-        except JSONDecodeError as e:
-            print(f"ERROR: JSON file '{json_file.absolute()}' badly formatted")
-            print(f"{e.msg}:")
-            begin = max(0, e.pos - 50)
-            end = min(len(e.doc), e.pos + 50)
-            print(f"...\n{e.doc[begin:end]}\n...")
-            data = None
+        return parse_json(file.read(), json_file)
+
+
+def parse_json(text, json_file):
+    """Decode text of JSON file that may have comments, or print the error context and return None."""
+    try:
+        data = loads(text)
+    except JSONDecodeError as e:
+        print(f"ERROR: JSON file '{json_file.absolute()}' badly formatted")
+        print(f"{e.msg}:")
+        begin = max(0, e.pos - 50)
+        end = min(len(e.doc), e.pos + 50)
+        print(f"...\n{e.doc[begin:end]}\n...")
+        data = None
     return data
 
 
@@ -62,6 +96,8 @@ def read_config():
 def get_config_file_tree():
     tree = f'{config_dir.absolute()}\n'
     tree += f'├── config.json\n'
+    if database_file.exists():
+        tree += f'├── {database_file.name}\n'
     tree += f'├── foods\n'
     n_food = 0
     for file in [Path(dri_dir, f) for f in sorted(os.listdir(foods_dir))]:
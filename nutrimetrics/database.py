@@ -0,0 +1,232 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""SQLite database of foods and Dietary Reference Intakes.
+
+The database is an optional storage backend replacing the JSON files of the foods and DRI
+directories. It is created by migrating these files, then foods and DRI are read from it:
+the compiled catalog is built from the database instead of the food files, and the importer
+upserts foods in bulk. Nutrient amounts are stored as one row per food and non-zero nutrient,
+along with the amount per 100 kcal and per 100 g of food, indexed by nutrient, so that queries
+such as the top foods by a nutrient per 100 kcal are index scans.
+
+Tables:
+    meta: key, value: database ID and version, incremented by every write
+    nutrients: nutrient's data_name
+    foods: unique name, description, reference amount, energy and FDC ID of each food
+    food_nutrients: amount, per 100 kcal amount and per 100 g amount of each nutrient of each food
+    dri: amount of each nutrient of each Dietary Reference Intakes table
+"""
+
+import random
+import re
+import sqlite3
+import numpy as np
+import nutrimetrics.config as config
+from nutrimetrics.nutrients import nutrients_list, nutrients_index
+
+
+# version of the schema, stored in the user_version of the database file
+schema_version = 1
+
+schema = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS nutrients (
+    id INTEGER PRIMARY KEY,
+    data_name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS foods (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    description TEXT NOT NULL,
+    amount REAL NOT NULL,
+    energy REAL NOT NULL,
+    fdc_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS foods_fdc_id ON foods (fdc_id);
+CREATE TABLE IF NOT EXISTS food_nutrients (
+    food_id INTEGER NOT NULL REFERENCES foods (id) ON DELETE CASCADE,
+    nutrient_id INTEGER NOT NULL REFERENCES nutrients (id),
+    amount REAL NOT NULL,
+    per_energy REAL,
+    per_mass REAL,
+    PRIMARY KEY (food_id, nutrient_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS food_nutrients_per_energy ON food_nutrients (nutrient_id, per_energy);
+CREATE INDEX IF NOT EXISTS food_nutrients_per_mass ON food_nutrients (nutrient_id, per_mass);
+CREATE TABLE IF NOT EXISTS dri (
+    dri_name TEXT NOT NULL,
+    nutrient_id INTEGER NOT NULL REFERENCES nutrients (id),
+    amount REAL NOT NULL,
+    PRIMARY KEY (dri_name, nutrient_id)
+) WITHOUT ROWID;
+"""
+
+# column of the per 100 kcal and per 100 g amounts, key: basis
+basis_columns = {
+    'energy': 'per_energy',
+    'mass': 'per_mass',
+}
+
+
+class FoodDatabase:
+    """SQLite database of foods and Dietary Reference Intakes.
+
+    The schema is only created, and the nutrients added, when the database file is behind schema_version,
+    so that opening a database does not write to it. A read-only database is opened in read-only mode,
+    neither taking the write lock nor requiring write permission on the database file.
+    """
+    def __init__(self, database_file, read_only=False):
+        self.database_file = database_file
+        if read_only:
+            self.connection = sqlite3.connect(f'{database_file.absolute().as_uri()}?mode=ro', uri=True)
+        else:
+            self.connection = sqlite3.connect(database_file)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        if not read_only and self.connection.execute('PRAGMA user_version').fetchone()[0] < schema_version:
+            self.connection.execute('PRAGMA journal_mode = WAL')  # readers are not blocked by the importer
+            with self.connection:
+                self.connection.executescript(schema)
+                self.connection.execute('INSERT OR IGNORE INTO meta VALUES (?, ?)', ('id', random.getrandbits(62)))
+                self.connection.execute('INSERT OR IGNORE INTO meta VALUES (?, ?)', ('version', 0))
+                self.connection.executemany('INSERT OR IGNORE INTO nutrients (data_name) VALUES (?)',
+                                            [(nutrient.data_name,) for nutrient in nutrients_list])
+                self.connection.execute(f'PRAGMA user_version = {schema_version}')
+        # key: nutrient's data_name, value: nutrient ID
+        self.nutrient_ids = dict(self.connection.execute('SELECT data_name, id FROM nutrients'))
+
+    def close(self):
+        self.connection.close()
+
+    def get_sources(self):
+        """Return [database file name, version, database ID] list, changed by every write."""
+        meta = dict(self.connection.execute('SELECT key, value FROM meta'))
+        return [[self.database_file.name, meta['version'], meta['id']]]
+
+    def increment_version(self):
+        self.connection.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM foods').fetchone()[0]
+
+    def __contains__(self, name):
+        return self.connection.execute('SELECT 1 FROM foods WHERE name = ?', (name,)).fetchone() is not None
+
+    def upsert_foods(self, foods):
+        """Insert or replace (name, description, amount, nutrients dictionary, FDC ID) foods in one transaction."""
+        food_rows, nutrient_rows = [], []
+        # a food upserted multiple times is overridden by the last one
+        for name, description, amount, nutrients, fdc_id in {food[0]: food for food in foods}.values():
+            energy = float(nutrients.get('energy', 0))
+            food_rows.append((name, description, float(amount), energy, fdc_id))
+            for data_name, ntr_amount in nutrients.items():
+                if data_name not in self.nutrient_ids:
+                    print(f"ERROR: nutrient '{data_name}' of food '{name}' is unknown")
+                elif ntr_amount:
+                    ntr_amount = float(ntr_amount)
+                    nutrient_rows.append((name, self.nutrient_ids[data_name], ntr_amount,
+                                          100 * ntr_amount / energy if energy > 0 else None,
+                                          100 * ntr_amount / amount if amount > 0 else None))
+        with self.connection:
+            self.connection.executemany(
+                'INSERT INTO foods (name, description, amount, energy, fdc_id) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET description = excluded.description, amount = excluded.amount, '
+                'energy = excluded.energy, fdc_id = excluded.fdc_id', food_rows)
+            self.connection.executemany(
+                'DELETE FROM food_nutrients WHERE food_id = (SELECT id FROM foods WHERE name = ?)',
+                [row[:1] for row in food_rows])
+            self.connection.executemany(
+                'INSERT INTO food_nutrients SELECT id, ?, ?, ?, ? FROM foods WHERE name = ?',
+                [row[1:] + row[:1] for row in nutrient_rows])
+            self.increment_version()
+        return len(food_rows)
+
+    def upsert_dri(self, dri_name, dri_dict):
+        """Insert or replace Dietary Reference Intakes table."""
+        with self.connection:
+            self.connection.execute('DELETE FROM dri WHERE dri_name = ?', (dri_name,))
+            rows = []
+            for data_name, amount in dri_dict.items():
+                if data_name not in self.nutrient_ids:
+                    print(f"ERROR: nutrient '{data_name}' of DRI '{dri_name}' is unknown")
+                else:
+                    rows.append((dri_name, self.nutrient_ids[data_name], float(amount)))
+            self.connection.executemany('INSERT INTO dri VALUES (?, ?, ?)', rows)
+            self.increment_version()
+
+    def get_foods(self):
+        """Return (name, description, amount, nutrient amounts, source) foods, to be compiled in a catalog."""
+        foods = self.connection.execute('SELECT id, name, description, amount FROM foods ORDER BY id').fetchall()
+        rows = {food[0]: row for row, food in enumerate(foods)}  # key: food ID, value: row
+        columns = {ntr_id: nutrients_index[data_name] for data_name, ntr_id in self.nutrient_ids.items()
+                   if data_name in nutrients_index}
+        matrix = np.zeros((len(foods), len(nutrients_list)))
+        for food_id, ntr_id, amount in self.connection.execute(
+                'SELECT food_id, nutrient_id, amount FROM food_nutrients'):
+            if ntr_id in columns:
+                matrix[rows[food_id], columns[ntr_id]] = amount
+        return [(name, description, amount, matrix[rows[food_id]], None)
+                for food_id, name, description, amount in foods]
+
+    def get_fdc_ids(self):
+        """Return FDC ID of foods imported from FoodData Central, key: food name."""
+        return dict(self.connection.execute('SELECT name, fdc_id FROM foods WHERE fdc_id IS NOT NULL'))
+
+    def get_dri(self, dri_name):
+        """Return Dietary Reference Intakes table, key: nutrient's data_name, or None if unknown."""
+        dri_dict = dict(self.connection.execute(
+            'SELECT data_name, amount FROM dri JOIN nutrients ON nutrients.id = nutrient_id WHERE dri_name = ?',
+            (dri_name,)))
+        return dri_dict if dri_dict else None
+
+    def get_dri_tables(self):
+        """Return all Dietary Reference Intakes tables, key: DRI name, value: DRI dictionary."""
+        dri_tables = dict()
+        for dri_name, data_name, amount in self.connection.execute(
+                'SELECT dri_name, data_name, amount FROM dri JOIN nutrients ON nutrients.id = nutrient_id '
+                'ORDER BY dri_name'):
+            dri_tables.setdefault(dri_name, dict())[data_name] = amount
+        return dri_tables
+
+    def top_foods(self, data_name, limit=50, basis='energy'):
+        """Return up to limit (name, amount) of the foods richest in nutrient, per 100 kcal or per 100 g."""
+        if data_name not in self.nutrient_ids:
+            raise ValueError(f"nutrient '{data_name}' is unknown")
+        if basis not in basis_columns:
+            raise ValueError(f"basis '{basis}' is unknown, expected one of {', '.join(basis_columns)}")
+        column = basis_columns[basis]
+        return self.connection.execute(
+            f'SELECT name, {column} FROM food_nutrients JOIN foods ON foods.id = food_id '
+            f'WHERE nutrient_id = ? AND {column} IS NOT NULL ORDER BY {column} DESC LIMIT ?',
+            (self.nutrient_ids[data_name], limit)).fetchall()
+
+    def migrate(self, foods_dir, dri_dir, batch_size=1000):
+        """Upsert foods and Dietary Reference Intakes of JSON files, return number of foods and DRI tables."""
+        n_foods, foods = 0, []
+        for food_file in sorted(foods_dir.glob('*.json')):
+            data = config.read_json(food_file)
+            if not data:
+                continue
+            fdc_id = re.search(r'_(\d+)$', food_file.stem)
+            foods.append((data['name'], data['description'], data['amount'], data['nutrients'],
+                          int(fdc_id.group(1)) if fdc_id else None))
+            if len(foods) == batch_size:
+                n_foods += self.upsert_foods(foods)
+                foods = []
+        n_foods += self.upsert_foods(foods)
+        n_dri = 0
+        for dri_file in sorted(dri_dir.glob('*.json')):
+            data = config.read_json(dri_file)
+            if data:
+                self.upsert_dri(dri_file.stem, data['dietary_reference_intakes'])
+                n_dri += 1
+        return n_foods, n_dri
+
+
+def open_database(database_file=None, read_only=False):
+    """Open food database, or return None if foods and DRI are stored as JSON files."""
+    database_file = database_file if database_file else config.database_file
+    return FoodDatabase(database_file, read_only) if database_file.exists() else None
@@ -3,68 +3,377 @@
 # SPDX-License-Identifier: MIT
 """Defines the FoodData Central interface to import data."""
 
+import csv
+import itertools
+from collections import Counter
 import json
+import random
+import re
 import requests
+import threading
+import time
 import nutrimetrics.config as config
+import nutrimetrics.metrics as metrics
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from json.decoder import JSONDecodeError
 from pathlib import Path
 from nutrimetrics.meals import Food
+from nutrimetrics.nutrients import nutrients_index
 from nutrimetrics.units import convert_amount
 
 
+# HTTP status codes of requests that are retried with backoff
+retry_status_codes = [429, 500, 502, 503, 504]
+
+# units of CSV dumps nutrient table, as named by the API
+csv_units = {'KCAL': 'kcal', 'G': 'g', 'MG': 'mg', 'UG': 'µg'}
+
+# bytes of food file names before the FDC ID, well below the 255 bytes limit of most file systems
+max_file_stem = 120
+
+# characters of food names replaced in food file names: separators of paths, spaces and control characters
+unsafe_file_characters = re.compile(r'[ /\\\x00-\x1f]')
+
+# bytes of the food being decoded from a JSON dump, beyond which the dump is considered badly formatted
+max_dump_food_size = 1 << 24
+
+# number of last characters of the decoded buffer where a decoding error may be due to a food cut by the end
+# of the buffer, rather than to a badly formatted food, e.g. a literal or number cut in the middle
+cut_food_margin = 16
+
+
 class FoodDataCentral:
     """Defines the FoodData Central interface to import data."""
-    def __init__(self, api_url, api_key, verbose_import, nutrients_ids, replace_existing):
+    def __init__(self, api_url, api_key, verbose_import, nutrients_ids, replace_existing,
+                 batch_size=20, max_workers=4, max_retries=5, backoff_factor=1.0, cache=None, offline=False,
+                 database=None, upsert_size=1000, timeout=30):
         self.api_url = api_url
         self.api_key = api_key
         self.verbose_import = verbose_import
         self.nutrients_ids = nutrients_ids
+        # reverse index, key: FDC nutrient ID, value: nutrient's data_name (first mapped data_name wins)
+        self.nutrients_data_names = dict()
+        for data_name, ntr_ids in nutrients_ids.items():
+            if data_name not in nutrients_index:
+                print(f"ERROR: nutrient '{data_name}' of nutrients_ids is unknown")
+                continue
+            for ntr_id in ntr_ids:
+                self.nutrients_data_names.setdefault(ntr_id, data_name)
+        # key: (FDC nutrient ID, name, unit) of nutrients without data_name, value: number of occurrences
+        self.unmapped_nutrients = Counter()
         self.replace_existing = replace_existing
-        self.session = None
+        self.batch_size = batch_size  # FoodData Central accepts up to 20 IDs per /foods request
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout  # seconds to connect, and to wait for each response chunk
+        self.cache = cache  # optional ResponseCache
+        self.offline = offline  # only import from cache, whatever the age of its entries
+        self.local = threading.local()  # one session per thread
+        self.database = database  # optional FoodDatabase, foods are upserted instead of written to food files
+        self.upsert_size = upsert_size
+        self.pending_foods = []  # foods to be upserted in the database
+
+    @property
+    def session(self):
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    @staticmethod
+    def get_food_file(food_name, fdc_id):
+        """Return food file named after food name, made safe for the file system, and FDC ID."""
+        file_stem = unsafe_file_characters.sub('_', food_name.lower()).lstrip('.')
+        file_stem = file_stem.encode()[:max_file_stem].decode(errors='ignore')  # long FDC descriptions
+        return Path(config.foods_dir, f'{file_stem}_{fdc_id}.json')
+
+    def is_imported(self, food_name, food_file):
+        """Return True if food should not be imported again, printing why."""
+        if self.replace_existing:
+            return False
+        if self.database:
+            if food_name in self.database:
+                print(f"> Do not import {food_name}: already exists in {self.database.database_file.absolute()}")
+                return True
+        elif food_file.exists():
+            print(f"> Do not import {food_name}: {food_file.absolute()} already exists")
+            return True
+        return False
 
     def import_food_list(self, data):
-        self.session = requests.Session()
+        foods = []  # (fdc_id, food_name, food_file) of foods to download
+        revalidated = []  # (fdc_id, food_name, food_file, cache entry) of stale cached foods
         for food in data['foods']:
             food_name, fdc_id = food['name'], food['fdc_id']
-            food_file = Path(config.foods_dir, food_name.lower().replace(' ', '_') + f'_{fdc_id}.json')
-            if food_file.exists() and not self.replace_existing:
-                print(f"> Do not import {food_name}: {food_file.absolute()} already exists")
+            food_file = self.get_food_file(food_name, fdc_id)
+            if self.is_imported(food_name, food_file):
                 continue
-            fdc_data = self.download(fdc_id, food_name)
-            if fdc_data:
+            entry = self.cache.get(int(fdc_id)) if self.cache else None
+            if entry and (self.offline or self.cache.is_fresh(entry)):
+                print(f'Using cached {food_name} ({fdc_id})')
+                if metrics.enabled:
+                    metrics.count('http_cache_hits')
+                self.write_food_file(fdc_id, food_name, food_file, entry['payload'])
+            elif self.offline:
+                print(f'ERROR: {food_name} ({fdc_id}) is not cached, it cannot be imported offline')
+            elif entry:
+                # including entries of /foods responses, without validators, to get the validators of the food
+                revalidated.append((fdc_id, food_name, food_file, entry))
+            else:
+                foods.append((fdc_id, food_name, food_file))
+        batches = [foods[i:i + self.batch_size] for i in range(0, len(foods), self.batch_size)]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.download_batch, [int(fdc_id) for fdc_id, _, _ in batch]): batch
+                       for batch in batches}
+            # stale cached foods are revalidated one by one with conditional requests, if they have validators
+            for fdc_id, food_name, food_file, entry in revalidated:
+                futures[executor.submit(self.revalidate, fdc_id, food_name, entry)] = [(fdc_id, food_name, food_file)]
+            try:
+                # food files are written by this thread as soon as each batch is downloaded
+                for future in as_completed(futures):
+                    self.write_batch(futures[future], future)
+            finally:
+                self.upsert_pending_foods()  # foods of the completed batches are kept whatever happens next
+        self.report_unmapped_nutrients()
+
+    def write_batch(self, batch, future):
+        """Write foods of a downloaded batch, reporting its foods as failed if its download failed."""
+        try:
+            fdc_data_list = future.result()
+        except Exception as e:
+            print(f'ERROR: FoodData Central download failed: {type(e).__name__}: {e}')
+            for fdc_id, food_name, _ in batch:
+                print(f'ERROR: {food_name} ({fdc_id}) not imported')
+            return
+        for fdc_id, food_name, food_file in batch:
+            fdc_data = fdc_data_list.get(int(fdc_id))
+            if not fdc_data:
+                print(f'ERROR: FoodData Central did not return {food_name} ({fdc_id})')
+                continue
+            try:
                 self.write_food_file(fdc_id, food_name, food_file, fdc_data)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f'ERROR: {food_name} ({fdc_id}) not imported, unexpected food data: {type(e).__name__}: {e}')
 
-    def download(self, fdc_id, food_name):
+    def import_dump(self, dump_path, data=None):
+        """Import foods from a FoodData Central dump, all of them or only those of the food list."""
+        selected = None  # key: FDC ID, value: food name
+        if data:
+            selected = {int(food['fdc_id']): food['name'] for food in data['foods']}
+        fdc_foods = read_csv_dump(dump_path) if dump_path.is_dir() else read_json_dump(dump_path)
+        n_imported = 0
+        for fdc_data in fdc_foods:
+            fdc_id = fdc_data['fdcId']
+            if selected is None:
+                food_name = fdc_data['description']
+            elif fdc_id in selected:
+                food_name = selected.pop(fdc_id)
+            else:
+                continue
+            food_file = self.get_food_file(food_name, fdc_id)
+            if self.is_imported(food_name, food_file):
+                continue
+            self.write_food_file(fdc_id, food_name, food_file, fdc_data)
+            n_imported += 1
+        self.upsert_pending_foods()
+        for fdc_id, food_name in (selected or dict()).items():
+            print(f'ERROR: {food_name} ({fdc_id}) not found in {dump_path.absolute()}')
+        print(f'{n_imported} foods imported from {dump_path.absolute()}')
+        self.report_unmapped_nutrients()
+
+    @metrics.timed_function('http_request')
+    def request(self, method, query, **kwargs):
+        """Send request, retrying with exponential backoff on rate limit and server errors."""
+        for attempt in range(self.max_retries + 1):
+            res = None
+            try:
+                res = self.session.request(method, query, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    print(f'ERROR: FoodData Central connection failed: {e}')
+                    return None
+            else:
+                if res.status_code not in retry_status_codes or attempt == self.max_retries:
+                    return res
+            delay = self.backoff_factor * 2 ** attempt * (1 + random.random())
+            retry_after = res.headers.get('Retry-After') if res is not None else None
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            reason = f'status={res.status_code}' if res is not None else 'connection error or timeout'
+            print(f'FoodData Central request failed ({reason}), retrying in {delay:.1f}s')
+            if metrics.enabled:
+                metrics.count('http_retries')
+            time.sleep(delay)
+
+    def download(self, fdc_id, food_name, entry=None):
+        """Download food, with a conditional request if a cache entry is given."""
         query = f'{self.api_url}/food/{fdc_id}?api_key={self.api_key}'
         print(f'Fetching {food_name} ({fdc_id}) GET {query}')
-        res = self.session.get(query)
+        headers = dict()
+        if entry and entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        res = self.request('GET', query, headers=headers)
+        if res is None:
+            return None
+        if res.status_code == 304 and entry:
+            self.cache.refresh(entry, res.headers.get('ETag'), res.headers.get('Last-Modified'))
+            return entry['payload']
         if res.status_code != 200:
             print(f'ERROR: FoodData Central return status={res.status_code}')
             return None
         else:
-            return json.loads(res.content.decode())
+            fdc_data = json.loads(res.content.decode())
+            if self.cache:
+                self.cache.put(int(fdc_id), fdc_data, res.headers.get('ETag'), res.headers.get('Last-Modified'))
+            return fdc_data
+
+    def revalidate(self, fdc_id, food_name, entry):
+        """Download stale cached food, return dictionary of FDC data by FDC ID."""
+        return {int(fdc_id): self.download(fdc_id, food_name, entry)}
+
+    def download_batch(self, fdc_ids):
+        """Download foods with the multiple IDs endpoint, return dictionary of FDC data by FDC ID."""
+        query = f'{self.api_url}/foods?api_key={self.api_key}'
+        print(f'Fetching {len(fdc_ids)} foods ({", ".join(str(fdc_id) for fdc_id in fdc_ids)}) POST {query}')
+        res = self.request('POST', query, json={'fdcIds': fdc_ids, 'format': 'full'})
+        if res is None:
+            return dict()
+        if res.status_code != 200:
+            print(f'ERROR: FoodData Central return status={res.status_code}')
+            return dict()
+        fdc_data_list = {fdc_data['fdcId']: fdc_data for fdc_data in json.loads(res.content.decode())}
+        if self.cache:
+            for fdc_id, fdc_data in fdc_data_list.items():
+                self.cache.put(fdc_id, fdc_data)  # validators of a multiple foods response do not apply
+        return fdc_data_list
 
     def get_nutrient_data_name(self, ntr_id):
-        for nutrient_name, nutrient_ids in self.nutrients_ids.items():
-            if ntr_id in nutrient_ids:
-                return nutrient_name
-        return None
+        return self.nutrients_data_names.get(ntr_id)
 
-    def write_food_file(self, fdc_id, food_name, food_file, fdc_data):
+    def transform(self, fdc_id, food_name, fdc_data):
+        """Transform FoodData Central food data to food, counting nutrients without data_name."""
         # FoodData Central nutrients are always provided for 100 grams
         food = Food(food_name, fdc_data['description'], amount=100)
         for food_nutrient in fdc_data["foodNutrients"]:
             if "amount" in food_nutrient:
-                ntr_id = food_nutrient["nutrient"]["id"]
-                ntr_unit = food_nutrient["nutrient"]["unitName"]
+                nutrient = food_nutrient["nutrient"]
+                ntr_id = nutrient["id"]
+                ntr_unit = nutrient["unitName"]
                 ntr_amount = food_nutrient["amount"]
-                ntr_name = food_nutrient["nutrient"]["name"]
-                data_name = self.get_nutrient_data_name(ntr_id)
+                data_name = self.nutrients_data_names.get(ntr_id)
                 if self.verbose_import:
-                    verbose = f'{food_name} ({fdc_id}): [{ntr_name}][{ntr_id}][{ntr_amount}][{ntr_unit}]'
+                    verbose = f'{food_name} ({fdc_id}): [{nutrient["name"]}][{ntr_id}][{ntr_amount}][{ntr_unit}]'
                     verbose += f' -> {data_name}' if data_name else ''
                     print(verbose)
                 if data_name:
-                    food.nutrients[data_name] = convert_amount(ntr_amount, ntr_unit)
+                    food.values[nutrients_index[data_name]] = convert_amount(ntr_amount, ntr_unit)
+                else:
+                    self.unmapped_nutrients[(ntr_id, nutrient["name"], ntr_unit)] += 1
+        return food
+
+    def write_food_file(self, fdc_id, food_name, food_file, fdc_data):
+        food = self.transform(fdc_id, food_name, fdc_data)
+        if self.database:
+            self.pending_foods.append((food.name, food.description, food.amount, food.nutrients, int(fdc_id)))
+            if len(self.pending_foods) >= self.upsert_size:
+                self.upsert_pending_foods()
+            return
         with open(food_file, 'w') as file:
             file.write(food.to_json(indent=2))
         print(f'> Imported to {food_file.absolute()}')
+
+    def upsert_pending_foods(self):
+        """Upsert imported foods in the database, in one transaction."""
+        if self.pending_foods:
+            n_foods = self.database.upsert_foods(self.pending_foods)
+            print(f'> Imported {n_foods} foods to {self.database.database_file.absolute()}')
+            self.pending_foods = []
+
+    def report_unmapped_nutrients(self):
+        """Print nutrients without data_name found in imported foods, most frequent first."""
+        if not self.unmapped_nutrients:
+            return
+        print(f'{len(self.unmapped_nutrients)} FoodData Central nutrients are not mapped in nutrients_ids:')
+        for (ntr_id, ntr_name, ntr_unit), count in self.unmapped_nutrients.most_common():
+            print(f'  [{ntr_id}][{ntr_name}][{ntr_unit}] found {count} times')
+
+
+def read_csv_dump(dump_dir):
+    """Stream foods of a FoodData Central CSV dump directory, formatted as the API food data.
+
+    Only the small nutrient table is kept in memory: foods and their nutrients are read
+    simultaneously from the food.csv and food_nutrient.csv files, both sorted by FDC ID.
+    """
+    nutrients = dict()  # key: nutrient ID, value: API-like nutrient
+    with open(Path(dump_dir, 'nutrient.csv'), newline='', encoding='utf-8-sig') as file:
+        for row in csv.DictReader(file):
+            nutrients[int(row['id'])] = {
+                'id': int(row['id']),
+                'name': row['name'],
+                'unitName': csv_units.get(row['unit_name'], row['unit_name']),
+            }
+    with open(Path(dump_dir, 'food.csv'), newline='', encoding='utf-8-sig') as food_file, \
+            open(Path(dump_dir, 'food_nutrient.csv'), newline='', encoding='utf-8-sig') as food_nutrient_file:
+        foods = csv.DictReader(food_file)
+        food = next(foods, None)
+        previous_fdc_id = None
+        food_nutrients = csv.DictReader(food_nutrient_file)
+        for fdc_id, rows in itertools.groupby(food_nutrients, key=lambda row: int(row['fdc_id'])):
+            if previous_fdc_id is not None and fdc_id <= previous_fdc_id:
+                print(f"ERROR: '{food_nutrient_file.name}' is not sorted by fdc_id ({fdc_id} after {previous_fdc_id})")
+                return
+            previous_fdc_id = fdc_id
+            while food and int(food['fdc_id']) < fdc_id:
+                food = next(foods, None)
+            if not food or int(food['fdc_id']) != fdc_id:
+                print(f"ERROR: food {fdc_id} not found in '{food_file.name}'")
+                continue
+            food_nutrients_data = []
+            for row in rows:
+                if row['amount']:
+                    ntr_id = int(row['nutrient_id'])
+                    nutrient = nutrients.get(ntr_id, {'id': ntr_id, 'name': '', 'unitName': ''})
+                    food_nutrients_data.append({'nutrient': nutrient, 'amount': float(row['amount'])})
+            yield {'fdcId': fdc_id, 'description': food['description'], 'foodNutrients': food_nutrients_data}
+
+
+def read_json_dump(json_file, chunk_size=1 << 20):
+    """Stream foods of a FoodData Central JSON dump, one food of its foods array at a time.
+
+    A food that cannot be decoded, although followed by more data, ends the stream with an error, so that
+    memory stays bounded to the food being decoded instead of buffering the rest of the file.
+    """
+    decoder = json.JSONDecoder()
+    with open(json_file, 'r', encoding='utf-8-sig') as file:
+        buffer, pos = '', -1
+        while pos < 0:  # the foods array is the value of the top-level object
+            chunk = file.read(chunk_size)
+            if not chunk:
+                print(f"ERROR: no foods array found in JSON file '{json_file.absolute()}'")
+                return
+            buffer += chunk
+            pos = buffer.find('[')
+        pos += 1
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+            try:
+                if pos == len(buffer):
+                    raise JSONDecodeError('Expecting value', buffer, pos)
+                fdc_data, pos = decoder.raw_decode(buffer, pos)
+            except JSONDecodeError as e:
+                # a food cut by the end of the buffer fails near that end, or at its last string
+                cut = e.pos >= len(buffer) - cut_food_margin or e.msg.startswith('Unterminated string')
+                chunk = file.read(chunk_size) if cut and len(buffer) - pos < max_dump_food_size else None
+                if not chunk:
+                    print(f"ERROR: JSON file '{json_file.absolute()}' badly formatted")
+                    print(f"{e.msg}:")
+                    print(f"...\n{e.doc[max(0, e.pos - 50):e.pos + 50]}\n...")
+                    return
+                buffer, pos = buffer[pos:] + chunk, 0  # only keep the food being decoded
+                continue
+            yield fdc_data
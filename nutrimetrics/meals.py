@@ -3,13 +3,18 @@
 # SPDX-License-Identifier: MIT
 """Defines food, meal, and meal plan."""
 
-from nutrimetrics.nutrients import nutrients_list
+from nutrimetrics.nutrients import nutrients_list, nutrients_index
+import hashlib
 import json
-import os
+import numpy as np
 from pathlib import Path
 import nutrimetrics.config as config
-import copy
+import nutrimetrics.metrics as metrics
+from nutrimetrics.catalog import load_catalog
+from nutrimetrics.database import open_database
+from nutrimetrics.name_index import load_name_index
 from collections import OrderedDict
+from collections.abc import Mapping, MutableMapping
 from nutrimetrics.units import convert_amount
 
 
@@ -18,18 +23,48 @@ energy_carbohydrate_factor = 4
 energy_fat_factor = 8
 
 
+class NutrientsView(MutableMapping):
+    """Dict-style view of nutrient amounts stored in a vector indexed as nutrients_list."""
+    def __init__(self, values):
+        self.values = values
+
+    def __getitem__(self, data_name):
+        return float(self.values[nutrients_index[data_name]])
+
+    def __setitem__(self, data_name, amount):
+        self.values[nutrients_index[data_name]] = amount
+
+    def __delitem__(self, data_name):
+        raise TypeError('nutrients cannot be deleted, set their amount to zero instead')
+
+    def __iter__(self):
+        return iter(nutrients_index)
+
+    def __len__(self):
+        return len(nutrients_index)
+
+    def __contains__(self, data_name):
+        return data_name in nutrients_index
+
+
 class Food:
     """Defines food that consists of nutrients."""
-    def __init__(self, name='', description='', amount=0):
+    def __init__(self, name='', description='', amount=0, values=None):
         self.name = name
         self.description = description
         self.amount = amount
-        self.nutrients = dict()  # key: nutrient's data_name, value: amount
-        for nutrient in nutrients_list:
-            self.nutrients[nutrient.data_name] = 0  # nutrient amount is zero by default
+        # nutrient amounts indexed as nutrients_list, nutrient amount is zero by default
+        self.values = np.zeros(len(nutrients_list)) if values is None else values
+        self.nutrients = NutrientsView(self.values)  # key: nutrient's data_name, value: amount
 
     def to_json(self, indent):
-        return json.dumps(self, default=lambda obj: obj.__dict__, indent=indent)
+        data = {
+            'name': self.name,
+            'description': self.description,
+            'amount': self.amount,
+            'nutrients': dict(self.nutrients),
+        }
+        return json.dumps(data, indent=indent)
 
     @staticmethod
     def from_json(json_file):
@@ -40,100 +75,235 @@ class Food:
             food.description = data['description']
             food.amount = data['amount']
             for ntr, amt in data['nutrients'].items():
-                food.nutrients[ntr] = amt
+                if ntr in nutrients_index:
+                    food.nutrients[ntr] = amt
         return food
 
     def multiply(self, m):
         self.amount *= m
-        for nutrient in nutrients_list:
-            self.nutrients[nutrient.data_name] *= m
+        self.values *= m
 
     def add(self, other_food):
         self.amount += other_food.amount
-        for nutrient in nutrients_list:
-            self.nutrients[nutrient.data_name] += other_food.nutrients[nutrient.data_name]
+        self.values += other_food.values
 
 
 class FoodTotal(Food):
     """A food total is used to store combined foods."""
-    def __init__(self, name):
-        super().__init__(name=name, description='', amount=0)
+    def __init__(self, name, amount=0, values=None):
+        super().__init__(name=name, description='', amount=amount, values=values)
+
+
+class FoodStore(Mapping):
+    """Read-only mapping of food names to foods, built on demand from the compiled catalog.
+
+    The name index is read from the catalog, so no food file is read to build the store.
+    Only the foods that are looked up are built, and the most recently used ones are kept
+    in a cache bounded to cache_size foods.
+    """
+    def __init__(self, catalog, cache_size=1024):
+        self.catalog = catalog
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # key: food name, value: food, least recently used first
+        self.name_index = None  # loaded on first unknown food name
+
+    def __getitem__(self, name):
+        food = self.cache.get(name)
+        if food is not None:
+            self.cache.move_to_end(name)
+            return food
+        row = self.catalog.index[name]
+        if metrics.enabled:
+            metrics.count('foods_built')  # foods copied from the catalog
+        food = Food(name, self.catalog.descriptions[row], float(self.catalog.amounts[row]),
+                    values=self.catalog.matrix[row].copy())  # catalog matrix is read-only
+        self.cache[name] = food
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return food
+
+    def __contains__(self, name):
+        return name in self.catalog.index
+
+    def __iter__(self):
+        return iter(self.catalog.names)  # sorted by name
+
+    def __len__(self):
+        return len(self.catalog)
+
+    def __reduce__(self):
+        return FoodStore, (self.catalog, self.cache_size)
+
+    def get_name_index(self):
+        if self.name_index is None:
+            self.name_index = load_name_index(self.catalog)
+        return self.name_index
+
+    def resolve(self, name):
+        """Return name of the food name is a casing variation or a misspelling of, or None."""
+        row = self.get_name_index().resolve(name)
+        return None if row is None else self.catalog.names[row]
+
+    def suggest(self, name, limit=3):
+        """Return names of the foods closest to name."""
+        return [self.catalog.names[row] for row, _ in self.get_name_index().suggest(name, limit)]
 
 
-def load_foods():
-    """Load all foods defined in dedicated configuration directory."""
-    foods = dict()
-    for file in [Path(f) for f in os.listdir(config.foods_dir)]:
-        if file.suffix == '.json':
-            food = Food.from_json(Path(config.foods_dir, file))
-            foods[food.name] = food
-    return OrderedDict(sorted(foods.items()))
+def load_foods(cache_size=1024):
+    """Load all foods defined in dedicated configuration directory, foods are built on demand."""
+    return FoodStore(load_catalog(), cache_size)
 
 
 class Meal:
     """Defines meal that consists of foods."""
+    @metrics.timed_function('meal_compute')
     def __init__(self, unit, data, foods_dict):
         self.name = data["name"]
         self.foods = []
+        references, amounts = [], []
         for data_food in data["foods"]:
             food_name = data_food["food"]
+            if food_name not in foods_dict and isinstance(foods_dict, FoodStore):
+                resolved = foods_dict.resolve(food_name)
+                if resolved:
+                    print(f"WARNING: unknown food '{food_name}' resolved to '{resolved}'")
+                    food_name = resolved
             if food_name not in foods_dict:
-                print(f"ERROR: food '{food_name}' is unknown")
+                suggestions = foods_dict.suggest(food_name) if isinstance(foods_dict, FoodStore) else []
+                did_you_mean = f", did you mean {' or '.join(repr(s) for s in suggestions)}?" if suggestions else ''
+                print(f"ERROR: food '{food_name}' is unknown{did_you_mean}")
             else:
-                food = copy.deepcopy(foods_dict[food_name])  # do not modify object in dict
-                amount = convert_amount(data_food["amount"], unit)
-                food.multiply(amount / food.amount)
-                self.foods.append(food)
+                references.append(foods_dict[food_name])
+                amounts.append(convert_amount(data_food["amount"], unit))
+        # scale food profiles to their amounts: foods x nutrients matrix, one row per food
+        profiles = np.array([food.values for food in references]).reshape(len(references), len(nutrients_list))
+        scales = np.array([amount / food.amount for food, amount in zip(references, amounts)])
+        scaled = profiles * scales[:, None]
+        for i, food in enumerate(references):
+            self.foods.append(Food(food.name, food.description, food.amount * float(scales[i]), values=scaled[i]))
         # calculate total nutrients
-        self.total = FoodTotal(name='TOTAL')
-        for food in self.foods:
-            self.total.add(food)
+        self.total = FoodTotal(name='TOTAL', amount=sum(food.amount for food in self.foods),
+                               values=scales @ profiles)
+
+
+def load_dri_tables():
+    """Load all Dietary Reference Intakes defined in dedicated configuration directory or food database."""
+    database = open_database(read_only=True)
+    if database:
+        dri_tables = database.get_dri_tables()
+        database.close()
+        return dri_tables
+    dri_tables = dict()  # key: DRI name, value: DRI dictionary
+    for dri_file in sorted(config.dri_dir.glob('*.json')):
+        data = config.read_json(dri_file)
+        if data:
+            dri_tables[dri_file.stem] = data['dietary_reference_intakes']
+    return dri_tables
+
+
+def get_content_hash(data):
+    """Return hash of JSON serializable data, independent of keys order."""
+    return hashlib.blake2b(json.dumps(data, sort_keys=True).encode(), digest_size=16).hexdigest()
 
 
 class MealPlan:
     """Defines meal plan that consists of meals."""
-    def __init__(self, data, foods_dict):
-        self.name = data["name"]
-        self.unit = data["unit"]
+    def __init__(self, data, foods_dict, dri_tables=None):
+        self.foods_dict = foods_dict
+        self.dri_tables = dri_tables
         self.meals = []
-        for meal_data in data["meals"]:
-            self.meals.append(Meal(self.unit, meal_data, foods_dict))
-        # calculate total nutrients
-        self.total = FoodTotal(name='GRAND TOTAL')
-        for meal in self.meals:
-            self.total.add(meal.total)
+        self.meal_hashes = []  # content hash of each meal
+        self.header_hash = None  # content hash of unit, target and DRI
+        self.total = None
+        self.update(data)
+
+    @metrics.timed_function('meal_plan_update')
+    def update(self, data):
+        """Update meal plan to data, recomputing only the meals that changed, return number of recomputed meals.
+
+        The meal plan is only changed once data is fully analyzed, so that it is left unchanged when data is invalid.
+        """
+        unit = data["unit"]
+        # reuse meals whose content, including the unit of their amounts, did not change
+        hashes = [get_content_hash([unit, meal_data]) for meal_data in data["meals"]]
+        previous = dict()  # key: content hash, value: previous meals
+        for meal_hash, meal in zip(self.meal_hashes, self.meals):
+            previous.setdefault(meal_hash, []).append(meal)
+        meals, added = [], []
+        for meal_hash, meal_data in zip(hashes, data["meals"]):
+            if previous.get(meal_hash):
+                meals.append(previous[meal_hash].pop())
+            else:
+                meal = Meal(unit, meal_data, self.foods_dict)
+                meals.append(meal)
+                added.append(meal)
+        removed = [meal for unused in previous.values() for meal in unused]
+        # calculate total nutrients, by delta when most meals did not change
+        amount = sum(meal.total.amount for meal in meals)
+        if self.total is not None and 2 * (len(added) + len(removed)) <= len(meals):
+            values = self.total.values.copy()
+            for meal in added:
+                values += meal.total.values
+            for meal in removed:
+                values -= meal.total.values
+        else:
+            totals = np.array([meal.total.values for meal in meals]).reshape(len(meals), len(nutrients_list))
+            values = totals.sum(axis=0)
+        total = FoodTotal(name='GRAND TOTAL', amount=amount, values=values)
         # calculate energy distribution
-        self.distribution = EnergyDistribution(self.total.nutrients["protein"],
-                                               self.total.nutrients["carbohydrate"],
-                                               self.total.nutrients["fat"])
-        # load DRI
-        self.dri_name = data["dietary_reference_intakes"]
-        self.dri_dict = self.load_dietary_reference_intakes()
-        # calculate target
-        self.target = Target(
-            convert_amount(data["target"]["body_mass"], self.unit),
-            data["target"]["body_fat_percent"] / 100,
-            data["target"]["activity_factor"],
-            data["target"]["minimum_protein_factor"],
-            data["target"]["minimum_fat_factor"],
-        )
-        # add target to DRI
-        self.dri_dict['energy'] = self.target.basal_metabolic_rate
-        self.dri_dict['protein'] = self.target.minimum_protein
-        self.dri_dict['fat'] = self.target.minimum_fat
-        # calculate DRI ratio
-        self.dri_ratio = dict()  # key: nutrient's data_name, value: DRI ratio
-        for ntr_name in [nutrient.data_name for nutrient in nutrients_list]:
-            if ntr_name in self.dri_dict:
-                self.dri_ratio[ntr_name] = self.total.nutrients[ntr_name] / self.dri_dict[ntr_name]
-
-    def load_dietary_reference_intakes(self):
-        dri_file = Path(config.dri_dir, f'{self.dri_name}.json')
-        if not dri_file.exists():
-            print(f"ERROR: DRI file '{dri_file.absolute()}' does not exist")
+        distribution = EnergyDistribution(total.nutrients["protein"], total.nutrients["carbohydrate"],
+                                          total.nutrients["fat"])
+        header_hash = get_content_hash([unit, data["target"], data["dietary_reference_intakes"]])
+        if header_hash != self.header_hash:
+            dri_name = data["dietary_reference_intakes"]
+            target = Target.from_json(data["target"], unit)
+            dri_dict = get_target_dri(dri_name, target, self.dri_tables)
+        else:
+            dri_name, target, dri_dict = self.dri_name, self.target, self.dri_dict
+        # nutrients with a DRI, and their DRI ratio
+        dri_names = [nutrient.data_name for nutrient in nutrients_list if nutrient.data_name in dri_dict]
+        dri_indices = np.array([nutrients_index[ntr_name] for ntr_name in dri_names], dtype=int)
+        ratios = total.values[dri_indices] / np.array([dri_dict[ntr_name] for ntr_name in dri_names], dtype=float)
+        name = data["name"]
+        # data is valid: update meal plan
+        if metrics.enabled:
+            metrics.count('meals_reused', len(meals) - len(added))
+        self.name, self.unit = name, unit
+        self.meals, self.meal_hashes = meals, hashes
+        self.total, self.distribution = total, distribution
+        self.header_hash, self.dri_name, self.target, self.dri_dict = header_hash, dri_name, target, dri_dict
+        self.dri_names, self.dri_indices = dri_names, dri_indices
+        self.dri_ratio = dict(zip(dri_names, ratios.tolist()))  # key: nutrient's data_name, value: DRI ratio
+        return len(added)
+
+
+def load_dietary_reference_intakes(dri_name):
+    database = open_database(read_only=True)
+    if database:
+        dri_dict = database.get_dri(dri_name)
+        database.close()
+        if dri_dict is None:
+            print(f"ERROR: DRI '{dri_name}' does not exist in food database '{database.database_file.absolute()}'")
             return dict()
-        data = config.read_json(dri_file)
-        return data['dietary_reference_intakes'] if data else dict()
+        return dri_dict
+    dri_file = Path(config.dri_dir, f'{dri_name}.json')
+    if not dri_file.exists():
+        print(f"ERROR: DRI file '{dri_file.absolute()}' does not exist")
+        return dict()
+    data = config.read_json(dri_file)
+    return data['dietary_reference_intakes'] if data else dict()
+
+
+def get_target_dri(dri_name, target, dri_tables=None):
+    """Return DRI dictionary completed with energy, protein and fat of target."""
+    if dri_tables is not None and dri_name in dri_tables:
+        dri_dict = dict(dri_tables[dri_name])  # do not modify preloaded DRI
+    else:
+        dri_dict = load_dietary_reference_intakes(dri_name)
+    dri_dict['energy'] = target.basal_metabolic_rate
+    dri_dict['protein'] = target.minimum_protein
+    dri_dict['fat'] = target.minimum_fat
+    return dri_dict
 
 
 class Target:
@@ -151,6 +321,16 @@ class Target:
         self.minimum_protein = self.lean_body_mass * self.minimum_protein_factor / 1000  # kg to g
         self.minimum_fat = self.lean_body_mass * self.minimum_fat_factor / 1000  # kg to g
 
+    @staticmethod
+    def from_json(data, unit):
+        return Target(
+            convert_amount(data["body_mass"], unit),
+            data["body_fat_percent"] / 100,
+            data["activity_factor"],
+            data["minimum_protein_factor"],
+            data["minimum_fat_factor"],
+        )
+
 
 class EnergyDistribution:
     """Defines an energy distribution in fats, proteins and carbs."""
@@ -159,6 +339,8 @@ class EnergyDistribution:
         self.energy_carb = carb_amount * energy_carbohydrate_factor
         self.energy_fat = fat_amount * energy_fat_factor
         self.energy_total = self.energy_protein + self.energy_carb + self.energy_fat
-        self.protein_ratio = self.energy_protein / self.energy_total
-        self.carbohydrate_ratio = self.energy_carb / self.energy_total
-        self.fat_ratio = self.energy_fat / self.energy_total
+        # foods without protein, carbohydrate nor fat, such as salt or water, have no energy to distribute
+        total = self.energy_total if self.energy_total else 1
+        self.protein_ratio = self.energy_protein / total
+        self.carbohydrate_ratio = self.energy_carb / total
+        self.fat_ratio = self.energy_fat / total
@@ -0,0 +1,130 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""Counters and timers of analysis runs, exported as a Prometheus text file or as JSON lines.
+
+Instrumentation is disabled unless enabled by the command. Instrumented code checks the
+enabled flag before counting, and timed functions are called directly while disabled, so that
+disabled instrumentation costs a flag check. Counts are added once per call of the instrumented
+functions, never once per cell or per nutrient.
+
+Worker processes collect their metrics after each task and the parent process merges them.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+
+enabled = False
+counters = dict()  # key: metric name, value: count
+timers = dict()  # key: metric name, value: [number of timed blocks, total seconds]
+lock = threading.Lock()  # metrics are updated by the import threads
+
+
+def enable(enable_metrics=True):
+    global enabled
+    enabled = enable_metrics
+
+
+def count(name, value=1):
+    with lock:
+        counters[name] = counters.get(name, 0) + value
+
+
+class Timer:
+    """Context manager adding the duration of its block to a timer."""
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        with lock:
+            timer = timers.setdefault(self.name, [0, 0.0])
+            timer[0] += 1
+            timer[1] += elapsed
+        return False
+
+
+def timed_function(name):
+    """Decorate function to time its calls as name, when enabled."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            with Timer(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def collect(reset=False):
+    """Return {'counters': {name: count}, 'timers': {name: [count, seconds]}} snapshot of metrics."""
+    with lock:
+        snapshot = {'counters': dict(counters), 'timers': {name: list(timer) for name, timer in timers.items()}}
+        if reset:
+            counters.clear()
+            timers.clear()
+    return snapshot
+
+
+def merge(snapshot):
+    """Add metrics collected by another process."""
+    with lock:
+        for name, value in snapshot['counters'].items():
+            counters[name] = counters.get(name, 0) + value
+        for name, (n_blocks, seconds) in snapshot['timers'].items():
+            timer = timers.setdefault(name, [0, 0.0])
+            timer[0] += n_blocks
+            timer[1] += seconds
+
+
+def format_prometheus(snapshot, command, timestamp):
+    """Return metrics in Prometheus text exposition format, labeled by command."""
+    label = f'{{command="{command}"}}'
+    lines = [
+        '# HELP nutrimetrics_run_timestamp_seconds End of the run, in seconds since the epoch.',
+        '# TYPE nutrimetrics_run_timestamp_seconds gauge',
+        f'nutrimetrics_run_timestamp_seconds{label} {timestamp:.3f}',
+    ]
+    for name, value in sorted(snapshot['counters'].items()):
+        lines.append(f'# TYPE nutrimetrics_{name}_total counter')
+        lines.append(f'nutrimetrics_{name}_total{label} {value}')
+    for name, (n_blocks, seconds) in sorted(snapshot['timers'].items()):
+        lines.append(f'# TYPE nutrimetrics_{name}_seconds summary')
+        lines.append(f'nutrimetrics_{name}_seconds_sum{label} {seconds:.6f}')
+        lines.append(f'nutrimetrics_{name}_seconds_count{label} {n_blocks}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_metrics(metrics_file, command):
+    """Write metrics of the run to file.
+
+    A .prom file is replaced by the metrics of the run in Prometheus text format, to be read by the
+    textfile collector of the node exporter. Any other file gets the run appended as a JSON line.
+    """
+    metrics_file = Path(metrics_file)
+    snapshot = collect()
+    timestamp = time.time()
+    if metrics_file.suffix == '.prom':
+        # atomically replaced, so that the collector never reads a partial file
+        tmp_file = Path(metrics_file.parent, f'.{metrics_file.name}.{os.getpid()}.tmp')
+        with open(tmp_file, 'w') as file:
+            file.write(format_prometheus(snapshot, command, timestamp))
+        os.replace(tmp_file, metrics_file)
+    else:
+        timers_seconds = {name: {'count': n_blocks, 'seconds': seconds}
+                          for name, (n_blocks, seconds) in snapshot['timers'].items()}
+        with open(metrics_file, 'a') as file:
+            file.write(json.dumps({'timestamp': timestamp, 'command': command, 'counters': snapshot['counters'],
+                                   'timers': timers_seconds}) + '\n')
+    print(f'Metrics written to {metrics_file.absolute()}')
@@ -0,0 +1,193 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""Fuzzy index of food names and descriptions."""
+
+import os
+import re
+from pathlib import Path
+import numpy as np
+
+
+resolve_similarity = 0.8  # minimum edit similarity of a misspelled food name to be resolved
+resolve_margin = 0.1  # minimum edit similarity lead of the resolved food over the next one
+
+
+word_pattern = re.compile(r'\w+')
+
+
+def normalize(text):
+    """Return lowercase text of words separated by a space."""
+    return ' '.join(word_pattern.findall(text.lower()))
+
+
+def get_trigrams(text):
+    """Return unique trigram codes of normalized text, words padded with spaces."""
+    data = np.frombuffer(f' {text} '.encode(), dtype=np.uint8).astype(np.int64)
+    return np.unique((data[:-2] << 16) | (data[1:-1] << 8) | data[2:])
+
+
+def edit_distance(a, b):
+    """Return Levenshtein distance between strings a and b."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def edit_similarity(a, b):
+    return 1 - edit_distance(a, b) / max(len(a), len(b), 1)
+
+
+class NameIndex:
+    """Trigram inverted index of food names and descriptions.
+
+    Names and descriptions are normalized, and the trigrams of all of them are extracted and sorted
+    in a few array operations, so that the index of a large catalog is built in seconds, and saved
+    to be loaded in milliseconds. Candidates of a query are the foods sharing at least half of its
+    trigrams, ranked by cosine similarity of trigram sets, then names are ranked by edit distance to
+    resolve misspelled food names.
+    """
+    min_overlap = 0.5  # minimum ratio of query trigrams shared by the matching names or descriptions
+    max_frequency = 0.05  # maximum ratio of documents having a query trigram for it to be compared
+
+    def __init__(self, names, normalized_names, trigrams, offsets, postings):
+        self.names = names
+        self.n_foods = len(names)
+        self.normalized = dict()  # key: normalized name, value: row of first food
+        for row, normalized in enumerate(normalized_names):
+            self.normalized.setdefault(normalized, row)
+        self.normalized_names = normalized_names
+        # documents are names then descriptions: rows n_foods and more are descriptions
+        self.trigrams = trigrams  # sorted trigram codes
+        self.offsets = offsets  # documents of trigram i: postings[offsets[i]:offsets[i + 1]]
+        self.postings = postings  # sorted documents of each trigram
+        self.doc_sizes = np.bincount(postings, minlength=2 * len(names))  # trigrams of each document
+
+    @staticmethod
+    def build(names, descriptions=None):
+        normalized_names = [normalize(name) for name in names]
+        documents = normalized_names + [normalize(description) for description in descriptions or []]
+        # trigram codes of all documents joined by newlines, excluding trigrams across documents
+        data = np.frombuffer('\n'.join(f' {doc} ' for doc in documents).encode(), dtype=np.uint8).astype(np.int64)
+        codes = (data[:-2] << 16) | (data[1:-1] << 8) | data[2:]
+        starts = np.concatenate([[0], np.cumsum([len(f' {doc} '.encode()) + 1 for doc in documents])])
+        doc_ids = np.repeat(np.arange(len(documents), dtype=np.int64), np.diff(starts))[:len(codes)]
+        keep = (data[:-2] != 10) & (data[1:-1] != 10) & (data[2:] != 10)
+        # unique (trigram, document) pairs sorted by trigram then document
+        pairs = np.sort((codes[keep] << 32) | doc_ids[keep])
+        pairs = pairs[np.concatenate([[True], pairs[1:] != pairs[:-1]])]
+        codes = pairs >> 32
+        firsts = np.flatnonzero(np.concatenate([[True], codes[1:] != codes[:-1]]))
+        offsets = np.concatenate([firsts, [len(codes)]])
+        return NameIndex(names, normalized_names, codes[firsts], offsets, (pairs & 0xFFFFFFFF).astype(np.int32))
+
+    def save(self, index_file, version):
+        """Atomically save index arrays along with the version of the indexed catalog."""
+        tmp_file = Path(index_file.parent, f'.{index_file.name}.{os.getpid()}.tmp')
+        with open(tmp_file, 'wb') as file:
+            np.savez(file, version=version, trigrams=self.trigrams, offsets=self.offsets, postings=self.postings,
+                     normalized_names=np.frombuffer('\n'.join(self.normalized_names).encode(), dtype=np.uint8))
+        os.replace(tmp_file, index_file)
+
+    @staticmethod
+    def load(index_file, names, version):
+        """Return index saved for the version of the catalog of names, or None if missing or outdated."""
+        try:
+            with np.load(index_file) as data:
+                if not np.array_equal(data['version'], version):
+                    return None
+                normalized_names = data['normalized_names'].tobytes().decode().split('\n')
+                if len(normalized_names) != len(names):
+                    return None
+                return NameIndex(names, normalized_names, data['trigrams'], data['offsets'], data['postings'])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def search(self, query, limit=10):
+        """Return up to limit (row, score) of the foods whose name or description best match query."""
+        normalized = normalize(query)
+        trigrams = get_trigrams(normalized)
+        if not len(self.trigrams):
+            return []
+        positions = np.minimum(np.searchsorted(self.trigrams, trigrams), len(self.trigrams) - 1)
+        found = self.trigrams[positions] == trigrams
+        lows = np.where(found, self.offsets[positions], 0)
+        highs = np.where(found, self.offsets[positions + 1], 0)
+        if not len(trigrams) or not (highs - lows).any():
+            return []
+        # like stop words, trigrams found in most documents are ignored unless the query has only such trigrams
+        specific = highs - lows <= self.max_frequency * len(self.doc_sizes)
+        if specific.any():
+            trigrams, lows, highs = trigrams[specific], lows[specific], highs[specific]
+        # a document sharing at least min_shared trigrams has one of the len - min_shared + 1 rarest trigrams:
+        # candidates are the documents of the rarest trigrams, then their other shared trigrams are counted
+        min_shared = max(1, int(np.ceil(self.min_overlap * len(trigrams))))
+        order = np.argsort(highs - lows, kind='stable')
+        n_rarest = len(trigrams) - min_shared + 1
+        docs, shared = np.unique(np.concatenate([self.postings[lows[i]:highs[i]] for i in order[:n_rarest]]),
+                                 return_counts=True)
+        for i in order[n_rarest:]:
+            posting = self.postings[lows[i]:highs[i]]  # sorted documents
+            if len(posting):
+                positions = np.minimum(np.searchsorted(posting, docs), len(posting) - 1)
+                shared += posting[positions] == docs
+        keep = shared >= min_shared
+        docs, shared = docs[keep], shared[keep]
+        scores = shared / np.sqrt(len(trigrams) * self.doc_sizes[docs])
+        scores[docs >= self.n_foods] *= 0.9  # names match better than descriptions
+        if len(docs) > 2 * limit:
+            # each food has at most 2 documents: the best 2 * limit documents have at least limit foods
+            best = np.argpartition(-scores, 2 * limit - 1)[:2 * limit]
+            docs, scores = docs[best], scores[best]
+        rows = docs % self.n_foods
+        order = np.lexsort((rows, -scores))  # best score first, then by name
+        results, seen = [], set()
+        exact = self.normalized.get(normalized)
+        if exact is not None:
+            results.append((exact, 1.0))
+            seen.add(exact)
+        for i in order:
+            if len(results) >= limit:
+                break
+            row = int(rows[i])
+            if row not in seen:
+                seen.add(row)
+                results.append((row, float(scores[i])))
+        return results
+
+    def suggest(self, name, limit=5, n_candidates=20):
+        """Return up to limit (row, edit similarity) of the food names closest to name."""
+        normalized = normalize(name)
+        ranked = [(row, edit_similarity(normalized, self.normalized_names[row]))
+                  for row, _ in self.search(name, n_candidates)]
+        ranked.sort(key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
+
+    def resolve(self, name):
+        """Return row of the food name is a casing variation or a misspelling of, or None if ambiguous."""
+        normalized = normalize(name)
+        if normalized in self.normalized:
+            return self.normalized[normalized]
+        ranked = self.suggest(name, limit=2)
+        if ranked and ranked[0][1] >= resolve_similarity and \
+                (len(ranked) == 1 or ranked[0][1] - ranked[1][1] >= resolve_margin):
+            return ranked[0][0]
+        return None
+
+
+def load_name_index(catalog):
+    """Return name index of catalog, loaded from its index file, or built and saved if outdated."""
+    index_file = Path(catalog.catalog_file.parent, f'{catalog.catalog_file.stem}_names.npz')
+    stat = catalog.catalog_file.stat()
+    version = np.array([stat.st_mtime_ns, stat.st_size])
+    index = NameIndex.load(index_file, catalog.names, version)
+    if index is None:
+        index = NameIndex.build(catalog.names, catalog.descriptions)
+        index.save(index_file, version)
+    return index
@@ -94,6 +94,10 @@ nutrients_dict = dict()
 for nutrient in nutrients_list:
     nutrients_dict[nutrient.data_name] = nutrient
 
+nutrients_index = dict()  # key: nutrient's data_name, value: index in nutrients_list
+for i, nutrient in enumerate(nutrients_list):
+    nutrients_index[nutrient.data_name] = i
+
 fats = ['fat', 'mono-unsaturated', 'poly-unsaturated', 'saturated', 'trans', 'cholesterol']
 
 proteins = ['protein', 'histidine', 'isoleucine', 'leucine', 'lysine', 'methionine', 'phenylalanine', 'threonine',
@@ -111,3 +115,15 @@ vitamins = ['vitamin-a', 'retinol', 'thiamin', 'riboflavin', 'niacin', 'pantothe
             'menaquinone']
 
 alkaloids = ['caffeine', 'theobromine']
+
+# key: group name, value: nutrient's data_names of the group
+nutrient_groups = {
+    'energy': ['energy'],
+    'water': ['water'],
+    'proteins': proteins,
+    'carbohydrates': carbohydrates,
+    'fats': fats,
+    'minerals': minerals,
+    'vitamins': vitamins,
+    'alkaloids': alkaloids,
+}
@@ -0,0 +1,118 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""Meal plan optimizer solving for food amounts that best meet the Dietary Reference Intakes.
+
+The food amounts are the solution of a linear program over the food x nutrient matrix:
+
+- the ratio to DRI of each nutrient with a DRI plus its deficit, minus its excess, equals 1
+- the protein and fat totals are at least the minimum protein and fat of the target
+- the amount of each candidate food is within its min/max amounts
+- the objective is the weighted sum of deficits and excesses, energy deviating from the
+  target's basal metabolic rate on either side being weighted the most
+
+Requires the optional scipy package, whose HiGHS solver runs locally.
+"""
+
+import time
+import numpy as np
+from nutrimetrics.meals import Target, get_target_dri
+from nutrimetrics.nutrients import nutrients_list, nutrients_index
+from nutrimetrics.units import convert_amount
+
+
+default_weights = {
+    'deficit': 1.0,  # weight of the relative deficit of each nutrient
+    'excess': 0.01,  # weight of the relative excess of each nutrient
+    'energy': 10.0,  # weight of the relative deviation of energy, in both directions
+}
+
+
+def convert_to_unit(amount, unit):
+    """Convert internal amount to specified unit."""
+    return amount / convert_amount(1.0, unit)
+
+
+class MealPlanOptimizer:
+    """Solves for the amounts of candidate foods that minimize the deviation from the DRI of a target."""
+    def __init__(self, data, foods_dict, dri_tables=None):
+        try:
+            from scipy.optimize import linprog
+        except ImportError:
+            raise ImportError('the meal plan optimizer requires the scipy package: pip install scipy')
+        self.linprog = linprog
+        self.data = data
+        self.unit = data["unit"]
+        self.target = Target.from_json(data["target"], self.unit)
+        self.dri_dict = get_target_dri(data["dietary_reference_intakes"], self.target, dri_tables)
+        self.weights = dict(default_weights, **data.get("weights", dict()))
+        self.foods = []  # candidate foods
+        self.meals = []  # meal name of each candidate food
+        min_amounts, max_amounts = [], []
+        for candidate in data["candidates"]:
+            food_name = candidate["food"]
+            if food_name not in foods_dict:
+                print(f"ERROR: food '{food_name}' is unknown")
+                continue
+            self.foods.append(foods_dict[food_name])
+            self.meals.append(candidate.get("meal", "Optimized"))
+            min_amounts.append(convert_amount(candidate.get("min_amount", 0), self.unit))
+            max_amount = candidate.get("max_amount")
+            max_amounts.append(None if max_amount is None else convert_amount(max_amount, self.unit))
+        self.bounds = list(zip(min_amounts, max_amounts))
+        # nutrient amounts per gram of each candidate food: foods x nutrients matrix
+        profiles = np.array([food.values for food in self.foods]).reshape(len(self.foods), len(nutrients_list))
+        self.per_gram = profiles / np.array([food.amount for food in self.foods])[:, None]
+        self.dri_names = [nutrient.data_name for nutrient in nutrients_list
+                          if self.dri_dict.get(nutrient.data_name, 0) > 0]
+
+    def solve(self):
+        """Return optimal amount of each candidate food, or None if the problem is infeasible."""
+        start = time.perf_counter()
+        n_foods, n_dri = len(self.foods), len(self.dri_names)
+        dri_indices = [nutrients_index[data_name] for data_name in self.dri_names]
+        dri_values = np.array([self.dri_dict[data_name] for data_name in self.dri_names])
+        # variables: food amounts, nutrient deficits, nutrient excesses
+        deficit_weights = np.full(n_dri, self.weights['deficit'])
+        excess_weights = np.full(n_dri, self.weights['excess'])
+        if 'energy' in self.dri_names:
+            energy_i = self.dri_names.index('energy')
+            deficit_weights[energy_i] = excess_weights[energy_i] = self.weights['energy']
+        cost = np.concatenate([np.zeros(n_foods), deficit_weights, excess_weights])
+        # ratio to DRI + deficit - excess = 1
+        ratios = (self.per_gram[:, dri_indices] / dri_values).T  # nutrients x foods
+        a_eq = np.hstack([ratios, np.eye(n_dri), -np.eye(n_dri)])
+        b_eq = np.ones(n_dri)
+        # minimum protein and fat: -total <= -minimum
+        a_ub = np.zeros((2, n_foods + 2 * n_dri))
+        a_ub[0, :n_foods] = -self.per_gram[:, nutrients_index['protein']]
+        a_ub[1, :n_foods] = -self.per_gram[:, nutrients_index['fat']]
+        b_ub = np.array([-self.target.minimum_protein, -self.target.minimum_fat])
+        bounds = self.bounds + [(0, None)] * (2 * n_dri)
+        result = self.linprog(cost, A_ub=a_ub, b_ub=b_ub, A_eq=a_eq, b_eq=b_eq, bounds=bounds, method='highs')
+        self.seconds = time.perf_counter() - start
+        if result.status != 0:
+            print(f'ERROR: meal plan optimization failed: {result.message}')
+            return None
+        return result.x[:n_foods]
+
+    def get_meal_plan(self, amounts, name=None, decimals=1):
+        """Return meal plan data of the candidate foods with a non-zero amount, grouped by meal."""
+        meals = dict()  # key: meal name, value: foods
+        for food, meal_name, amount in zip(self.foods, self.meals, amounts):
+            amount = round(convert_to_unit(float(amount), self.unit), decimals)
+            if amount > 0:
+                meals.setdefault(meal_name, []).append({"food": food.name, "amount": amount})
+        return {
+            "name": name if name else self.data["name"],
+            "unit": self.unit,
+            "target": self.data["target"],
+            "dietary_reference_intakes": self.data["dietary_reference_intakes"],
+            "meals": [{"name": meal_name, "foods": foods} for meal_name, foods in meals.items()],
+        }
+
+    def get_dri_ratio(self, amounts):
+        """Return DRI ratio of the total of food amounts, key: nutrient's data_name."""
+        totals = amounts @ self.per_gram
+        return {data_name: float(totals[nutrients_index[data_name]]) / self.dri_dict[data_name]
+                for data_name in self.dri_names}
@@ -0,0 +1,53 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""Phase by phase profile of a command, from interpreter startup to the end of the command.
+
+Phases are consecutive: each phase starts when the previous one ends, so that the phases add up
+to the whole run of the command. Interpreter startup is measured as the CPU time spent before
+the command module was imported, startup being CPU bound.
+"""
+
+import time
+from pathlib import Path
+
+
+class CommandProfile:
+    """Records the duration of the phases of a command, and optionally its cProfile statistics."""
+    def __init__(self, command, start, startup_cpu):
+        self.command = command
+        self.enabled = False
+        self.phases = [('interpreter startup (CPU)', startup_cpu)]  # (phase name, seconds)
+        self.last = start  # end of last phase, in perf_counter() seconds
+        self.profile_file = None
+        self.profiler = None
+
+    def enable(self, profile_file=None):
+        """Print phases when the command ends, and save the cProfile statistics of the next phases to file."""
+        self.enabled = True
+        if profile_file:
+            import cProfile
+            self.profile_file = Path(profile_file)
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def end_phase(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    def report(self):
+        """Print duration of each phase, and save cProfile statistics, if enabled."""
+        if not self.enabled:
+            return
+        if self.profiler:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_file)
+        width = max(len(name) for name, _ in self.phases)
+        print(f'Profile of {self.command}:')
+        for name, seconds in self.phases:
+            print(f'  {name:<{width}} {seconds * 1000:9.1f} ms')
+        print(f"  {'total':<{width}} {sum(seconds for _, seconds in self.phases) * 1000:9.1f} ms")
+        if self.profiler:
+            print(f'cProfile statistics saved in {self.profile_file.absolute()}, '
+                  f'read with: python -m pstats {self.profile_file}')
@@ -0,0 +1,114 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""Defines multi-day programs of daily meal plans.
+
+A program has the unit, target and Dietary Reference Intakes of a meal plan, and a list of days
+instead of a list of meals. Each day has a name and either its meals or the name of one of the
+program's day templates, so that a 12 week program only defines a few different days:
+
+    "templates": {"workout": [meals...], "rest": [meals...]},
+    "days": [
+        {"name": "Week 1 - Monday", "template": "workout"},
+        {"name": "Week 1 - Tuesday", "meals": [meals...], "target": {...}},
+        ...
+    ]
+
+A day may override the target of the program, e.g. to follow the body mass of a client.
+"""
+
+from collections import deque
+import numpy as np
+import nutrimetrics.metrics as metrics
+from nutrimetrics.meals import MealPlan, EnergyDistribution, get_content_hash
+from nutrimetrics.nutrients import nutrients_list
+
+
+def is_program(data):
+    return "days" in data
+
+
+def iter_program_days(data):
+    """Yield (day name, meal plan data) of each day of program."""
+    templates = data.get("templates", dict())
+    for i, day in enumerate(data["days"], start=1):
+        day_name = day.get("name", f"Day {i}")
+        if "template" in day:
+            if day["template"] not in templates:
+                raise KeyError(f"day '{day_name}' template '{day['template']}' is unknown")
+            meals = templates[day["template"]]
+        else:
+            meals = day["meals"]
+        yield day_name, {
+            "name": f'{data["name"]} - {day_name}',
+            "unit": data["unit"],
+            "target": day.get("target", data["target"]),
+            "dietary_reference_intakes": data["dietary_reference_intakes"],
+            "meals": meals,
+        }
+
+
+class ProgramDay:
+    """Defines the totals of a day of a program, and their rolling averages over the previous days."""
+    def __init__(self, name, amount, energy, distribution, dri_ratio,
+                 rolling_amount, rolling_energy, rolling_distribution, rolling_dri_ratio):
+        self.name = name
+        self.amount = amount
+        self.energy = energy
+        self.distribution = distribution
+        self.dri_ratio = dri_ratio  # key: nutrient's data_name, value: DRI ratio of the day
+        self.rolling_amount = rolling_amount
+        self.rolling_energy = rolling_energy
+        self.rolling_distribution = rolling_distribution
+        self.rolling_dri_ratio = rolling_dri_ratio  # key: nutrient's data_name, value: average DRI ratio
+
+
+class Program:
+    """Defines a multi-day program, aggregating its days as they are analyzed.
+
+    Days are analyzed one at a time by updating the same meal plan, so that only the meals of a
+    day that differ from the previous day are recomputed, and days identical to a previous day, such
+    as the days of a template, are not analyzed again. Only the totals of each day are kept: memory
+    grows with the number of days, not with the number of foods of the program. Rolling averages
+    over the last window days are computed from a queue of the window's daily totals.
+    """
+    @metrics.timed_function('program_analysis')
+    def __init__(self, data, foods_dict, dri_tables=None, window=7):
+        self.name = data["name"]
+        self.window = window
+        self.days = []
+        self.meal_plan = None  # meal plan of the last analyzed day
+        self.dri_names = []  # nutrients with a DRI in any day, in nutrients_list order
+        recent = deque(maxlen=window)  # ((amount, energy, protein, carbohydrate, fat), DRI ratios) of last days
+        has_dri = np.zeros(len(nutrients_list), dtype=bool)
+        analyzed = dict()  # key: content hash of day, value: totals of day, days of a template are analyzed once
+        for day_name, day_data in iter_program_days(data):
+            day_hash = get_content_hash([day_data[key] for key in ("unit", "target", "dietary_reference_intakes",
+                                                                   "meals")])
+            if day_hash not in analyzed:
+                if self.meal_plan is None:
+                    self.meal_plan = MealPlan(day_data, foods_dict, dri_tables)
+                else:
+                    self.meal_plan.update(day_data)
+                meal_plan = self.meal_plan
+                ratios = np.full(len(nutrients_list), np.nan)
+                ratios[meal_plan.dri_indices] = [meal_plan.dri_ratio[data_name] for data_name in meal_plan.dri_names]
+                total = meal_plan.total.nutrients
+                analyzed[day_hash] = ((meal_plan.total.amount, total["energy"], total["protein"],
+                                       total["carbohydrate"], total["fat"]), ratios, meal_plan.dri_indices,
+                                      meal_plan.distribution, meal_plan.dri_ratio)
+            totals, ratios, dri_indices, distribution, dri_ratio = analyzed[day_hash]
+            has_dri[dri_indices] = True
+            recent.append((totals, ratios))
+            amount, energy, protein, carbohydrate, fat = np.array([day[0] for day in recent]).mean(axis=0).tolist()
+            # days of the window without a DRI for a nutrient of the current day are ignored in its average
+            rolling_ratios = np.nanmean(np.array([day[1] for day in recent])[:, dri_indices], axis=0)
+            self.days.append(ProgramDay(
+                day_name, totals[0], totals[1], distribution, dri_ratio,
+                amount, energy, EnergyDistribution(protein, carbohydrate, fat),
+                dict(zip(dri_ratio, rolling_ratios.tolist()))))
+        if self.meal_plan is None:
+            raise ValueError(f"program '{self.name}' has no day")
+        self.dri_names = [nutrient.data_name for nutrient, found in zip(nutrients_list, has_dri) if found]
+        self.unit = self.meal_plan.unit
+        self.dri_name = self.meal_plan.dri_name
@@ -0,0 +1,254 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""Report writers used to output meal plan analyses.
+
+Besides Excel workbooks, analyses can be written as columnar tables, so that many meal plans
+can be appended into one dataset. Each analysis is described by the following tables, where
+nutrient amounts are stored in internal units (kcal and gram) in columns named after the
+nutrient's data_name:
+
+- foods: amount and nutrients of each food of each meal
+- meals: total amount and nutrients of each meal
+- total: grand total amount and nutrients of the meal plan
+- energy_distribution: energy and energy ratio of proteins, carbohydrates and fats
+- dri_ratio: amount, Dietary Reference Intake and ratio of each nutrient with a DRI
+
+Multi-day programs are described by a row per day, along with rolling averages over the last days:
+
+- program_days: amount, energy and energy ratio of proteins, carbohydrates and fats of each day
+- program_dri_ratio: DRI ratio of each nutrient with a DRI of each day
+"""
+
+import abc
+import csv
+import os
+import shutil
+from pathlib import Path
+import nutrimetrics.config as config
+from nutrimetrics.meals import FoodStore, get_content_hash
+from nutrimetrics.nutrients import nutrients_list
+from nutrimetrics.workbook import WorkbookGenerator
+
+
+nutrient_columns = [nutrient.data_name for nutrient in nutrients_list]
+
+
+def get_report_tables(plan_id, meal_plan):
+    """Return analysis tables of meal plan, key: table name, value: (columns, rows)."""
+    keys = [plan_id, meal_plan.name]
+    foods_rows, meals_rows = [], []
+    for meal in meal_plan.meals:
+        for food in meal.foods:
+            foods_rows.append(keys + [meal.name, food.name, food.amount] + food.values.tolist())
+        meals_rows.append(keys + [meal.name, meal.total.amount] + meal.total.values.tolist())
+    distribution = meal_plan.distribution
+    dri_rows = [keys + [meal_plan.dri_name, data_name, meal_plan.total.nutrients[data_name],
+                        meal_plan.dri_dict[data_name], ratio]
+                for data_name, ratio in meal_plan.dri_ratio.items()]
+    return {
+        'foods': (['plan_id', 'meal_plan', 'meal', 'food', 'amount'] + nutrient_columns, foods_rows),
+        'meals': (['plan_id', 'meal_plan', 'meal', 'amount'] + nutrient_columns, meals_rows),
+        'total': (['plan_id', 'meal_plan', 'amount'] + nutrient_columns,
+                  [keys + [meal_plan.total.amount] + meal_plan.total.values.tolist()]),
+        'energy_distribution': (
+            ['plan_id', 'meal_plan', 'energy_protein', 'energy_carbohydrate', 'energy_fat', 'energy_total',
+             'protein_ratio', 'carbohydrate_ratio', 'fat_ratio'],
+            [keys + [distribution.energy_protein, distribution.energy_carb, distribution.energy_fat,
+                     distribution.energy_total, distribution.protein_ratio, distribution.carbohydrate_ratio,
+                     distribution.fat_ratio]]),
+        'dri_ratio': (['plan_id', 'meal_plan', 'dri_name', 'nutrient', 'amount', 'dri', 'ratio'], dri_rows),
+    }
+
+
+def get_program_tables(plan_id, program):
+    """Return analysis tables of multi-day program, a row per day, key: table name, value: (columns, rows)."""
+    keys = [plan_id, program.name]
+    days_rows, dri_rows = [], []
+    for day in program.days:
+        distribution, rolling = day.distribution, day.rolling_distribution
+        days_rows.append(keys + [day.name, day.amount, day.energy, distribution.protein_ratio,
+                                 distribution.carbohydrate_ratio, distribution.fat_ratio, day.rolling_amount,
+                                 day.rolling_energy, rolling.protein_ratio, rolling.carbohydrate_ratio,
+                                 rolling.fat_ratio])
+        dri_rows.extend(keys + [day.name, program.dri_name, data_name, ratio, day.rolling_dri_ratio[data_name]]
+                        for data_name, ratio in day.dri_ratio.items())
+    return {
+        'program_days': (['plan_id', 'program', 'day', 'amount', 'energy', 'protein_ratio', 'carbohydrate_ratio',
+                          'fat_ratio', 'rolling_amount', 'rolling_energy', 'rolling_protein_ratio',
+                          'rolling_carbohydrate_ratio', 'rolling_fat_ratio'], days_rows),
+        'program_dri_ratio': (['plan_id', 'program', 'day', 'dri_name', 'nutrient', 'ratio', 'rolling_ratio'],
+                              dri_rows),
+    }
+
+
+class ReportWriter(abc.ABC):
+    """Base class of report writers, writing the analyses of meal plans in an output directory."""
+    shared_output = False  # True when all meal plans are appended to the same files
+
+    def __init__(self, settings):
+        self.settings = settings  # workbook settings
+
+    @abc.abstractmethod
+    def write(self, out_dir, plan_id, meal_plan, foods_dict):
+        """Write analysis of meal plan identified by plan_id, return path of the written report."""
+
+    @abc.abstractmethod
+    def write_program(self, out_dir, plan_id, program):
+        """Write analysis of multi-day program identified by plan_id, return path of the written report."""
+
+
+class TableReportWriter(ReportWriter):
+    """Base class of report writers writing the analyses as tables."""
+    def write(self, out_dir, plan_id, meal_plan, foods_dict):
+        return self.write_tables(out_dir, plan_id, get_report_tables(plan_id, meal_plan))
+
+    def write_program(self, out_dir, plan_id, program):
+        return self.write_tables(out_dir, plan_id, get_program_tables(plan_id, program))
+
+    @abc.abstractmethod
+    def write_tables(self, out_dir, plan_id, tables):
+        """Write analysis tables of meal plan identified by plan_id, return path of the written report."""
+
+
+def get_catalog_workbook(foods_dict, settings):
+    """Return workbook of all the foods of the catalog, generated once per catalog version and settings.
+
+    Workbooks are cached in the cache directory, keyed by the workbook settings and the version of the
+    compiled catalog, so that reports only listing the foods of their meal plan share the same workbook
+    of all foods, and reports written with other settings get their own workbook.
+    Return None if foods_dict is not backed by a compiled catalog.
+    """
+    if not isinstance(foods_dict, FoodStore):
+        return None
+    stat = foods_dict.catalog.catalog_file.stat()
+    # the workbook of all foods is the same whatever the number of workers and the foods of the reports
+    style = {key: value for key, value in settings.items() if key not in ('worksheet_jobs', 'foods_worksheet')}
+    settings_key = get_content_hash(style)[:16]
+    catalog_key = get_content_hash([stat.st_mtime_ns, stat.st_size])[:16]
+    workbooks_dir = Path(config.cache_dir, 'catalog_workbooks')
+    workbook_file = Path(workbooks_dir, f'foods_{settings_key}_{catalog_key}.xlsx')
+    if not workbook_file.exists():
+        workbooks_dir.mkdir(parents=True, exist_ok=True)
+        tmp_file = Path(workbooks_dir, f'.{workbook_file.name}.{os.getpid()}.tmp')
+        WorkbookGenerator(settings).write_catalog(tmp_file, foods_dict)
+        os.replace(tmp_file, workbook_file)
+        # workbooks of the settings of previous catalog versions are outdated
+        for outdated_file in workbooks_dir.glob(f'foods_{settings_key}_*.xlsx'):
+            if outdated_file != workbook_file:
+                outdated_file.unlink(missing_ok=True)
+    return workbook_file
+
+
+def ship_catalog_workbook(workbook_file, out_dir):
+    """Link or copy cached workbook of all foods into out_dir, unless already there, and return its name.
+
+    The workbook of all foods of out_dir is replaced by any other cached workbook, e.g. of other settings,
+    so that it always is the workbook of the last reports written.
+    """
+    out_file = Path(out_dir, 'foods.xlsx')
+    if not out_file.exists() or not is_same_workbook(out_file, workbook_file):
+        tmp_file = Path(out_dir, f'.{out_file.name}.{os.getpid()}.tmp')
+        try:
+            os.link(workbook_file, tmp_file)
+        except OSError:
+            shutil.copy2(workbook_file, tmp_file)  # e.g. output directory on another file system
+        os.replace(tmp_file, out_file)
+    return out_file.name
+
+
+def is_same_workbook(out_file, workbook_file):
+    """Return True if out_file is a link to workbook_file, or a copy of it, keeping its size and mtime."""
+    if os.path.samefile(out_file, workbook_file):
+        return True
+    out_stat, stat = out_file.stat(), workbook_file.stat()
+    return (out_stat.st_size, out_stat.st_mtime_ns) == (stat.st_size, stat.st_mtime_ns)
+
+
+class XlsxReportWriter(ReportWriter):
+    """Writes an Excel workbook per meal plan.
+
+    When the foods_worksheet setting is 'referenced', the workbook of all the foods of the catalog
+    is written once next to the reports, as foods.xlsx, and linked from their Foods worksheet.
+    """
+    def write(self, out_dir, plan_id, meal_plan, foods_dict):
+        out_file = Path(out_dir, f'{plan_id}.xlsx')
+        catalog_link = None
+        if self.settings.get('foods_worksheet', 'all') == 'referenced':
+            workbook_file = get_catalog_workbook(foods_dict, self.settings)
+            if workbook_file:
+                catalog_link = ship_catalog_workbook(workbook_file, out_dir)
+        WorkbookGenerator(self.settings).generate(out_file, meal_plan, foods_dict, catalog_link)
+        return out_file
+
+    def write_program(self, out_dir, plan_id, program):
+        out_file = Path(out_dir, f'{plan_id}.xlsx')
+        WorkbookGenerator(self.settings).generate_program(out_file, program)
+        return out_file
+
+
+class CsvReportWriter(TableReportWriter):
+    """Appends meal plan analyses to a CSV file per table."""
+    shared_output = True
+
+    def write_tables(self, out_dir, plan_id, tables):
+        for table_name, (columns, rows) in tables.items():
+            table_file = Path(out_dir, f'{table_name}.csv')
+            new_file = not table_file.exists()
+            with open(table_file, 'a', newline='') as file:
+                writer = csv.writer(file)
+                if new_file:
+                    writer.writerow(columns)
+                writer.writerows(rows)
+        print(f'Analysis of {plan_id} appended to CSV tables in {Path(out_dir).absolute()}')
+        return Path(out_dir)
+
+
+class ArrowReportWriter(TableReportWriter):
+    """Writes a file per meal plan in a directory per table, readable as an Arrow dataset.
+
+    Requires the optional pyarrow package.
+    """
+    extension = 'arrow'
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError(f"the '{self.extension}' report format requires the pyarrow package: "
+                              f"pip install pyarrow")
+        self.pa = pyarrow
+
+    def write_tables(self, out_dir, plan_id, tables):
+        for table_name, (columns, rows) in tables.items():
+            table = self.pa.table({column: [row[i] for row in rows] for i, column in enumerate(columns)})
+            table_dir = Path(out_dir, table_name)
+            table_dir.mkdir(exist_ok=True)
+            self.write_table(table, Path(table_dir, f'{plan_id}.{self.extension}'))
+        print(f'Analysis of {plan_id} written to {self.extension} tables in {Path(out_dir).absolute()}')
+        return Path(out_dir)
+
+    def write_table(self, table, table_file):
+        import pyarrow.feather as feather
+        feather.write_feather(table, table_file)
+
+
+class ParquetReportWriter(ArrowReportWriter):
+    """Writes a Parquet file per meal plan in a directory per table, readable as a Parquet dataset.
+
+    Requires the optional pyarrow package.
+    """
+    extension = 'parquet'
+
+    def write_table(self, table, table_file):
+        import pyarrow.parquet as parquet
+        parquet.write_table(table, table_file)
+
+
+report_writers = {
+    'xlsx': XlsxReportWriter,
+    'csv': CsvReportWriter,
+    'arrow': ArrowReportWriter,
+    'parquet': ParquetReportWriter,
+}
@@ -0,0 +1,89 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""On-disk cache of FoodData Central responses."""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+
+class ResponseCache:
+    """On-disk cache of FoodData Central food data, keyed by FDC ID.
+
+    Each entry stores the raw food data along with its ETag and Last-Modified validators
+    and its fetch timestamp. Entries younger than ttl seconds are fresh and can be used
+    without any request, older ones are revalidated with a conditional request.
+    When the cache grows beyond max_bytes, the least recently used entries are evicted.
+    """
+    def __init__(self, cache_dir, ttl, max_bytes):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.total_bytes = None  # computed on first write
+        self.lock = threading.Lock()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def get_entry_file(self, fdc_id):
+        return Path(self.cache_dir, f'{fdc_id}.json')
+
+    def get(self, fdc_id):
+        """Return cached entry of FDC ID, or None if not cached."""
+        entry_file = self.get_entry_file(fdc_id)
+        try:
+            with open(entry_file, 'r') as file:
+                entry = json.loads(file.read())
+            os.utime(entry_file)  # mark entry as recently used
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry['fetched_at'] < self.ttl
+
+    def put(self, fdc_id, payload, etag=None, last_modified=None):
+        entry = {
+            'fdc_id': fdc_id,
+            'etag': etag,
+            'last_modified': last_modified,
+            'fetched_at': time.time(),
+            'payload': payload,
+        }
+        self.write(fdc_id, entry)
+        return entry
+
+    def refresh(self, entry, etag=None, last_modified=None):
+        """Reset fetch timestamp of an entry revalidated by the server, updating the validators it returned."""
+        entry['etag'] = etag if etag else entry['etag']
+        entry['last_modified'] = last_modified if last_modified else entry['last_modified']
+        entry['fetched_at'] = time.time()
+        self.write(entry['fdc_id'], entry)
+
+    def write(self, fdc_id, entry):
+        entry_file = self.get_entry_file(fdc_id)
+        tmp_file = Path(self.cache_dir, f'.{fdc_id}.{threading.get_ident()}.tmp')
+        data = json.dumps(entry)
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = sum(file.stat().st_size for file in self.cache_dir.glob('*.json'))
+            previous_size = entry_file.stat().st_size if entry_file.exists() else 0
+            with open(tmp_file, 'w') as file:
+                file.write(data)
+            os.replace(tmp_file, entry_file)
+            self.total_bytes += entry_file.stat().st_size - previous_size
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in 90% of max_bytes."""
+        entries = []
+        for entry_file in self.cache_dir.glob('*.json'):
+            stat = entry_file.stat()
+            entries.append((stat.st_mtime_ns, stat.st_size, entry_file))
+        for _, size, entry_file in sorted(entries):
+            if self.total_bytes <= 0.9 * self.max_bytes:
+                break
+            entry_file.unlink()
+            self.total_bytes -= size
@@ -0,0 +1,348 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""Analysis server keeping foods and Dietary Reference Intakes in memory.
+
+The server speaks a minimal HTTP/1.1 over TCP or a Unix socket:
+
+- GET /health: server status, number of foods and number of catalog reloads
+- POST /analyze: meal plan or multi-day program JSON in, analysis JSON out
+- POST /workbook: meal plan or multi-day program JSON in, Excel workbook out, streamed in chunks
+
+Connections are handled by an asyncio event loop, while meal plans are analyzed in a pool of
+worker processes sharing the memory-mapped food catalog. The foods and DRI directories, or the
+food database, are polled, and the catalog is recompiled and the worker pool restarted when a
+file changes.
+"""
+
+import asyncio
+import io
+import json
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from json.decoder import JSONDecodeError
+from urllib.parse import urlsplit
+import nutrimetrics.batch as batch
+import nutrimetrics.config as config
+from nutrimetrics.__about__ import __version__ as nutrimetrics_version
+from nutrimetrics.catalog import load_catalog, scan_sources
+from nutrimetrics.database import open_database
+from nutrimetrics.meals import MealPlan, load_dri_tables
+from nutrimetrics.programs import Program, is_program
+from nutrimetrics.workbook import WorkbookGenerator
+
+
+max_body_size = 16 * 1024 * 1024
+max_headers = 100
+chunk_size = 64 * 1024
+xlsx_content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 431: 'Request Header Fields Too Large', 500: 'Internal Server Error'}
+
+
+class RequestError(Exception):
+    """Error reported to the client with an HTTP status code."""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def get_analysis(meal_plan):
+    """Return analysis of meal plan as a JSON serializable dictionary, amounts in kcal and grams."""
+    def totals(food):
+        return {'amount': food.amount, 'nutrients': dict(food.nutrients)}
+    distribution = meal_plan.distribution
+    target = meal_plan.target
+    return {
+        'name': meal_plan.name,
+        'dietary_reference_intakes': meal_plan.dri_name,
+        'meals': [dict(name=meal.name, **totals(meal.total)) for meal in meal_plan.meals],
+        'total': totals(meal_plan.total),
+        'dri_ratio': meal_plan.dri_ratio,
+        'energy_distribution': {
+            'energy_protein': distribution.energy_protein,
+            'energy_carbohydrate': distribution.energy_carb,
+            'energy_fat': distribution.energy_fat,
+            'energy_total': distribution.energy_total,
+            'protein_ratio': distribution.protein_ratio,
+            'carbohydrate_ratio': distribution.carbohydrate_ratio,
+            'fat_ratio': distribution.fat_ratio,
+        },
+        'target': {
+            'body_mass': target.body_mass,
+            'body_fat_ratio': target.body_fat_ratio,
+            'activity_factor': target.activity_factor,
+            'lean_body_mass': target.lean_body_mass,
+            'resting_energy': target.resting_energy,
+            'basal_metabolic_rate': target.basal_metabolic_rate,
+            'minimum_protein': target.minimum_protein,
+            'minimum_fat': target.minimum_fat,
+        },
+    }
+
+
+def get_distribution_ratios(distribution):
+    return {
+        'protein_ratio': distribution.protein_ratio,
+        'carbohydrate_ratio': distribution.carbohydrate_ratio,
+        'fat_ratio': distribution.fat_ratio,
+    }
+
+
+def get_program_analysis(program):
+    """Return analysis of multi-day program as a JSON serializable dictionary, an entry per day."""
+    return {
+        'name': program.name,
+        'dietary_reference_intakes': program.dri_name,
+        'window': program.window,
+        'days': [{
+            'name': day.name,
+            'amount': day.amount,
+            'energy': day.energy,
+            'energy_distribution': get_distribution_ratios(day.distribution),
+            'dri_ratio': day.dri_ratio,
+            'rolling_amount': day.rolling_amount,
+            'rolling_energy': day.rolling_energy,
+            'rolling_energy_distribution': get_distribution_ratios(day.rolling_distribution),
+            'rolling_dri_ratio': day.rolling_dri_ratio,
+        } for day in program.days],
+    }
+
+
+def analyze(json_data):
+    """Analyze meal plan or multi-day program in worker process and return its analysis."""
+    if is_program(json_data):
+        return get_program_analysis(Program(json_data, batch.worker_foods, batch.worker_dri_tables))
+    meal_plan = MealPlan(json_data, batch.worker_foods, batch.worker_dri_tables)
+    return get_analysis(meal_plan)
+
+
+def generate_workbook(json_data, settings):
+    """Analyze meal plan or multi-day program in worker process and return its workbook content."""
+    output = io.BytesIO()
+    if is_program(json_data):
+        program = Program(json_data, batch.worker_foods, batch.worker_dri_tables)
+        WorkbookGenerator(settings).write_program(output, program)
+    else:
+        meal_plan = MealPlan(json_data, batch.worker_foods, batch.worker_dri_tables)
+        WorkbookGenerator(settings).write(output, meal_plan, batch.worker_foods)
+    return output.getvalue()
+
+
+class AnalysisServer:
+    """Serves meal plan analyses from a warm worker pool."""
+    def __init__(self, settings, workers=None, reload_interval=2.0):
+        self.settings = settings  # workbook settings
+        # meal plans run in parallel: worksheets are not prepared in nested worker processes, as in a batch
+        self.worker_settings = dict(settings, worksheet_jobs=1)
+        self.workers = workers if workers else os.cpu_count()
+        self.reload_interval = reload_interval
+        self.executor = None
+        self.n_foods = 0
+        self.n_reloads = 0
+        self.sources = None  # food and DRI files of the loaded catalog and DRI tables
+        self.started_at = time.time()
+
+    def scan(self):
+        database = open_database(read_only=True)
+        if database:
+            sources = database.get_sources()
+            database.close()
+            return sources, None
+        return scan_sources(config.foods_dir), scan_sources(config.dri_dir)
+
+    def load(self):
+        """Compile catalog if needed, load DRI tables and start a new worker pool."""
+        start = time.perf_counter()
+        sources = self.scan()
+        catalog = load_catalog()
+        self.n_foods = len(catalog)
+        catalog.close()
+        dri_tables = load_dri_tables()
+        previous = self.executor
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=batch.init_worker,
+                                            initargs=(config.catalog_file, dri_tables, self.settings, 'xlsx'))
+        self.sources = sources
+        if previous:
+            # requests already submitted to the previous pool complete with the previous catalog
+            previous.shutdown(wait=False)
+        print(f'Loaded {self.n_foods} foods and {len(dri_tables)} DRI tables in '
+              f'{time.perf_counter() - start:.2f}s ({self.workers} workers)')
+
+    async def watch(self):
+        """Reload foods and DRI tables whenever a file of their directories or the food database changes."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                sources = await loop.run_in_executor(None, self.scan)
+                if sources != self.sources:
+                    print('Foods or DRI files changed, reloading')
+                    await loop.run_in_executor(None, self.load)
+                    self.n_reloads += 1
+            except Exception as e:
+                print(f'ERROR: reload failed: {type(e).__name__}: {e}')
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await self.read_request(reader, writer)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                try:
+                    await self.handle_request(writer, method, path, body, keep_alive)
+                except RequestError as e:
+                    await self.send_json(writer, e.status, {'error': str(e)}, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader, writer):
+        """Return (method, path, headers, body) of next request, or None when the connection is closed.
+
+        Malformed requests are answered with an error and the connection is closed.
+        """
+        try:
+            return await self.parse_request(reader)
+        except RequestError as e:
+            await self.send_json(writer, e.status, {'error': str(e)}, keep_alive=False)
+            return None
+
+    async def parse_request(self, reader):
+        request_line = await self.read_line(reader)
+        if not request_line or not request_line.strip():
+            return None
+        try:
+            method, target, _ = request_line.decode('latin-1').split()
+        except ValueError:
+            raise RequestError(400, 'malformed request line')
+        headers = dict()
+        for n_headers in range(max_headers + 1):
+            line = await self.read_line(reader)
+            if line is None:
+                return None  # connection closed in the middle of the headers
+            if line in (b'\r\n', b'\n'):
+                break
+            if n_headers == max_headers:
+                raise RequestError(431, f'more than {max_headers} headers')
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = headers.get('content-length', '0') or '0'
+        if not length.isdigit():
+            raise RequestError(400, f'invalid Content-Length {length!r}')
+        length = int(length)
+        if length > max_body_size:
+            raise RequestError(413, f'body larger than {max_body_size} bytes')
+        try:
+            body = await reader.readexactly(length) if length else b''
+        except asyncio.IncompleteReadError as e:
+            raise RequestError(400, f'body truncated to {len(e.partial)} of {length} bytes')
+        return method.upper(), urlsplit(target).path, headers, body
+
+    async def read_line(self, reader):
+        """Return next line of request head, or None when the connection is closed before its end."""
+        try:
+            line = await reader.readline()
+        except (ValueError, asyncio.LimitOverrunError):  # readline() reports overruns as ValueError
+            raise RequestError(431, 'request line or header too long')
+        return line if line.endswith(b'\n') else None
+
+    async def handle_request(self, writer, method, path, body, keep_alive):
+        loop = asyncio.get_running_loop()
+        if path == '/health':
+            if method != 'GET':
+                raise RequestError(405, f'{method} not allowed on {path}')
+            await self.send_json(writer, 200, {
+                'status': 'ok',
+                'version': nutrimetrics_version,
+                'foods': self.n_foods,
+                'reloads': self.n_reloads,
+                'uptime': time.time() - self.started_at,
+            }, keep_alive)
+        elif path in ('/analyze', '/workbook'):
+            if method != 'POST':
+                raise RequestError(405, f'{method} not allowed on {path}')
+            json_data = self.parse_meal_plan(body)
+            try:
+                if path == '/analyze':
+                    analysis = await loop.run_in_executor(self.executor, analyze, json_data)
+                else:
+                    content = await loop.run_in_executor(self.executor, generate_workbook, json_data,
+                                                         self.worker_settings)
+            except (KeyError, TypeError, ValueError) as e:
+                raise RequestError(400, f'invalid meal plan: {type(e).__name__}: {e}')
+            except Exception as e:
+                raise RequestError(500, f'{type(e).__name__}: {e}')
+            if path == '/analyze':
+                await self.send_json(writer, 200, analysis, keep_alive)
+            else:
+                await self.send_stream(writer, xlsx_content_type, content, keep_alive)
+        else:
+            raise RequestError(404, f'no such resource {path}')
+
+    def parse_meal_plan(self, body):
+        try:
+            json_data = config.loads(body.decode('utf-8'))  # meal plan files may have comments
+        except (UnicodeDecodeError, JSONDecodeError) as e:
+            raise RequestError(400, f'meal plan badly formatted: {e}')
+        if not isinstance(json_data, dict):
+            raise RequestError(400, 'meal plan must be a JSON object')
+        return json_data
+
+    async def send_json(self, writer, status, data, keep_alive):
+        body = json.dumps(data).encode()
+        writer.write(self.get_headers(status, 'application/json', keep_alive, f'Content-Length: {len(body)}'))
+        writer.write(body)
+        await writer.drain()
+
+    async def send_stream(self, writer, content_type, content, keep_alive):
+        """Send content in chunks, honoring the client's flow control."""
+        writer.write(self.get_headers(200, content_type, keep_alive, 'Transfer-Encoding: chunked'))
+        view = memoryview(content)
+        for offset in range(0, len(view), chunk_size):
+            chunk = view[offset:offset + chunk_size]
+            writer.write(b'%x\r\n' % len(chunk))
+            writer.write(chunk)
+            writer.write(b'\r\n')
+            await writer.drain()
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    def get_headers(self, status, content_type, keep_alive, length_header):
+        headers = f'HTTP/1.1 {status} {reasons[status]}\r\n'
+        headers += f'Content-Type: {content_type}\r\n'
+        headers += f'{length_header}\r\n'
+        headers += f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        return headers.encode('latin-1')
+
+    async def serve(self, host=None, port=None, socket_path=None):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.load)
+        if socket_path:
+            if socket_path.exists():
+                socket_path.unlink()  # stale socket of a previous server
+            server = await asyncio.start_unix_server(self.handle_connection, path=str(socket_path))
+            print(f'NutriMetrics server listening on {socket_path.absolute()}')
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+            print(f'NutriMetrics server listening on http://{host}:{port}')
+        stop = loop.create_future()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, lambda: stop.done() or stop.set_result(None))
+        watcher = asyncio.create_task(self.watch())
+        try:
+            async with server:
+                await stop
+        finally:
+            watcher.cancel()
+            self.executor.shutdown(cancel_futures=True)
+            if socket_path and socket_path.exists():
+                socket_path.unlink()
+            print('NutriMetrics server stopped')
@@ -0,0 +1,133 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""Food substitution search over nutrient profiles."""
+
+import numpy as np
+from nutrimetrics.nutrients import nutrients_list, nutrients_index, nutrient_groups
+
+
+bases = {
+    'energy': 'per 100 kcal',
+    'mass': 'per 100 g',
+}
+
+
+class SubstitutionIndex:
+    """Index of the nutrient profiles of catalog foods, answering top-k most similar foods queries.
+
+    Profiles are normalized per 100 kcal (energy basis) or per 100 g (mass basis). Each nutrient is
+    divided by the median of its non-zero amounts and log-compressed, so that nutrients of very different
+    magnitudes weigh alike and a few outliers do not hide the differences between common foods.
+    Profiles are compared by cosine similarity. Up to exact_size foods, similarities are computed
+    as brute-force matrix products over the whole catalog, several queries at a time. Larger catalogs
+    are partitioned in n_lists clusters of similar profiles (spherical k-means), and only the foods of
+    the n_probe clusters closest to the queried food are compared, which is approximate but keeps
+    queries well under a millisecond.
+    """
+    exact_size = 50000
+
+    def __init__(self, catalog, basis='energy', groups=None, n_lists=None, n_probe=16):
+        if basis not in bases:
+            raise ValueError(f"basis '{basis}' is unknown, expected one of {', '.join(bases)}")
+        self.catalog = catalog
+        self.basis = basis
+        self.groups = groups if groups else list(nutrient_groups)
+        data_names = set()
+        for group in self.groups:
+            if group not in nutrient_groups:
+                raise ValueError(f"nutrient group '{group}' is unknown, expected one of {', '.join(nutrient_groups)}")
+            data_names.update(nutrient_groups[group])
+        if basis == 'energy':
+            data_names.discard('energy')  # same for all foods
+        self.data_names = [nutrient.data_name for nutrient in nutrients_list if nutrient.data_name in data_names]
+        # normalization factor of each food
+        if basis == 'energy':
+            reference = np.array(catalog.matrix[:, nutrients_index['energy']])
+        else:
+            reference = np.array(catalog.amounts)
+        valid = reference > 0
+        factors = np.zeros(len(reference))
+        factors[valid] = 100 / reference[valid]
+        # foods x nutrients features, built one nutrient at a time to bound memory use
+        self.features = np.zeros((len(reference), len(self.data_names)), dtype=np.float32)
+        for j, data_name in enumerate(self.data_names):
+            column = catalog.matrix[:, nutrients_index[data_name]] * factors
+            nonzero = column[column > 0]
+            if len(nonzero):
+                self.features[:, j] = np.log1p(np.maximum(column, 0) / np.median(nonzero))
+        norms = np.linalg.norm(self.features, axis=1)
+        valid &= norms > 0
+        self.features[valid] /= norms[valid, None]
+        self.invalid = np.flatnonzero(~valid)  # foods without energy/amount or without nutrients
+        # clusters of valid foods, when catalog is too large for brute-force queries
+        self.n_probe = n_probe
+        self.centroids = None
+        if n_lists is None:
+            n_lists = int(np.sqrt(len(self.features))) if len(self.features) > self.exact_size else 0
+        if n_lists:
+            self.build_lists(np.flatnonzero(valid), n_lists)
+
+    def build_lists(self, rows, n_lists, n_iterations=10, block_size=65536, seed=0):
+        """Cluster foods of rows with a spherical k-means trained on a sample of them."""
+        rng = np.random.default_rng(seed)
+        n_lists = min(n_lists, len(rows))
+        sample = self.features[rng.choice(rows, min(len(rows), 64 * n_lists), replace=False)]
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+        for _ in range(n_iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            norms = np.linalg.norm(sums, axis=1)
+            filled = norms > 0  # empty clusters keep their centroid
+            centroids[filled] = sums[filled] / norms[filled, None]
+        assignments = np.concatenate([np.argmax(self.features[rows[start:start + block_size]] @ centroids.T, axis=1)
+                                      for start in range(0, len(rows), block_size)])
+        order = np.argsort(assignments, kind='stable')
+        self.centroids = centroids
+        self.list_rows = rows[order]  # rows of each cluster, cluster after cluster
+        self.list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))])
+        # store features cluster after cluster, so that the features of a cluster are contiguous
+        self.list_features = self.features[self.list_rows]
+
+    def query(self, name, k=10):
+        """Return the k foods most similar to named food, as (name, similarity) list."""
+        return self.query_many([name], k)[0]
+
+    def query_many(self, names, k=10, block_size=32):
+        """Return the k foods most similar to each named food, queries are processed by blocks."""
+        rows = np.array([self.catalog.index[name] for name in names], dtype=int)
+        k = min(k, len(self.features) - 1)
+        if self.centroids is not None:
+            return [self.query_lists(row, k) for row in rows]
+        results = []
+        for start in range(0, len(rows), block_size):
+            block = rows[start:start + block_size]
+            similarities = self.features[block] @ self.features.T  # block x foods
+            similarities[:, self.invalid] = -np.inf
+            similarities[np.arange(len(block)), block] = -np.inf  # a food is not its own substitute
+            top = np.argpartition(-similarities, k - 1, axis=1)[:, :k] if k > 0 else np.zeros((len(block), 0), int)
+            for i, row in enumerate(block):
+                if row in self.invalid:
+                    results.append([])
+                    continue
+                candidates = top[i][np.argsort(-similarities[i, top[i]], kind='stable')]
+                results.append([(self.catalog.names[c], float(similarities[i, c]))
+                                for c in candidates if similarities[i, c] > -np.inf])
+        return results
+
+    def query_lists(self, row, k):
+        """Return the k foods most similar to food of row, among the foods of the closest clusters."""
+        if row in self.invalid:
+            return []
+        query = self.features[row]
+        n_probe = min(self.n_probe, len(self.centroids))
+        probes = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+        slices = [slice(self.list_offsets[i], self.list_offsets[i + 1]) for i in probes]
+        candidates = np.concatenate([self.list_rows[cluster] for cluster in slices])
+        similarities = np.concatenate([self.list_features[cluster] @ query for cluster in slices])
+        similarities[candidates == row] = -np.inf  # a food is not its own substitute
+        k = min(k, len(candidates) - 1)
+        top = np.argpartition(-similarities, k - 1)[:k] if k > 0 else np.zeros(0, int)
+        top = top[np.argsort(-similarities[top], kind='stable')]
+        return [(self.catalog.names[candidates[i]], float(similarities[i])) for i in top if similarities[i] > -np.inf]
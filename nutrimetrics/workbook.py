@@ -3,8 +3,112 @@
 # SPDX-License-Identifier: MIT
 """Workbook interface to generate Excel reports."""
 
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import numpy as np
 import xlsxwriter
-from nutrimetrics.nutrients import nutrients_list, proteins, carbohydrates, fats, minerals, vitamins, alkaloids
+import nutrimetrics.metrics as metrics
+from nutrimetrics.nutrients import nutrients_list, nutrients_index, nutrient_groups
+
+
+# worker process state, set once per worker by init_worker()
+worker_generator = None
+worker_foods = None
+
+
+class StyleKey(tuple):
+    """Normalized format properties, standing for a cell format until the writer adds it to the workbook."""
+
+
+class RecordedWorksheet:
+    """Worksheet stand-in recording the cell stream of a worksheet, with style keys instead of formats.
+
+    Consecutive numbers, most of the cells, are stored in compact arrays so that the stream is cheap
+    to send from a worker process to the writer.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.calls = []  # (worksheet method name, arguments), in the order they were called
+        self.style_keys = []  # style key of each style ID
+        self.style_ids = dict()  # key: style key, value: style ID
+        self.rows, self.columns, self.styles = array('i'), array('i'), array('i')
+        self.values = array('d')
+
+    def record(self, method, *args):
+        self.calls.append((method, args))
+
+    def write(self, *args):
+        self.record('write', *args)
+
+    def write_comment(self, *args):
+        self.record('write_comment', *args)
+
+    def conditional_format(self, *args):
+        self.record('conditional_format', *args)
+
+    def set_column_pixels(self, *args):
+        self.record('set_column_pixels', *args)
+
+    def freeze_panes(self, *args):
+        self.record('freeze_panes', *args)
+
+    def write_number(self, row, column, value, style_key):
+        if style_key not in self.style_ids:
+            self.style_ids[style_key] = len(self.style_keys)
+            self.style_keys.append(style_key)
+        self.rows.append(row)
+        self.columns.append(column)
+        self.values.append(value)
+        self.styles.append(self.style_ids[style_key])
+        if self.calls and self.calls[-1][0] == 'write_numbers':
+            self.calls[-1] = ('write_numbers', self.calls[-1][1] + 1)
+        else:
+            self.calls.append(('write_numbers', 1))  # number of consecutive numbers
+
+
+class RecordedWorkbook:
+    """Workbook stand-in of worker processes, recording worksheets and returning style keys as formats."""
+    def __init__(self):
+        self.worksheets = []
+
+    def add_worksheet(self, name):
+        worksheet = RecordedWorksheet(name)
+        self.worksheets.append(worksheet)
+        return worksheet
+
+    def add_format(self, properties):
+        return StyleKey(sorted(properties.items()))
+
+
+def get_referenced_foods(meal_plan):
+    """Return foods of meal plan sorted by name, key: food name, value: food."""
+    names = sorted({food.name for meal in meal_plan.meals for food in meal.foods})
+    return {name: meal_plan.foods_dict[name] for name in names}
+
+
+def init_worker(settings, foods_dict):
+    """Create the generator and foods of worker process recording worksheets."""
+    global worker_generator, worker_foods
+    worker_generator = WorkbookGenerator(settings)
+    worker_foods = foods_dict
+
+
+def record_worksheet(method_name, *args):
+    """Run worksheet method in worker process, return recorded worksheet."""
+    worker_generator.workbook = RecordedWorkbook()
+    worker_generator.formats = dict()
+    getattr(worker_generator, method_name)(*args)
+    return worker_generator.workbook.worksheets[0]
+
+
+def record_food_rows(names, row_i):
+    """Record rows of named foods in worker process, after row row_i of the Foods worksheet."""
+    worker_generator.workbook = RecordedWorkbook()
+    worker_generator.formats = dict()
+    worksheet = worker_generator.workbook.add_worksheet('Foods')
+    worker_generator.write_values(worksheet, row_i, foods=[worker_foods[name] for name in names], comment=True)
+    return worksheet
 
 
 class WorkbookGenerator:
@@ -12,15 +116,165 @@ class WorkbookGenerator:
     def __init__(self, settings):
         self.settings = settings
         self.workbook = None
+        self.formats = dict()  # key: normalized format properties, value: workbook format
+        # nutrients displayed in columns, after the food and amount columns
+        self.displayed_nutrients = [nutrient for nutrient in nutrients_list
+                                    if nutrient.data_name not in self.settings['do_not_display']]
+        self.displayed_indices = np.array([nutrients_index[nutrient.data_name]
+                                           for nutrient in self.displayed_nutrients], dtype=int)
+        self.displayed_factors = np.array([nutrient.display_unit.internal_factor
+                                           for nutrient in self.displayed_nutrients])
+        # key: nutrient's data_name, value: (font color, background color), the first matching group wins
+        self.nutrient_colors = dict()
+        for group, data_names in nutrient_groups.items():
+            for data_name in data_names:
+                self.nutrient_colors.setdefault(data_name, self.settings['colors'][group])
+
+    def generate(self, out_file, meal_plan, foods_dict, catalog_link=None):
+        self.write(out_file, meal_plan, foods_dict, catalog_link)
+        print(f'Workbook created in {out_file.absolute()}')
 
-    def generate(self, out_file, meal_plan, foods_dict):
-        self.workbook = xlsxwriter.Workbook(out_file)
-        self.create_meals_worksheet(meal_plan)
-        self.create_target_worksheet(meal_plan)
+    @metrics.timed_function('workbook_write')
+    def write(self, output, meal_plan, foods_dict, catalog_link=None):
+        """Write workbook to output file path or binary file object.
+
+        When the foods_worksheet setting is 'referenced', the Foods worksheet only lists the foods of
+        the meal plan, followed by a link to catalog_link, the workbook of all foods, if given.
+        """
+        # in constant memory mode each row is flushed to disk as soon as the next one is started,
+        # so all worksheets must be written strictly in row order, and left to right in each row
+        options = {'constant_memory': self.settings.get('constant_memory', False)}
+        self.workbook = xlsxwriter.Workbook(output, options)
+        self.formats = dict()  # formats belong to their workbook
+        if self.settings.get('foods_worksheet', 'all') == 'referenced':
+            foods_dict = get_referenced_foods(meal_plan)
+        else:
+            catalog_link = None
+        jobs = self.settings.get('worksheet_jobs', 1)
+        if jobs > 1:
+            self.write_worksheets_parallel(meal_plan, foods_dict, jobs, catalog_link)
+        else:
+            self.create_meals_worksheet(meal_plan)
+            self.create_target_worksheet(meal_plan)
+            self.create_foods_worksheet(foods_dict, catalog_link=catalog_link)
+        self.workbook.close()
+
+    def write_catalog(self, output, foods_dict):
+        """Write workbook of the Foods worksheet only, listing all foods."""
+        options = {'constant_memory': self.settings.get('constant_memory', False)}
+        self.workbook = xlsxwriter.Workbook(output, options)
+        self.formats = dict()
         self.create_foods_worksheet(foods_dict)
         self.workbook.close()
+
+    def write_worksheets_parallel(self, meal_plan, foods_dict, jobs, catalog_link=None, chunk_size=2000):
+        """Record the cell streams of the worksheets in worker processes, then write them in order.
+
+        The Foods worksheet is recorded by chunks of rows, so that its rows are prepared by all the
+        workers while the streams already recorded are written.
+        """
+        names = list(foods_dict)
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                                 initargs=(self.settings, foods_dict)) as executor:
+            meals = executor.submit(record_worksheet, 'create_meals_worksheet', meal_plan)
+            target = executor.submit(record_worksheet, 'create_target_worksheet', meal_plan)
+            food_rows = [executor.submit(record_food_rows, names[start:start + chunk_size], start)
+                         for start in range(0, len(names), chunk_size)]
+            self.write_recorded(meals.result())
+            self.write_recorded(target.result())
+            self.create_foods_worksheet(foods_dict, (future.result() for future in food_rows), catalog_link)
+
+    def write_recorded(self, recorded, worksheet=None):
+        """Write recorded cell stream, adding a format for each of its style keys."""
+        if worksheet is None:
+            worksheet = self.workbook.add_worksheet(recorded.name)
+        styles = [self.get_style_format(key) for key in recorded.style_keys]
+        if metrics.enabled:
+            n_texts = sum(method == 'write' for method, _ in recorded.calls)
+            metrics.count('workbook_cells', len(recorded.values) + n_texts)
+        numbers = zip(recorded.rows, recorded.columns, recorded.values, recorded.styles)
+        for method, args in recorded.calls:
+            if method == 'write_numbers':
+                for row, column, value, style in islice(numbers, args):
+                    worksheet.write_number(row, column, value, styles[style])
+                continue
+            args = [self.get_style_format(arg) if isinstance(arg, StyleKey) else arg for arg in args]
+            if method == 'conditional_format':
+                args[-1] = dict(args[-1], format=self.get_style_format(args[-1]['format']))
+            getattr(worksheet, method)(*args)
+        return worksheet
+
+    def get_style_format(self, style_key):
+        return self.intern_format(dict(style_key))
+
+    def generate_program(self, out_file, program):
+        self.write_program(out_file, program)
         print(f'Workbook created in {out_file.absolute()}')
 
+    def write_program(self, output, program):
+        """Write compact workbook of a multi-day program, a row per day, to output file path or binary file object."""
+        options = {'constant_memory': self.settings.get('constant_memory', False)}
+        self.workbook = xlsxwriter.Workbook(output, options)
+        self.formats = dict()
+        self.create_days_worksheet(f'Days - {program.name}', program, rolling=False)
+        self.create_days_worksheet(f'Rolling {program.window} days', program, rolling=True)
+        self.create_target_worksheet(program.meal_plan)
+        self.workbook.close()
+
+    def create_days_worksheet(self, name, program, rolling):
+        """Write amount, energy, energy distribution and DRI ratio of each day, or their rolling averages."""
+        worksheet = self.workbook.add_worksheet(name[:31])  # longest worksheet name allowed by Excel
+        dri_nutrients = [nutrient for nutrient in self.displayed_nutrients if nutrient.data_name in program.dri_names]
+        header_fmt = self.get_format(
+            font_color=self.settings['colors']['food'][0],
+            bg_color=self.settings['colors']['food'][1],
+            bold=True,
+            align='left')
+        worksheet.write(0, 0, 'Day', header_fmt)
+        colors = self.settings['colors']
+        headers = [(colors['amount'], 'Amount [g]'), (colors['energy'], 'Energy [kcal]'),
+                   (colors['energy'], 'Protein Energy [%]'), (colors['energy'], 'Carbohydrate Energy [%]'),
+                   (colors['energy'], 'Fat Energy [%]')]
+        headers += [(self.get_colors(nutrient.data_name), f'{nutrient.display_name} [% DRI]')
+                    for nutrient in dri_nutrients]
+        for column_i, ((font_color, bg_color), label) in enumerate(headers, start=1):
+            worksheet.write(0, column_i, label, self.get_format(
+                font_color=font_color,
+                bg_color=bg_color,
+                bold=True,
+                align='left',
+                border=1,
+                rotation=45))
+        name_fmt = self.get_format(font_color=self.settings['colors']['food'][0], bg_color=None, bold=False,
+                                   align='left')
+        amount_fmt = self.get_format(font_color=self.settings['colors']['amount'][0], bg_color=None, bold=False,
+                                     align='right')
+        energy_fmt = self.get_format(font_color=self.settings['colors']['energy'][0],
+                                     bg_color=self.settings['energy_bg_color'], bold=False, align='right')
+        for row_i, day in enumerate(program.days, start=1):
+            if rolling:
+                amount, energy, distribution, dri_ratio = \
+                    day.rolling_amount, day.rolling_energy, day.rolling_distribution, day.rolling_dri_ratio
+            else:
+                amount, energy, distribution, dri_ratio = day.amount, day.energy, day.distribution, day.dri_ratio
+            worksheet.write(row_i, 0, day.name, name_fmt)
+            worksheet.write_number(row_i, 1, amount, amount_fmt)
+            worksheet.write_number(row_i, 2, energy, energy_fmt)
+            worksheet.write_number(row_i, 3, 100 * distribution.protein_ratio, energy_fmt)
+            worksheet.write_number(row_i, 4, 100 * distribution.carbohydrate_ratio, energy_fmt)
+            worksheet.write_number(row_i, 5, 100 * distribution.fat_ratio, energy_fmt)
+            for column_i, nutrient in enumerate(dri_nutrients, start=6):
+                if nutrient.data_name in dri_ratio:
+                    percent = 100 * dri_ratio[nutrient.data_name]
+                    worksheet.write_number(row_i, column_i, percent, self.get_format(
+                        font_color=self.get_colors(nutrient.data_name)[0],
+                        bg_color=self.get_dri_color(percent),
+                        bold=False,
+                        align='right'))
+        worksheet.set_column_pixels(0, 0, self.settings['column_pixels_food'])
+        worksheet.set_column_pixels(1, len(headers), self.settings['column_pixels_nutrient'])
+        worksheet.freeze_panes('B2')
+
     def create_meals_worksheet(self, meal_plan):
         worksheet = self.workbook.add_worksheet(f'Meals - {meal_plan.name}')
         self.write_headers(worksheet)
@@ -117,6 +371,7 @@ class WorkbookGenerator:
         # parameters
         worksheet.write(0, 0, 'Body Mass (g)', fmt_body_mass_label)
         worksheet.write(0, 1, meal_plan.target.body_mass, fmt_body_mass_value)
+        worksheet.write(0, 3, "Meal plan parameters", fmt_annotate)
         worksheet.write(1, 0, 'Body Fat (%)', fmt_body_fat_label)
         worksheet.write(1, 1, meal_plan.target.body_fat_ratio * 100, fmt_body_fat_value)
         worksheet.write(2, 0, 'Activity Factor', fmt_label)
@@ -130,25 +385,31 @@ class WorkbookGenerator:
         worksheet.write(6, 1, meal_plan.target.lean_body_mass, fmt_lean_body_mass_value)
         worksheet.write(7, 0, 'Resting Daily Energy Expenditure (kcal)', fmt_label)
         worksheet.write(7, 1, meal_plan.target.resting_energy, fmt_value)
+        worksheet.write(7, 3, "Katch–McArdle formula", fmt_annotate)
         worksheet.write(8, 0, 'Basal Metabolic Rate (kcal)', fmt_energy_label)
         worksheet.write(8, 1, meal_plan.target.basal_metabolic_rate, fmt_energy_value)
+        worksheet.write(8, 3, "BMR based on activity factor", fmt_annotate)
         worksheet.write(9, 0, 'Minimum Protein (g)', fmt_label)
         worksheet.write(9, 1, meal_plan.target.minimum_protein, fmt_value)
         worksheet.write(10, 0, 'Minimum Fat (g)', fmt_label)
         worksheet.write(10, 1, meal_plan.target.minimum_fat, fmt_value)
-        # add annotations
-        worksheet.write(0, 3, "Meal plan parameters", fmt_annotate)
-        worksheet.write(7, 3, "Katch–McArdle formula", fmt_annotate)
-        worksheet.write(8, 3, "BMR based on activity factor", fmt_annotate)
         # set columns width
         worksheet.set_column_pixels(0, 0, self.settings['target']['column_pixels_label'])
         worksheet.set_column_pixels(1, 1, self.settings['target']['column_pixels_value'])
         worksheet.set_column_pixels(2, 2, self.settings['target']['column_pixels_separator'])
 
-    def create_foods_worksheet(self, foods_dict):
+    def create_foods_worksheet(self, foods_dict, recorded_rows=None, catalog_link=None):
         worksheet = self.workbook.add_worksheet('Foods')
         self.write_headers(worksheet)
-        row_i, column_i = self.write_values(worksheet, row_i=0, foods=foods_dict.values(), comment=True)
+        if recorded_rows is None:
+            row_i, column_i = self.write_values(worksheet, row_i=0, foods=foods_dict.values(), comment=True)
+        else:
+            # rows recorded by worker processes, in order
+            for recorded in recorded_rows:
+                self.write_recorded(recorded, worksheet)
+            row_i, column_i = len(foods_dict), 1 + len(self.displayed_nutrients)
+        if catalog_link:
+            worksheet.write_url(row_i + 2, 0, f'external:{catalog_link}', string=f'All foods: {catalog_link}')
         self.write_columns_separators(worksheet, row_i)
         self.set_columns_width(worksheet, column_i)
         worksheet.freeze_panes('B2')
@@ -171,25 +432,20 @@ class WorkbookGenerator:
             fmt['rotation'] = rotation
         if italic:
             fmt['italic'] = italic
-        return self.workbook.add_format(fmt)
+        return self.intern_format(fmt)
+
+    def intern_format(self, fmt):
+        """Return workbook format of properties fmt, adding it to the workbook the first time only."""
+        # identical formats are shared instead of adding a new format for every cell
+        key = tuple(sorted(fmt.items()))
+        if key not in self.formats:
+            self.formats[key] = self.workbook.add_format(fmt)
+            if metrics.enabled:
+                metrics.count('workbook_formats')
+        return self.formats[key]
 
     def get_colors(self, nutrient_data_name):
-        if nutrient_data_name == 'energy':
-            return self.settings['colors']['energy']
-        elif nutrient_data_name == 'water':
-            return self.settings['colors']['water']
-        elif nutrient_data_name in proteins:
-            return self.settings['colors']['proteins']
-        elif nutrient_data_name in carbohydrates:
-            return self.settings['colors']['carbohydrates']
-        elif nutrient_data_name in fats:
-            return self.settings['colors']['fats']
-        elif nutrient_data_name in minerals:
-            return self.settings['colors']['minerals']
-        elif nutrient_data_name in vitamins:
-            return self.settings['colors']['vitamins']
-        elif nutrient_data_name in alkaloids:
-            return self.settings['colors']['alkaloids']
+        return self.nutrient_colors.get(nutrient_data_name)
 
     @staticmethod
     def get_header_label(nutrient):
@@ -216,9 +472,7 @@ class WorkbookGenerator:
             border=1,
             rotation=45)
         worksheet.write(row_i, column_i, 'Amount [g]', fmt)
-        for nutrient in nutrients_list:
-            if nutrient.data_name in self.settings['do_not_display']:
-                continue
+        for nutrient in self.displayed_nutrients:
             column_i += 1
             font_color, bg_color = self.get_colors(nutrient.data_name)
             fmt = self.get_format(
@@ -230,42 +484,45 @@ class WorkbookGenerator:
                 rotation=45)
             worksheet.write(row_i, column_i, self.get_header_label(nutrient), fmt)
 
+    @metrics.timed_function('workbook_write_values')
     def write_values(self, worksheet, row_i, foods, comment=False, force_bold=False, force_bg_color=None):
         comments_options = {
             'font_name': self.settings['font_name'],
             'font_size': self.settings['font_size'],
             'width': 250,
         }
+        name_fmt = self.get_format(
+            font_color=self.settings['colors']['food'][0],
+            bg_color=(force_bg_color if force_bg_color else None),
+            bold=force_bold,
+            align='left')
+        amount_fmt = self.get_format(
+            font_color=self.settings['colors']['amount'][0],
+            bg_color=(force_bg_color if force_bg_color else None),
+            bold=False,
+            align='right')
+        # formats are resolved once per nutrient column rather than once per cell
+        value_fmts = []
+        for nutrient in self.displayed_nutrients:
+            font_color, bg_color = self.get_colors(nutrient.data_name)
+            value_fmts.append(self.get_format(
+                font_color=font_color,
+                bg_color=(force_bg_color if force_bg_color else None),
+                bold=False,
+                align='right'))
+        column_i = 1 + len(value_fmts)
+        if metrics.enabled and not isinstance(worksheet, RecordedWorksheet):  # recorded cells are counted when written
+            metrics.count('workbook_cells', len(foods) * (2 + len(value_fmts)))
         for food in foods:
             row_i += 1
-            column_i = 0
-            fmt = self.get_format(
-                font_color=self.settings['colors']['food'][0],
-                bg_color=(force_bg_color if force_bg_color else None),
-                bold=force_bold,
-                align='left')
-            worksheet.write(row_i, column_i, food.name, fmt)
+            worksheet.write(row_i, 0, food.name, name_fmt)
             if comment:
-                worksheet.write_comment(row_i, column_i, food.description, comments_options)
-            column_i += 1
-            fmt = self.get_format(
-                font_color=self.settings['colors']['amount'][0],
-                bg_color=(force_bg_color if force_bg_color else None),
-                bold=False,
-                align='right')
-            worksheet.write(row_i, column_i, food.amount, fmt)
-            for nutrient in nutrients_list:
-                if nutrient.data_name in self.settings['do_not_display']:
-                    continue
-                column_i += 1
-                font_color, bg_color = self.get_colors(nutrient.data_name)
-                fmt = self.get_format(
-                    font_color=font_color,
-                    bg_color=(force_bg_color if force_bg_color else None),
-                    bold=False,
-                    align='right')
-                value = self.convert(nutrient, food.nutrients[nutrient.data_name])
-                worksheet.write(row_i, column_i, value, fmt)
+                worksheet.write_comment(row_i, 0, food.description, comments_options)
+            worksheet.write(row_i, 1, food.amount, amount_fmt)
+            # displayed nutrient amounts converted to display units at once
+            values = (food.values[self.displayed_indices] * self.displayed_factors).tolist()
+            for column_i, (value, fmt) in enumerate(zip(values, value_fmts), start=2):
+                worksheet.write_number(row_i, column_i, value, fmt)
         return row_i, column_i
 
     def write_energy(self, worksheet, row_i, meal_plan):
@@ -278,9 +535,7 @@ class WorkbookGenerator:
             align='left')
         worksheet.write(row_i, column_i, 'Energy [%]', fmt)
         column_i = 1
-        for nutrient in nutrients_list:
-            if nutrient.data_name in self.settings['do_not_display']:
-                continue
+        for nutrient in self.displayed_nutrients:
             column_i += 1
             font_color, bg_color = self.get_colors(nutrient.data_name)
             fmt = self.get_format(
@@ -307,9 +562,7 @@ class WorkbookGenerator:
             align='left')
         worksheet.write(row_i, column_i, f'Target & DRI ({meal_plan.dri_name})', fmt)
         column_i = 1
-        for nutrient in nutrients_list:
-            if nutrient.data_name in self.settings['do_not_display']:
-                continue
+        for nutrient in self.displayed_nutrients:
             column_i += 1
             if nutrient.data_name in meal_plan.dri_dict:
                 font_color, bg_color = self.get_colors(nutrient.data_name)
@@ -330,35 +583,36 @@ class WorkbookGenerator:
             align='left')
         worksheet.write(row_i, column_i, 'Target & DRI [%]', fmt)
         column_i = 1
-        for nutrient in nutrients_list:
-            if nutrient.data_name in self.settings['do_not_display']:
-                continue
+        for nutrient in self.displayed_nutrients:
             column_i += 1
             if nutrient.data_name in meal_plan.dri_dict:
                 font_color, bg_color = self.get_colors(nutrient.data_name)
                 percent = 100 * meal_plan.dri_ratio[nutrient.data_name]
-                if percent >= 300:
-                    bg_color = self.settings['dri_colors']['excess_3']
-                elif percent >= 200:
-                    bg_color = self.settings['dri_colors']['excess_2']
-                elif percent >= 100:
-                    bg_color = self.settings['dri_colors']['excess_1']
-                elif percent >= 80:
-                    bg_color = self.settings['dri_colors']['deficit_1']
-                elif percent >= 60:
-                    bg_color = self.settings['dri_colors']['deficit_2']
-                else:
-                    bg_color = self.settings['dri_colors']['deficit_3']
                 fmt = self.get_format(
                     font_color=font_color,
-                    bg_color=bg_color,
+                    bg_color=self.get_dri_color(percent),
                     bold=False,
                     align='right')
                 worksheet.write(row_i, column_i, percent, fmt)
         return row_i, column_i
 
+    def get_dri_color(self, percent):
+        if percent >= 300:
+            return self.settings['dri_colors']['excess_3']
+        elif percent >= 200:
+            return self.settings['dri_colors']['excess_2']
+        elif percent >= 100:
+            return self.settings['dri_colors']['excess_1']
+        elif percent >= 80:
+            return self.settings['dri_colors']['deficit_1']
+        elif percent >= 60:
+            return self.settings['dri_colors']['deficit_2']
+        else:
+            return self.settings['dri_colors']['deficit_3']
+
     def write_columns_separators(self, worksheet, bottom_row):
-        border_format = self.workbook.add_format({'left': 1})
+        # separators are conditional formats, not cells, so they are written once all rows are written
+        border_format = self.intern_format({'left': 1})
         for column in self.settings['columns_separators']:
             for cell_type in ['blanks', 'no_blanks']:
                 worksheet.conditional_format(1, column, bottom_row, column,
@@ -0,0 +1,32 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""Fixtures shared by the tests."""
+
+import importlib.resources as rsc
+import shutil
+from pathlib import Path
+import pytest
+import nutrimetrics.config as config
+
+
+@pytest.fixture
+def home(tmp_path, monkeypatch):
+    """Point the configuration to a temporary home directory holding the packaged foods, DRI and samples."""
+    resources = rsc.files('nutrimetrics.resources')
+    for name in ['foods', 'dri', 'samples']:
+        shutil.copytree(resources.joinpath(name), Path(tmp_path, name))
+    monkeypatch.setattr(config, 'config_dir', tmp_path)
+    monkeypatch.setattr(config, 'foods_dir', Path(tmp_path, 'foods'))
+    monkeypatch.setattr(config, 'dri_dir', Path(tmp_path, 'dri'))
+    monkeypatch.setattr(config, 'samples_dir', Path(tmp_path, 'samples'))
+    monkeypatch.setattr(config, 'catalog_file', Path(tmp_path, 'catalog.bin'))
+    monkeypatch.setattr(config, 'database_file', Path(tmp_path, 'foods.db'))  # never created
+    monkeypatch.setattr(config, 'cache_dir', Path(tmp_path, 'cache'))
+    return tmp_path
+
+
+@pytest.fixture
+def settings():
+    """Workbook settings of the packaged configuration."""
+    return config.read_json(rsc.files('nutrimetrics.resources').joinpath('config.json'))['workbook_settings']
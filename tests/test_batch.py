@@ -0,0 +1,58 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""Tests of the batch analysis of meal plans and multi-day programs."""
+
+import csv
+import json
+import shutil
+from pathlib import Path
+import pytest
+import nutrimetrics.config as config
+from nutrimetrics.batch import analyze_batch, find_meal_plans, get_plan_ids, report_file_name
+
+
+@pytest.mark.parametrize('report_format', ['xlsx', 'csv'])
+def test_batch_analyzes_meal_plans_and_programs(home, settings, report_format):
+    plans_dir = Path(home, 'plans')
+    plans_dir.mkdir()
+    for name in ['eric_berg.json', 'program.json']:
+        shutil.copy(Path(config.samples_dir, name), plans_dir)
+    out_dir = Path(home, 'reports')
+    out_dir.mkdir()
+    summary, report = analyze_batch(find_meal_plans(str(plans_dir)), settings, out_dir, jobs=2,
+                                    report_format=report_format)
+    assert summary['failed'] == 0, [entry['error'] for entry in report]
+    assert json.loads(Path(out_dir, report_file_name).read_text())['summary']['succeeded'] == 2
+    n_days = len(config.read_json(Path(plans_dir, 'program.json'))['days'])
+    if report_format == 'xlsx':
+        assert Path(out_dir, 'eric_berg.xlsx').exists() and Path(out_dir, 'program.xlsx').exists()
+    else:
+        with open(Path(out_dir, 'program_days.csv')) as file:
+            assert [row['plan_id'] for row in csv.DictReader(file)] == ['program'] * n_days
+        with open(Path(out_dir, 'total.csv')) as file:
+            assert [row['plan_id'] for row in csv.DictReader(file)] == ['eric_berg']
+
+
+def test_meal_plans_of_the_same_name_get_their_own_report(home, settings):
+    plans_dir = Path(home, 'plans')
+    for week, name in [('week1', 'eric_berg.json'), ('week2', 'michael_b_jordan.json')]:
+        Path(plans_dir, week).mkdir(parents=True)
+        shutil.copy(Path(config.samples_dir, name), Path(plans_dir, week, 'day1.json'))
+    out_dir = Path(home, 'reports')
+    out_dir.mkdir()
+    summary, report = analyze_batch(find_meal_plans(f'{plans_dir}/**/*.json'), settings, out_dir, jobs=2,
+                                    report_format='csv')
+    assert summary['failed'] == 0, [entry['error'] for entry in report]
+    assert [entry['plan_id'] for entry in report] == ['week1-day1', 'week2-day1']
+    with open(Path(out_dir, 'total.csv')) as file:
+        rows = list(csv.DictReader(file))
+    assert sorted((row['plan_id'], row['meal_plan']) for row in rows) == [
+        ('week1-day1', 'Eric Berg'), ('week2-day1', 'Michael B. Jordan')]
+
+
+def test_colliding_plan_ids_fail_the_batch(tmp_path):
+    json_files = [Path(tmp_path, 'week1', 'day1.json'), Path(tmp_path, 'week1-day1.json')]
+    assert get_plan_ids(json_files[:1]) == {json_files[0]: 'day1'}
+    with pytest.raises(ValueError, match="'week1-day1'"):
+        get_plan_ids(json_files)
@@ -0,0 +1,94 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""Tests of the FoodData Central import against a local HTTP server."""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import nutrimetrics.config as config
+from nutrimetrics.food_data_central import FoodDataCentral
+from nutrimetrics.response_cache import ResponseCache
+
+
+def make_food_data(fdc_id, protein):
+    return {
+        'fdcId': fdc_id,
+        'description': f'Food {fdc_id}',
+        'foodNutrients': [{'nutrient': {'id': 1003, 'name': 'Protein', 'unitName': 'g'}, 'amount': protein}],
+    }
+
+
+class FoodDataCentralHandler(BaseHTTPRequestHandler):
+    """Serves foods of protein 10 g, with an ETag per food, and records the requests."""
+    requests = []  # (method, path, If-None-Match header)
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, data, etag=None):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        if etag:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        fdc_ids = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['fdcIds']
+        self.requests.append(('POST', '/foods', None))
+        self.send_json([make_food_data(fdc_id, 10) for fdc_id in fdc_ids])
+
+    def do_GET(self):
+        fdc_id = int(self.path.split('?')[0].split('/')[-1])
+        etag = f'"food-{fdc_id}"'
+        self.requests.append(('GET', f'/food/{fdc_id}', self.headers.get('If-None-Match')))
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+        else:
+            self.send_json(make_food_data(fdc_id, 10), etag)
+
+
+@pytest.fixture
+def server():
+    FoodDataCentralHandler.requests = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), FoodDataCentralHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}', FoodDataCentralHandler.requests
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def import_foods(api_url, cache, fdc_ids):
+    fdc = FoodDataCentral(api_url, 'key', False, {'protein': [1003]}, True, cache=cache, max_retries=0)
+    fdc.import_food_list({'foods': [{'name': f'Food {fdc_id}', 'fdc_id': fdc_id} for fdc_id in fdc_ids]})
+
+
+def test_stale_foods_are_revalidated_with_conditional_requests(server, tmp_path, monkeypatch):
+    api_url, requests = server
+    monkeypatch.setattr(config, 'foods_dir', tmp_path)
+    cache = ResponseCache(tmp_path / 'cache', 0, 1 << 20)  # every entry is stale
+    import_foods(api_url, cache, [1, 2])
+    assert requests == [('POST', '/foods', None)]
+    assert cache.get(1)['etag'] is None
+    # entries of /foods responses get the validators of their food
+    import_foods(api_url, cache, [1, 2])
+    assert sorted(requests[1:]) == [('GET', '/food/1', None), ('GET', '/food/2', None)]
+    assert cache.get(1)['etag'] == '"food-1"'
+    # a 304 response reuses the cached food data
+    entry = cache.get(1)
+    entry['payload'] = make_food_data(1, 25)
+    entry['fetched_at'] = time.time() - 10
+    cache.write(1, entry)
+    import_foods(api_url, cache, [1])
+    assert requests[3:] == [('GET', '/food/1', '"food-1"')]
+    assert cache.get(1)['payload'] == make_food_data(1, 25)
+    assert cache.get(1)['fetched_at'] > entry['fetched_at']
+    food_data = json.loads(FoodDataCentral.get_food_file('Food 1', 1).read_text())
+    assert food_data['nutrients']['protein'] == 25
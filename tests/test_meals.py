@@ -0,0 +1,127 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""Tests of the incremental update of meal plans."""
+
+import copy
+import numpy as np
+import pytest
+import nutrimetrics.config as config
+from nutrimetrics.meals import MealPlan, load_dri_tables, load_foods
+
+
+@pytest.fixture
+def foods(home):
+    return load_foods()
+
+
+@pytest.fixture
+def data(home):
+    return config.read_json(config.samples_dir / 'eric_berg.json')
+
+
+def assert_same_analysis(meal_plan, expected):
+    assert meal_plan.name == expected.name
+    assert meal_plan.unit == expected.unit
+    assert [meal.name for meal in meal_plan.meals] == [meal.name for meal in expected.meals]
+    for meal, expected_meal in zip(meal_plan.meals, expected.meals):
+        assert meal.total.amount == pytest.approx(expected_meal.total.amount)
+        np.testing.assert_allclose(meal.total.values, expected_meal.total.values)
+    assert meal_plan.total.amount == pytest.approx(expected.total.amount)
+    np.testing.assert_allclose(meal_plan.total.values, expected.total.values, rtol=1e-9, atol=1e-12)
+    assert vars(meal_plan.distribution) == pytest.approx(vars(expected.distribution))
+    assert vars(meal_plan.target) == pytest.approx(vars(expected.target))
+    assert meal_plan.dri_name == expected.dri_name
+    assert meal_plan.dri_dict == pytest.approx(expected.dri_dict)
+    assert meal_plan.dri_names == expected.dri_names
+    assert meal_plan.dri_indices.tolist() == expected.dri_indices.tolist()
+    assert meal_plan.dri_ratio == pytest.approx(expected.dri_ratio)
+
+
+def edit_amount(data):
+    data['meals'][1]['foods'][0]['amount'] += 50
+
+
+def add_meal(data):
+    data['meals'].append(dict(copy.deepcopy(data['meals'][0]), name='Snack'))
+
+
+def remove_meal(data):
+    del data['meals'][2]
+
+
+def reorder_meals(data):
+    data['meals'].reverse()
+
+
+def duplicate_meal(data):
+    data['meals'].insert(0, copy.deepcopy(data['meals'][3]))
+
+
+def edit_most_meals(data):
+    for meal in data['meals'][:3]:
+        meal['foods'][0]['amount'] *= 2
+
+
+def change_unit(data):
+    data['unit'] = 'mg'
+
+
+def change_target(data):
+    data['target']['body_mass'] -= 2000
+
+
+def change_dri(data):
+    data['dietary_reference_intakes'] = 'rda-female'
+
+
+# edit, number of recomputed meals
+edits = [(edit_amount, 1), (add_meal, 1), (remove_meal, 0), (reorder_meals, 0), (duplicate_meal, 1),
+         (edit_most_meals, 3), (change_unit, 4), (change_target, 0), (change_dri, 0)]
+
+
+@pytest.mark.parametrize('edit, n_recomputed', edits, ids=[edit.__name__ for edit, _ in edits])
+def test_update_matches_new_meal_plan(foods, data, edit, n_recomputed):
+    dri_tables = load_dri_tables()
+    meal_plan = MealPlan(data, foods, dri_tables)
+    edit(data)
+    assert meal_plan.update(data) == n_recomputed
+    assert_same_analysis(meal_plan, MealPlan(data, foods, dri_tables))
+
+
+def test_successive_updates_match_new_meal_plan(foods, data):
+    """Totals adjusted by the added and removed meals of each update do not drift from a new meal plan."""
+    dri_tables = load_dri_tables()
+    meal_plan = MealPlan(data, foods, dri_tables)
+    for edit, _ in edits * 3:
+        edit(data)
+        meal_plan.update(data)
+        assert_same_analysis(meal_plan, MealPlan(data, foods, dri_tables))
+
+
+def invalid_meal(data):
+    del data['meals'][1]['foods'][0]['amount']
+
+
+def invalid_target(data):
+    data['meals'][1]['foods'][0]['amount'] += 50  # valid meal edit, analyzed before the target
+    del data['target']['body_mass']
+
+
+@pytest.mark.parametrize('edit', [invalid_meal, invalid_target])
+def test_failed_update_leaves_meal_plan_unchanged(foods, data, edit):
+    meal_plan = MealPlan(data, foods, load_dri_tables())
+    state = dict(vars(meal_plan))
+    total_values = meal_plan.total.values.copy()
+    edit(data)
+    with pytest.raises(KeyError):
+        meal_plan.update(data)
+    assert vars(meal_plan).keys() == state.keys()
+    for key, value in state.items():
+        assert vars(meal_plan)[key] is value, key
+    np.testing.assert_array_equal(meal_plan.total.values, total_values)
+    # the meal plan is still updated from its previous state
+    data = config.read_json(config.samples_dir / 'eric_berg.json')
+    edit_amount(data)
+    assert meal_plan.update(data) == 1
+    assert_same_analysis(meal_plan, MealPlan(data, foods, load_dri_tables()))
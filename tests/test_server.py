@@ -0,0 +1,38 @@
+# SPDX-FileCopyrightText: 2023-present Thomas Civeit <thomas@civeit.com>
+#
+# SPDX-License-Identifier: MIT
+"""Tests of the parsing of requests by the analysis server."""
+
+import asyncio
+import json
+import pytest
+from nutrimetrics.server import AnalysisServer
+
+
+async def send_request(request):
+    """Send raw request to a server without worker pool, return status code and JSON body of its response."""
+    server = await asyncio.start_server(AnalysisServer(dict()).handle_connection, '127.0.0.1', 0)
+    async with server:
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        writer.write(request)
+        writer.write_eof()
+        response = await asyncio.wait_for(reader.read(), timeout=5)
+        writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body)
+
+
+@pytest.mark.parametrize('request_bytes, status', [
+    (b'GET /health HTTP/1.1\r\nConnection: close\r\n\r\n', 200),
+    (b'GET /health HTTP/1.1\r\nContent-Length: abc\r\n\r\n', 400),
+    (b'GET /health HTTP/1.1\r\nContent-Length: -1\r\n\r\n', 400),
+    (b'GET /health\r\n\r\n', 400),
+    (b'GET /health HTTP/1.1\r\nX-Long: ' + b'a' * 100000 + b'\r\n\r\n', 431),
+    (b'GET /health HTTP/1.1\r\n' + b'X-Header: a\r\n' * 101 + b'\r\n', 431),
+    (b'POST /analyze HTTP/1.1\r\nContent-Length: 100\r\n\r\n{"name"', 400),
+], ids=['valid', 'invalid length', 'negative length', 'malformed request line', 'long header', 'many headers',
+        'truncated body'])
+def test_malformed_requests_are_answered(request_bytes, status):
+    response_status, data = asyncio.run(send_request(request_bytes))
+    assert response_status == status
+    assert ('error' in data) == (status != 200)